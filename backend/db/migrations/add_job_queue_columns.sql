@@ -0,0 +1,10 @@
+-- Columns used by the job worker (src/worker.py) to claim, retry and
+-- recover jobs with SELECT ... FOR UPDATE SKIP LOCKED
+ALTER TABLE job ADD COLUMN IF NOT EXISTS payload JSONB;
+ALTER TABLE job ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE job ADD COLUMN IF NOT EXISTS max_attempts INTEGER NOT NULL DEFAULT 3;
+ALTER TABLE job ADD COLUMN IF NOT EXISTS run_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now();
+ALTER TABLE job ADD COLUMN IF NOT EXISTS locked_by TEXT;
+ALTER TABLE job ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP WITH TIME ZONE;
+
+CREATE INDEX IF NOT EXISTS ix_job_status_run_at ON job (status, run_at);
@@ -0,0 +1,8 @@
+-- Full-text half of hybrid retrieval over material_documents (src/application/retrieval.py).
+-- Generated, so every insert and update keeps it in sync with content.
+ALTER TABLE material_documents
+    ADD COLUMN IF NOT EXISTS content_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED;
+
+CREATE INDEX IF NOT EXISTS ix_material_documents_content_tsv
+    ON material_documents USING gin (content_tsv);
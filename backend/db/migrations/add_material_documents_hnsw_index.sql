@@ -0,0 +1,12 @@
+-- Native pgvector retrieval over material_documents (src/application/retrieval.py).
+-- HNSW needs a fixed dimension; 1536 is text-embedding-ada-002.
+ALTER TABLE material_documents ALTER COLUMN embedding TYPE vector(1536);
+
+-- cosine distance (<=>), same metric as the old match_documents rpc
+CREATE INDEX IF NOT EXISTS ix_material_documents_embedding_hnsw
+    ON material_documents USING hnsw (embedding vector_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
+
+-- course filters: a course's documents, and a user's courses
+CREATE INDEX IF NOT EXISTS ix_material_documents_course_id ON material_documents (course_id);
+CREATE INDEX IF NOT EXISTS ix_course_membership_user_id ON course_membership (user_id, course_id);
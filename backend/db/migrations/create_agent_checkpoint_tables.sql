@@ -0,0 +1,45 @@
+-- LangGraph conversation state for the agent (src/application/checkpoint.py).
+-- Channel values are stored once per version in agent_checkpoint_blob, so a
+-- new checkpoint only writes the channels that changed in that step.
+CREATE TABLE IF NOT EXISTS agent_checkpoint (
+    id BIGSERIAL PRIMARY KEY,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT NOT NULL,
+    checkpoint BYTEA NOT NULL,
+    channel_versions JSONB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    meta_data BYTEA NOT NULL,
+
+    CONSTRAINT unique_agent_checkpoint_thread_ns_id UNIQUE (thread_id, checkpoint_ns, checkpoint_id)
+);
+
+CREATE TABLE IF NOT EXISTS agent_checkpoint_blob (
+    id BIGSERIAL PRIMARY KEY,
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BYTEA,
+
+    CONSTRAINT unique_agent_checkpoint_blob_thread_ns_channel_version UNIQUE (thread_id, checkpoint_ns, channel, version)
+);
+
+CREATE TABLE IF NOT EXISTS agent_checkpoint_write (
+    id BIGSERIAL PRIMARY KEY,
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BYTEA NOT NULL,
+    task_path TEXT NOT NULL DEFAULT '',
+
+    CONSTRAINT unique_agent_checkpoint_write_thread_ns_id_task_idx UNIQUE (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
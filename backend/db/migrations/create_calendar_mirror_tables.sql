@@ -0,0 +1,36 @@
+-- Local mirror of users' Google Calendars, kept up to date with syncToken
+-- incremental syncs and push notification channels (src/application/calendar_mirror.py)
+CREATE TABLE IF NOT EXISTS calendar_event (
+    id BIGSERIAL PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES profiles(id) ON UPDATE CASCADE ON DELETE CASCADE,
+    calendar_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    summary TEXT,
+    start_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    end_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    all_day BOOLEAN NOT NULL DEFAULT false,
+    raw JSONB NOT NULL,
+    synced_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+
+    CONSTRAINT unique_calendar_event_user_calendar_event UNIQUE (user_id, calendar_id, event_id)
+);
+
+-- date range queries: WHERE user_id = ? AND calendar_id = ? AND start_at < ? AND end_at > ?
+CREATE INDEX IF NOT EXISTS ix_calendar_event_user_calendar_start
+    ON calendar_event (user_id, calendar_id, start_at);
+
+CREATE TABLE IF NOT EXISTS calendar_sync_state (
+    id BIGSERIAL PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES profiles(id) ON UPDATE CASCADE ON DELETE CASCADE,
+    calendar_id TEXT NOT NULL,
+    sync_token TEXT,
+    synced_at TIMESTAMP WITH TIME ZONE,
+    channel_id TEXT UNIQUE,
+    channel_resource_id TEXT,
+    channel_token TEXT,
+    channel_expires_at TIMESTAMP WITH TIME ZONE,
+
+    CONSTRAINT unique_calendar_sync_state_user_calendar UNIQUE (user_id, calendar_id)
+);
+
+ALTER TYPE job_type ADD VALUE IF NOT EXISTS 'CALENDAR_SYNC';
@@ -0,0 +1,10 @@
+-- Shared backend of the canvas response cache (hai_canvas_cache_backend=postgres).
+-- UNLOGGED: it is only a cache, so skip the WAL and accept losing it on crash.
+CREATE UNLOGGED TABLE IF NOT EXISTS canvas_response_cache (
+    key TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    value JSONB NOT NULL,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_canvas_response_cache_user_id ON canvas_response_cache (user_id);
@@ -0,0 +1,16 @@
+CREATE TABLE IF NOT EXISTS course_sync_state (
+    id BIGSERIAL PRIMARY KEY,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    user_id UUID NOT NULL REFERENCES profiles(id) ON UPDATE CASCADE ON DELETE CASCADE,
+    course_id BIGINT NOT NULL REFERENCES course(id) ON UPDATE CASCADE ON DELETE CASCADE,
+    files_etag TEXT,
+    modules_etag TEXT,
+    watermark TIMESTAMP WITH TIME ZONE,
+    synced_at TIMESTAMP WITH TIME ZONE,
+
+    CONSTRAINT unique_course_sync_state_user_course UNIQUE (user_id, course_id)
+);
+
+-- Job results (e.g. updated/skipped counts of a course sync)
+ALTER TABLE job ADD COLUMN IF NOT EXISTS result JSONB;
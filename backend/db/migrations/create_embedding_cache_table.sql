@@ -0,0 +1,9 @@
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    id BIGSERIAL PRIMARY KEY,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    content_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    embedding vector NOT NULL,
+
+    CONSTRAINT unique_embedding_cache_hash_model UNIQUE (content_hash, model)
+);
@@ -0,0 +1,20 @@
+-- Lets every API worker drop its cached copy of a token when an integration
+-- row changes (see src/application/token_store.py). Payload is "<user_id>:<type>".
+CREATE OR REPLACE FUNCTION notify_integration_changed() RETURNS trigger AS $$
+DECLARE
+    row integration%ROWTYPE;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row := OLD;
+    ELSE
+        row := NEW;
+    END IF;
+    PERFORM pg_notify('integration_changed', row.user_id::text || ':' || row.type::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS integration_changed ON integration;
+CREATE TRIGGER integration_changed
+    AFTER INSERT OR UPDATE OR DELETE ON integration
+    FOR EACH ROW EXECUTE FUNCTION notify_integration_changed();
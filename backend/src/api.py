@@ -1,10 +1,29 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from src.application import agent
+from src.application.canvas_cache import get_canvas_cache
+from src.application.pdf import shutdown_pdf_executor
+from src.application.token_store import get_token_store
+from src.deps import close_resources, get_resources
 from src.router import auth, chat, chatroom, courses, health, subtask, task, jobs
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.resources = get_resources()
+    await get_token_store().start()
+    await get_canvas_cache().start()
+    yield
+    await get_canvas_cache().stop()
+    await get_token_store().stop()
+    shutdown_pdf_executor()
+    await close_resources()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(auth.router)
 app.include_router(chat.router)
 app.include_router(task.router)
@@ -1,21 +1,22 @@
+import asyncio
+import inspect
 import json
 from datetime import datetime
-from typing import Any, Dict, List, Literal, Optional
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional
 
 from fastapi import APIRouter, HTTPException
-from langchain.tools.retriever import create_retriever_tool
-from langchain_community.vectorstores import SupabaseVectorStore
+from fastapi.responses import StreamingResponse
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import StructuredTool, create_schema_from_function
-from langchain_core.vectorstores import VectorStoreRetriever
-from langchain_openai import OpenAIEmbeddings
 from langchain_openai.chat_models import ChatOpenAI
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph.graph import CompiledGraph
 from langgraph.prebuilt import create_react_agent
 from pydantic import BaseModel, Field
 
-from src.application import usecase_v2
+from src.application import retrieval, usecase_v2
+from src.application.checkpoint import get_checkpointer
 from src.application.usecase_v2 import (
     create_task,
     get_upcoming_assignments_and_quizzes,
@@ -23,11 +24,9 @@ from src.application.usecase_v2 import (
     sync_to_google_calendar,
 )
 from src.database.models import Chat
-from src.deps import ApplicationContainer, CurrentUser
+from src.deps import ApplicationContainer, Container, CurrentUser, get_resources
 from src.schema import TaskIn
-
-# Agent cache to store initialized agents
-_agent_cache: Dict[str, CompiledGraph] = {}
+from src.settings import settings
 
 
 class CreateEvent(BaseModel):
@@ -42,8 +41,74 @@ class CreateEventToCalendarInput(BaseModel):
     calendar_id: str
 
 
-# Define tools with container injection
-def create_tools(container: ApplicationContainer, user_id: str):
+def agent_config(
+    container: Container, user_id: str, thread_id: Optional[str]
+) -> RunnableConfig:
+    """Per-request config for the shared agent graph.
+
+    The graph and its tools are shared by all users, so the request's
+    container and user travel in ``configurable`` and the thread id is
+    prefixed with the user id to keep conversations apart. The semaphore
+    caps how many tool calls of this request run at the same time.
+    """
+    return {
+        "configurable": {
+            "thread_id": f"{user_id}:{thread_id or 'default'}",
+            "container": container,
+            "user_id": user_id,
+            "tool_semaphore": asyncio.Semaphore(settings.agent_tool_concurrency),
+        }
+    }
+
+
+def get_agent_deps(config: RunnableConfig) -> tuple[Container, str]:
+    configurable = config["configurable"]
+    return configurable["container"], configurable["user_id"]
+
+
+def make_tool(
+    name: str, description: str, func, timeout: float = settings.agent_tool_timeout
+) -> StructuredTool:
+    """Wrap ``func`` as a tool that can run concurrently with its siblings.
+
+    The agent runs all tool calls of a step at once, so each call of a tool
+    that takes ``config`` gets its own container (and DB session, which cannot
+    be shared between coroutines); other tools run without one. Every call
+    waits for a slot of the request's ``tool_semaphore`` and is cut off after
+    ``timeout`` seconds with an error the model can read.
+    """
+    takes_config = "config" in inspect.signature(func).parameters
+
+    async def run(config: RunnableConfig, **kwargs):
+        async with config["configurable"]["tool_semaphore"]:
+            container = Container(get_resources()) if takes_config else None
+            if container is not None:
+                configurable = {**config["configurable"], "container": container}
+                kwargs["config"] = {**config, "configurable": configurable}
+            try:
+                result = await asyncio.wait_for(func(**kwargs), timeout)
+                if container is not None:
+                    await container.db_session.commit()
+                return result
+            except asyncio.TimeoutError:
+                return {"error": f"{name} did not finish within {timeout} seconds"}
+            finally:
+                if container is not None:
+                    await container.aclose()
+
+    # ``config`` is injected by langchain at call time, keep it out of the schema
+    return StructuredTool(
+        name=name,
+        description=description,
+        coroutine=run,
+        args_schema=create_schema_from_function(
+            name, func, filter_args=["config", "run_manager", "callbacks"]
+        ),
+    )
+
+
+# Define tools; request-scoped dependencies come from the run config
+def create_tools():
     async def get_now_datetime():
         """Get the current date and time in YYYY-MM-DD HH:MM:SS format."""
         return {
@@ -72,6 +137,7 @@ def create_tools(container: ApplicationContainer, user_id: str):
         task_description: str,
         task_due_date: str,
         task_type: Literal["ASSIGNMENT", "STUDY", "SOCIAL", "CHORE"],
+        config: RunnableConfig,
     ):
         """Add a new task to the user's task list.
 
@@ -84,6 +150,7 @@ def create_tools(container: ApplicationContainer, user_id: str):
         Returns:
             dict: The created task.
         """
+        container, user_id = get_agent_deps(config)
         due_dt = datetime.strptime(task_due_date, "%Y-%m-%d")
         return await create_task(
             session=container.db_session,
@@ -96,7 +163,7 @@ def create_tools(container: ApplicationContainer, user_id: str):
             ),
         )
 
-    async def get_events_on_date(date: str):
+    async def get_events_on_date(date: str, config: RunnableConfig):
         """Get events on a specific date.
 
         Args:
@@ -105,13 +172,41 @@ def create_tools(container: ApplicationContainer, user_id: str):
         Returns:
             list[dict]: List of events on the specified date.
         """
+        container, user_id = get_agent_deps(config)
         date_dt = datetime.strptime(date, "%Y-%m-%d")
         return await usecase_v2.get_events_on_date(
             session=container.db_session, user_id=user_id, date=date_dt
         )
 
+    async def find_free_slots(
+        duration_minutes: int = 60,
+        days: int = 7,
+        due_date: str = None,
+        config: RunnableConfig = None,
+    ):
+        """Find free time slots for studying in the user's calendar and tasks.
+
+        Args:
+            duration_minutes (int, optional): Length of each slot in minutes. Defaults to 60.
+            days (int, optional): Number of days to look ahead. Defaults to 7.
+            due_date (str, optional): Only suggest slots before this date, in YYYY-MM-DD format. Defaults to None.
+
+        Returns:
+            list[dict]: Free slots, best first, with start, end and whether they match the user's study preference.
+        """
+        container, user_id = get_agent_deps(config)
+        due_at = datetime.strptime(due_date, "%Y-%m-%d") if due_date else None
+        return await usecase_v2.find_free_slots(
+            session=container.db_session,
+            user_id=user_id,
+            duration_minutes=duration_minutes,
+            days=days,
+            due_at=due_at,
+        )
+
     async def add_event_to_calendar(
         event_input: CreateEventToCalendarInput,
+        config: RunnableConfig,
     ):
         """Add an event to the user's Google Calendar.
 
@@ -121,20 +216,32 @@ def create_tools(container: ApplicationContainer, user_id: str):
         Returns:
             dict: Status of calendar sync operation including number of events synced.
         """
+        container, user_id = get_agent_deps(config)
         result = await sync_to_google_calendar(
             session=container.db_session,
             user_id=user_id,
             calendar_id=event_input.calendar_id,
-            events=event_input.events.model_dump_json(),
+            events=json.dumps(
+                [
+                    {
+                        "title": event.event_name,
+                        "description": event.event_description,
+                        "start_time": event.event_start_time,
+                        "end_time": event.event_end_time,
+                    }
+                    for event in event_input.events
+                ]
+            ),
         )
         return result.model_dump()
 
-    async def get_user_courses():
+    async def get_user_courses(config: RunnableConfig):
         """List all Canvas courses the user is enrolled in.
 
         Returns:
             list[CanvasCourse]: List of courses with details like name, code, and enrollment status.
         """
+        container, user_id = get_agent_deps(config)
         result = await list_canvas_courses(
             session=container.db_session, user_id=user_id
         )
@@ -145,6 +252,7 @@ def create_tools(container: ApplicationContainer, user_id: str):
         start_date: str = None,
         end_date: str = None,
         course_id: str = None,
+        config: RunnableConfig = None,
     ):
         """Get upcoming assignments and quizzes for the user.
 
@@ -157,6 +265,7 @@ def create_tools(container: ApplicationContainer, user_id: str):
         Returns:
             dict: Dictionary containing lists of upcoming assignments and quizzes.
         """
+        container, user_id = get_agent_deps(config)
         return await get_upcoming_assignments_and_quizzes(
             session=container.db_session,
             user_id=user_id,
@@ -166,97 +275,102 @@ def create_tools(container: ApplicationContainer, user_id: str):
             course_id=course_id,
         )
 
+    async def search_material_documents(
+        query: str, course_id: Optional[int] = None, config: RunnableConfig = None
+    ):
+        """Search the user's course materials (lecture slides, notes, handouts).
+
+        Args:
+            query (str): What to look for. Exact names such as "Problem Set 4" or a formula name match literally too.
+            course_id (int, optional): Only search this course. Defaults to all of the user's courses.
+
+        Returns:
+            str: The most relevant passages, each prefixed with the file they came from.
+        """
+        container, user_id = get_agent_deps(config)
+        documents = await retrieval.retrieve(
+            container.db_session,
+            container.async_openai_client,
+            query,
+            user_id,
+            course_id=course_id,
+        )
+        return retrieval.format_documents(documents)
+
     return [
-        StructuredTool(
-            name="get_now_datetime",
-            description="Get the current date and time in YYYY-MM-DD HH:MM:SS format",
-            func=get_now_datetime,
-            coroutine=get_now_datetime,
-            args_schema=create_schema_from_function(
-                "get_now_datetime", get_now_datetime
-            ),
+        make_tool(
+            "get_now_datetime",
+            "Get the current date and time in YYYY-MM-DD HH:MM:SS format",
+            get_now_datetime,
         ),
-        StructuredTool(
-            name="ask_if_adding_task_is_ok",
-            description="Ask the user if they want to add a new task to their task list",
-            func=ask_if_adding_task_is_ok,
-            coroutine=ask_if_adding_task_is_ok,
-            args_schema=create_schema_from_function(
-                "ask_if_adding_task_is_ok", ask_if_adding_task_is_ok
-            ),
+        make_tool(
+            "ask_if_adding_task_is_ok",
+            "Ask the user if they want to add a new task to their task list",
+            ask_if_adding_task_is_ok,
         ),
-        StructuredTool(
-            name="add_task",
-            description="Add a new task to the user's task list",
-            func=add_task,
-            coroutine=add_task,
-            args_schema=create_schema_from_function("add_task", add_task),
+        make_tool("add_task", "Add a new task to the user's task list", add_task),
+        make_tool(
+            "add_event_to_calendar",
+            "Add an event to the user's Google Calendar",
+            add_event_to_calendar,
         ),
-        StructuredTool(
-            name="add_event_to_calendar",
-            description="Add an event to the user's Google Calendar",
-            func=add_event_to_calendar,
-            coroutine=add_event_to_calendar,
-            args_schema=create_schema_from_function(
-                "add_event_to_calendar", add_event_to_calendar
-            ),
+        make_tool(
+            "list_courses",
+            "List all Canvas courses the user is enrolled in",
+            get_user_courses,
         ),
-        StructuredTool(
-            name="list_courses",
-            description="List all Canvas courses the user is enrolled in",
-            func=get_user_courses,
-            coroutine=get_user_courses,
-            args_schema=create_schema_from_function("list_courses", get_user_courses),
+        make_tool(
+            "get_user_upcoming_work",
+            "Get upcoming assignments and quizzes with optional date range and course filters",
+            get_user_upcoming_work,
         ),
-        StructuredTool(
-            name="get_user_upcoming_work",
-            description="Get upcoming assignments and quizzes with optional date range and course filters",
-            func=get_user_upcoming_work,
-            coroutine=get_user_upcoming_work,
-            args_schema=create_schema_from_function(
-                "get_user_upcoming_work", get_user_upcoming_work
-            ),
+        make_tool(
+            "get_events_on_date", "Get events on a specific date", get_events_on_date
         ),
-        StructuredTool(
-            name="get_events_on_date",
-            description="Get events on a specific date",
-            func=get_events_on_date,
-            coroutine=get_events_on_date,
-            args_schema=create_schema_from_function(
-                "get_events_on_date", get_events_on_date
-            ),
+        make_tool(
+            "find_free_slots",
+            "Find free time slots for studying, ranked by the user's study preference",
+            find_free_slots,
         ),
-        # Material documents retriever
-        create_retriever_tool(
-            get_supabase_vector_store_retriever(container),
-            name="material_documents_retriever",
-            description="Retrieve material documents from the database.",
+        make_tool(
+            "material_documents_retriever",
+            "Retrieve material documents from the database.",
+            search_material_documents,
         ),
     ]
 
 
-def get_or_create_agent(container: ApplicationContainer, user_id: str) -> CompiledGraph:
-    """Get an existing agent from cache or create a new one."""
-    if user_id not in _agent_cache:
-        model = ChatOpenAI(
-            model="gpt-4o-mini", api_key=container.settings.openai_api_key
-        )
-        tools = create_tools(container, user_id)
-        memory = MemorySaver()
-        _agent_cache[user_id] = create_react_agent(model, tools, checkpointer=memory)
-    return _agent_cache[user_id]
-
-
-def invalidate_agent_cache(user_id: str) -> None:
-    """Remove a specific agent from the cache."""
-    if user_id in _agent_cache:
-        del _agent_cache[user_id]
+@lru_cache(maxsize=4)
+def get_agent(model_name: str = settings.agent_model) -> CompiledGraph:
+    """The agent graph, compiled once and shared by every user and request."""
+    model = ChatOpenAI(model=model_name, api_key=settings.openai_api_key)
+    return create_react_agent(model, create_tools(), checkpointer=get_checkpointer())
 
 
 # FastAPI Router and Models
 router = APIRouter(prefix="/agent", tags=["agent"])
 
 
+AGENT_SYSTEM_PROMPT = """
+                              You are a helpful assistant that can help the user with their tasks.
+
+                              You can use the following tools to help the user:
+                              - add_event_to_calendar: Add an event to the user's Google Calendar.
+                              - list_courses: List all Canvas courses.
+                              - get_user_upcoming_work: Get upcoming assignments and quizzes.
+                              - material_documents_retriever: Retrieve material documents from the database.
+                              - get_now_datetime: Get the current date and time in YYYY-MM-DD HH:MM:SS format.
+                              - ask_if_adding_task_is_ok: Ask the user if they want to add a new task to their task list.
+                              - add_task: Add a new task to the user's task list.
+                              - find_free_slots: Find free time slots for studying in the user's calendar.
+
+                              By using the tools, you can get information about the user's existing schedules, assignments, and quizzes. 
+                              With this information, you can help the user find available time slots for studying.
+
+                              If you cannot find any available time slots, you can suggest the user to create a new task.
+                              """
+
+
 class AgentRequest(BaseModel):
     message: str
     thread_id: Optional[str] = None
@@ -290,31 +404,13 @@ async def chat_with_agent(
     db_session.add(human_message)
 
     try:
-        agent = get_or_create_agent(container, str(current_user.id))
-        config = {"configurable": {"thread_id": request.thread_id or "default"}}
+        agent = get_agent()
+        config = agent_config(container, str(current_user.id), request.thread_id)
 
         response = await agent.ainvoke(
             {
                 "messages": [
-                    SystemMessage(
-                        content="""
-                              You are a helpful assistant that can help the user with their tasks.
-
-                              You can use the following tools to help the user:
-                              - add_event_to_calendar: Add an event to the user's Google Calendar.
-                              - list_courses: List all Canvas courses.
-                              - get_user_upcoming_work: Get upcoming assignments and quizzes.
-                              - material_documents_retriever: Retrieve material documents from the database.
-                              - get_now_datetime: Get the current date and time in YYYY-MM-DD HH:MM:SS format.
-                              - ask_if_adding_task_is_ok: Ask the user if they want to add a new task to their task list.
-                              - add_task: Add a new task to the user's task list.
-
-                              By using the tools, you can get information about the user's existing schedules, assignments, and quizzes. 
-                              With this information, you can help the user find available time slots for studying.
-
-                              If you cannot find any available time slots, you can suggest the user to create a new task.
-                              """
-                    ),
+                    SystemMessage(content=AGENT_SYSTEM_PROMPT),
                     HumanMessage(content=request.message),
                 ]
             },
@@ -361,8 +457,6 @@ async def chat_with_agent(
 
         return response
     except Exception as e:
-        invalidate_agent_cache(str(current_user.id))
-
         raise HTTPException(
             status_code=500, detail={"message": f"Agent error: {str(e)}"}
         )
@@ -370,17 +464,102 @@ async def chat_with_agent(
         await db_session.commit()
 
 
-def get_supabase_vector_store_retriever(
-    container: ApplicationContainer,
-) -> VectorStoreRetriever:
-    supabase = container.supabase
-    vector_store = SupabaseVectorStore(
-        client=supabase,
-        table_name="material_documents",
-        query_name="match_documents",
-        embedding=OpenAIEmbeddings(
-            model="text-embedding-ada-002",
-            api_key=container.settings.openai_api_key,
-        ),
+def format_sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def tool_invocation_from_output(name: str, output: Any) -> ToolInvocation:
+    content = output.content if isinstance(output, ToolMessage) else output
+    if name == "material_documents_retriever" or not isinstance(content, str):
+        return ToolInvocation(name=name, result=content, state="result")
+    try:
+        return ToolInvocation(name=name, result=json.loads(content), state="result")
+    except json.JSONDecodeError:
+        return ToolInvocation(name=name, result=content, state="failure")
+
+
+async def stream_agent_response(
+    system_prompt: str,
+    message: str,
+    user_id: Any,
+    thread_id: Optional[str],
+    chatroom_id: Optional[int] = None,
+) -> AsyncIterator[str]:
+    """Run the agent and yield its progress as Server-Sent Events.
+
+    Emits ``token`` events with text deltas of the answer, ``tool_start`` and
+    ``tool_end`` around each tool call, then ``done`` with the full answer
+    (or ``error``). Both chat messages are saved once the run is over.
+
+    The stream outlives the request's dependencies, so it opens its own
+    container and DB session instead of using the request's.
+    """
+    container = Container(get_resources())
+    db_session = container.db_session
+    db_session.add(
+        Chat(author="user", content=message, user_id=user_id, chatroom_id=chatroom_id)
+    )
+
+    try:
+        agent = get_agent()
+        config = agent_config(container, str(user_id), thread_id)
+        inputs = {
+            "messages": [
+                SystemMessage(content=system_prompt),
+                HumanMessage(content=message),
+            ]
+        }
+
+        async for event in agent.astream_events(inputs, config=config, version="v2"):
+            kind = event["event"]
+            if kind == "on_chat_model_stream":
+                delta = event["data"]["chunk"].content
+                if delta:
+                    yield format_sse("token", {"delta": delta})
+            elif kind == "on_tool_start":
+                yield format_sse(
+                    "tool_start",
+                    {"name": event["name"], "input": event["data"].get("input")},
+                )
+            elif kind == "on_tool_end":
+                invocation = tool_invocation_from_output(
+                    event["name"], event["data"].get("output")
+                )
+                yield format_sse("tool_end", invocation.model_dump())
+
+        state = await agent.aget_state(config)
+        last_message = state.values["messages"][-1]
+        output = "No response"
+        if isinstance(last_message, AIMessage):
+            output = last_message.content
+        db_session.add(
+            Chat(author="agent", content=output, user_id=user_id, chatroom_id=chatroom_id)
+        )
+        yield format_sse(
+            "done",
+            {"author": "agent", "message": output, "sent_at": datetime.now().isoformat()},
+        )
+    except Exception as e:
+        yield format_sse("error", {"message": f"Agent error: {str(e)}"})
+    finally:
+        await db_session.commit()
+        await container.aclose()
+
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/stream")
+async def stream_chat_with_agent(request: AgentRequest, current_user: CurrentUser):
+    """Chat with the AI agent, streaming tokens and tool calls as SSE."""
+    return sse_response(
+        stream_agent_response(
+            AGENT_SYSTEM_PROMPT, request.message, current_user.id, request.thread_id
+        )
     )
-    return vector_store.as_retriever()
@@ -0,0 +1,340 @@
+# local postgres mirror of users' google calendars, kept fresh with syncToken
+import secrets
+import uuid
+from datetime import datetime, time, timedelta, timezone, tzinfo
+from typing import Any, Optional
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.application.job_queue import enqueue_job
+from src.application.token_store import get_token_store
+from src.database.models import (
+    CalendarEvent,
+    CalendarSyncState,
+    Job,
+    JobStatus,
+    JobType,
+)
+from src.deps import GoogleApiError, GoogleCalendarApi, get_google_calendar_api
+from src.settings import settings
+
+# rows per INSERT, well below postgres' 32767 bind parameter limit
+UPSERT_CHUNK_SIZE = 1000
+# all-day events are stored at midnight utc; the local day they cover can start
+# up to this much earlier or later
+ALL_DAY_SLACK = timedelta(days=1)
+
+
+def parse_event_time(value: dict[str, str]) -> tuple[datetime, bool]:
+    """Start or end of an event, and whether the event is all-day."""
+    if "dateTime" in value:
+        return datetime.fromisoformat(value["dateTime"]), False
+    # all-day events only carry a date; keep them at midnight utc
+    date = datetime.fromisoformat(value["date"])
+    return date.replace(tzinfo=timezone.utc), True
+
+
+def local_midnight(value: datetime, tz: tzinfo) -> datetime:
+    """Midnight in ``tz`` of the date an all-day event boundary was stored with."""
+    return datetime.combine(value.astimezone(timezone.utc).date(), time(), tzinfo=tz)
+
+
+def event_row(user_id: uuid.UUID, calendar_id: str, event: dict[str, Any]) -> dict:
+    start_at, all_day = parse_event_time(event["start"])
+    end_at, _ = parse_event_time(event["end"])
+    return {
+        "user_id": user_id,
+        "calendar_id": calendar_id,
+        "event_id": event["id"],
+        "summary": event.get("summary"),
+        "start_at": start_at,
+        "end_at": end_at,
+        "all_day": all_day,
+        "raw": event,
+    }
+
+
+async def fetch_changes(
+    calendar_client: GoogleCalendarApi, calendar_id: str, sync_token: Optional[str]
+) -> tuple[list[dict[str, Any]], Optional[str], bool]:
+    """Events changed since ``sync_token``, or all events if there is none.
+
+    Returns the events (cancelled ones included), the next sync token and
+    whether this was a full sync. Google answers 410 Gone once a sync token
+    has expired, in which case we fall back to a full sync.
+    """
+    # singleEvents must match between the full sync and the incremental ones
+    params: dict[str, Any] = {"singleEvents": "true", "maxResults": 2500}
+    if sync_token:
+        params["syncToken"] = sync_token
+
+    events: list[dict[str, Any]] = []
+    while True:
+        try:
+            page = await calendar_client.list_events(calendar_id, **params)
+        except GoogleApiError as e:
+            if e.status_code != 410 or "syncToken" not in params:
+                raise
+            return await fetch_changes(calendar_client, calendar_id, None)
+        events.extend(page.get("items", []))
+        if "nextPageToken" not in page:
+            return events, page.get("nextSyncToken"), sync_token is None
+        params["pageToken"] = page["nextPageToken"]
+
+
+async def get_sync_state(
+    db_session: AsyncSession, user_id: str, calendar_id: str
+) -> Optional[CalendarSyncState]:
+    result = await db_session.execute(
+        select(CalendarSyncState).where(
+            CalendarSyncState.user_id == uuid.UUID(user_id),
+            CalendarSyncState.calendar_id == calendar_id,
+        )
+    )
+    return result.scalar_one_or_none()
+
+
+def is_fresh(state: Optional[CalendarSyncState]) -> bool:
+    """Whether the mirror can be read without syncing first."""
+    if state is None or state.synced_at is None:
+        return False
+    now = datetime.now(timezone.utc)
+    # google pushes every change while the channel is open
+    if state.channel_expires_at is not None and state.channel_expires_at > now:
+        return True
+    return now - state.synced_at < timedelta(seconds=settings.calendar_mirror_max_age)
+
+
+async def sync_calendar(
+    db_session: AsyncSession,
+    calendar_client: GoogleCalendarApi,
+    user_id: str,
+    calendar_id: str = "primary",
+) -> dict[str, int]:
+    """Apply the calendar's changes since the last sync to the mirror."""
+    user_uuid = uuid.UUID(str(user_id))
+    # one sync per calendar at a time, across api and job workers
+    await db_session.execute(
+        select(func.pg_advisory_xact_lock(func.hashtext(f"{user_id}:{calendar_id}")))
+    )
+    state = await get_sync_state(db_session, str(user_id), calendar_id)
+    if state is None:
+        state = CalendarSyncState(user_id=user_uuid, calendar_id=calendar_id)
+        db_session.add(state)
+
+    events, sync_token, full = await fetch_changes(
+        calendar_client, calendar_id, state.sync_token
+    )
+    mirrored = (CalendarEvent.user_id == user_uuid) & (
+        CalendarEvent.calendar_id == calendar_id
+    )
+    if full:
+        await db_session.execute(delete(CalendarEvent).where(mirrored))
+
+    cancelled = [event["id"] for event in events if event.get("status") == "cancelled"]
+    if cancelled:
+        await db_session.execute(
+            delete(CalendarEvent).where(mirrored, CalendarEvent.event_id.in_(cancelled))
+        )
+
+    rows = [
+        event_row(user_uuid, calendar_id, event)
+        for event in events
+        if event.get("status") != "cancelled"
+    ]
+    for i in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        stmt = insert(CalendarEvent).values(rows[i : i + UPSERT_CHUNK_SIZE])
+        await db_session.execute(
+            stmt.on_conflict_do_update(
+                constraint="unique_calendar_event_user_calendar_event",
+                set_={
+                    "summary": stmt.excluded.summary,
+                    "start_at": stmt.excluded.start_at,
+                    "end_at": stmt.excluded.end_at,
+                    "all_day": stmt.excluded.all_day,
+                    "raw": stmt.excluded.raw,
+                    "synced_at": func.now(),
+                },
+            )
+        )
+
+    state.sync_token = sync_token
+    state.synced_at = datetime.now(timezone.utc)
+    await ensure_channel(calendar_client, state)
+    await db_session.commit()
+    return {"updated": len(rows), "deleted": len(cancelled), "full": int(full)}
+
+
+async def ensure_channel(
+    calendar_client: GoogleCalendarApi, state: CalendarSyncState
+) -> None:
+    """Open (or renew) the push channel of the calendar, if a webhook url is set."""
+    if not settings.gcal_webhook_url:
+        return
+    renew_after = datetime.now(timezone.utc) + timedelta(days=1)
+    if state.channel_expires_at is not None and state.channel_expires_at > renew_after:
+        return
+
+    channel_id = uuid.uuid4().hex
+    channel_token = secrets.token_urlsafe(32)
+    try:
+        channel = await calendar_client.watch_events(
+            state.calendar_id,
+            {
+                "id": channel_id,
+                "type": "web_hook",
+                "address": settings.gcal_webhook_url,
+                "token": channel_token,
+                "params": {"ttl": str(settings.gcal_channel_ttl)},
+            },
+        )
+    except GoogleApiError as e:
+        print(f"Failed to open calendar push channel: {str(e)}")
+        return
+
+    if state.channel_id and state.channel_resource_id:
+        try:
+            await calendar_client.stop_channel(
+                state.channel_id, state.channel_resource_id
+            )
+        except GoogleApiError as e:
+            print(f"Failed to stop calendar push channel: {str(e)}")
+
+    state.channel_id = channel_id
+    state.channel_resource_id = channel["resourceId"]
+    state.channel_token = channel_token
+    # expiration is in milliseconds since the epoch
+    state.channel_expires_at = datetime.fromtimestamp(
+        int(channel["expiration"]) / 1000, tz=timezone.utc
+    )
+
+
+async def refresh_if_stale(
+    db_session: AsyncSession, user_id: str, calendar_id: str = "primary"
+) -> None:
+    if is_fresh(await get_sync_state(db_session, str(user_id), calendar_id)):
+        return
+    token = await get_token_store().get(db_session, str(user_id), "google")
+    await sync_calendar(
+        db_session, get_google_calendar_api(token.token), str(user_id), calendar_id
+    )
+
+
+async def mark_stale(
+    db_session: AsyncSession, user_id: str, calendar_id: str = "primary"
+) -> None:
+    """Make the next read sync the calendar, e.g. after we changed it ourselves."""
+    await db_session.execute(
+        update(CalendarSyncState)
+        .where(
+            CalendarSyncState.user_id == uuid.UUID(str(user_id)),
+            CalendarSyncState.calendar_id == calendar_id,
+        )
+        .values(synced_at=None)
+    )
+    await db_session.commit()
+
+
+async def list_mirrored_events(
+    db_session: AsyncSession,
+    user_id: str,
+    start: datetime,
+    end: datetime,
+    calendar_id: str = "primary",
+) -> list[dict[str, Any]]:
+    """Mirrored events overlapping ``[start, end)``, as returned by events.list."""
+    result = await db_session.execute(
+        select(CalendarEvent.raw)
+        .where(
+            CalendarEvent.user_id == uuid.UUID(str(user_id)),
+            CalendarEvent.calendar_id == calendar_id,
+            CalendarEvent.start_at < end,
+            CalendarEvent.end_at > start,
+        )
+        .order_by(CalendarEvent.start_at)
+    )
+    return list(result.scalars().all())
+
+
+async def list_busy_intervals(
+    db_session: AsyncSession,
+    user_id: str,
+    start: datetime,
+    end: datetime,
+    calendar_id: str = "primary",
+    tz: tzinfo = timezone.utc,
+) -> list[tuple[datetime, datetime]]:
+    """Mirrored events overlapping ``[start, end)`` that block time.
+
+    All-day events block their whole day in ``tz``, the user's timezone.
+    """
+    result = await db_session.execute(
+        select(
+            CalendarEvent.start_at, CalendarEvent.end_at, CalendarEvent.all_day
+        ).where(
+            CalendarEvent.user_id == uuid.UUID(str(user_id)),
+            CalendarEvent.calendar_id == calendar_id,
+            CalendarEvent.start_at < end + ALL_DAY_SLACK,
+            CalendarEvent.end_at > start - ALL_DAY_SLACK,
+            # events marked "show as available" do not block time
+            CalendarEvent.raw["transparency"].astext.is_distinct_from("transparent"),
+        )
+    )
+    intervals = []
+    for row in result:
+        start_at, end_at = row.start_at, row.end_at
+        if row.all_day:
+            start_at, end_at = local_midnight(start_at, tz), local_midnight(end_at, tz)
+        if start_at < end and end_at > start:
+            intervals.append((start_at, end_at))
+    return intervals
+
+
+async def handle_notification(
+    db_session: AsyncSession, channel_id: str, channel_token: str, resource_state: str
+) -> Optional[Job]:
+    """Queue a CALENDAR_SYNC job for a push notification from Google.
+
+    Returns None for the ``sync`` handshake Google sends when a channel opens,
+    and when a sync of the calendar is already queued.
+    """
+    result = await db_session.execute(
+        select(CalendarSyncState).where(CalendarSyncState.channel_id == channel_id)
+    )
+    state = result.scalar_one_or_none()
+    if state is None or not secrets.compare_digest(
+        state.channel_token or "", channel_token or ""
+    ):
+        raise PermissionError("Unknown calendar push channel")
+    if resource_state == "sync":
+        return None
+
+    pending = await db_session.execute(
+        select(Job.id).where(
+            Job.type == JobType.CALENDAR_SYNC,
+            Job.status == JobStatus.PENDING,
+            Job.user_id == state.user_id,
+            Job.payload["calendar_id"].astext == state.calendar_id,
+        )
+    )
+    if pending.first() is not None:
+        return None
+    return await enqueue_job(
+        db_session,
+        JobType.CALENDAR_SYNC,
+        state.user_id,
+        {"calendar_id": state.calendar_id},
+    )
+
+
+async def run_calendar_sync(db_session: AsyncSession, job: Job) -> dict[str, int]:
+    """CALENDAR_SYNC job: pull the calendar's changes into the mirror."""
+    token = await get_token_store().get(db_session, str(job.user_id), "google")
+    return await sync_calendar(
+        db_session,
+        get_google_calendar_api(token.token),
+        str(job.user_id),
+        job.payload["calendar_id"],
+    )
@@ -0,0 +1,216 @@
+# read-through cache of per-user canvas responses
+import asyncio
+import json
+from datetime import timedelta
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Optional, Protocol
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.sql import func
+
+from src.application.notify import listen_forever, notify
+from src.cache import TTLCache
+from src.database.models import CanvasCacheEntry
+from src.settings import settings
+
+# sent by CanvasResponseCache.invalidate with "<user_id>:<endpoint>" as payload
+CANVAS_CACHE_CHANNEL = "canvas_cache_invalidated"
+
+
+def cache_key(user_id: str, endpoint: str, params: dict[str, Any]) -> str:
+    return f"{user_id}:{endpoint}:{json.dumps(params, sort_keys=True, default=str)}"
+
+
+class CacheBackend(Protocol):
+    async def get(self, key: str) -> Optional[Any]: ...
+
+    async def set(self, key: str, user_id: str, value: Any, ttl: float) -> None: ...
+
+    async def invalidate(self, user_id: str, endpoint: Optional[str] = None) -> None: ...
+
+
+class MemoryCacheBackend:
+    """Per-process backend; each API worker keeps its own copy."""
+
+    def __init__(self, max_size: int):
+        self.entries: TTLCache[str, Any] = TTLCache(max_size=max_size, ttl=float("inf"))
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self.entries.get(key)
+
+    async def set(self, key: str, user_id: str, value: Any, ttl: float) -> None:
+        self.entries.set(key, value, ttl=ttl)
+
+    async def invalidate(self, user_id: str, endpoint: Optional[str] = None) -> None:
+        prefix = f"{user_id}:{endpoint}:" if endpoint else f"{user_id}:"
+        for key in [key for key in self.entries.keys() if key.startswith(prefix)]:
+            self.entries.pop(key)
+
+
+class PostgresCacheBackend:
+    """Backend shared by every API and job worker, in the canvas_response_cache table."""
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.table = CanvasCacheEntry.__table__
+
+    async def get(self, key: str) -> Optional[Any]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(self.table.c.value).where(
+                    self.table.c.key == key, self.table.c.expires_at > func.now()
+                )
+            )
+            return result.scalar_one_or_none()
+
+    async def set(self, key: str, user_id: str, value: Any, ttl: float) -> None:
+        expires_at = func.now() + timedelta(seconds=ttl)
+        stmt = insert(self.table).values(
+            key=key, user_id=user_id, value=value, expires_at=expires_at
+        )
+        async with self.engine.begin() as conn:
+            await conn.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[self.table.c.key],
+                    set_={"value": stmt.excluded.value, "expires_at": expires_at},
+                )
+            )
+
+    async def invalidate(self, user_id: str, endpoint: Optional[str] = None) -> None:
+        stmt = delete(self.table).where(self.table.c.user_id == user_id)
+        if endpoint:
+            stmt = stmt.where(self.table.c.key.startswith(f"{user_id}:{endpoint}:"))
+        async with self.engine.begin() as conn:
+            await conn.execute(stmt)
+
+    async def purge_expired(self) -> int:
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                delete(self.table).where(self.table.c.expires_at <= func.now())
+            )
+        return result.rowcount
+
+
+class CanvasResponseCache:
+    """Read-through cache of Canvas responses keyed by user, endpoint and params.
+
+    Concurrent misses for the same key share one upstream call: the first
+    caller starts the fetch as a task and the others await the same task.
+    Values must be JSON-serializable so they can live in the shared backend.
+
+    With the per-process memory backend and an ``engine``, invalidations are
+    also sent with NOTIFY, so e.g. a course sync in the job worker drops the
+    user's entries in every API worker (``start`` listens for them).
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        ttls: dict[str, float],
+        engine: Optional[AsyncEngine] = None,
+    ):
+        self.backend = backend
+        self.ttls = ttls
+        self.engine = engine
+        self.inflight: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.tasks: set[asyncio.Task] = set()
+        self.listener: Optional[asyncio.Task] = None
+
+    @property
+    def shared(self) -> bool:
+        """Whether every process already sees the same entries."""
+        return not isinstance(self.backend, MemoryCacheBackend)
+
+    async def get_or_fetch(
+        self,
+        user_id: str,
+        endpoint: str,
+        params: dict[str, Any],
+        fetch: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        key = cache_key(user_id, endpoint, params)
+        cached = await self.backend.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, user_id, endpoint, fetch))
+            self.inflight[key] = task
+        # a cancelled caller must not cancel the fetch others are waiting on
+        return await asyncio.shield(task)
+
+    async def _fetch(
+        self, key: str, user_id: str, endpoint: str, fetch: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        task = asyncio.current_task()
+        try:
+            value = await fetch()
+            # skip storing if the key was invalidated while we were fetching
+            if self.inflight.get(key) is task:
+                await self.backend.set(key, user_id, value, self.ttls.get(endpoint, 60))
+            return value
+        finally:
+            if self.inflight.get(key) is task:
+                del self.inflight[key]
+
+    async def invalidate(self, user_id: str, endpoint: Optional[str] = None) -> None:
+        """Forget a user's cached responses, e.g. after a course sync."""
+        await self._invalidate_local(user_id, endpoint)
+        if self.engine is not None and not self.shared:
+            payload = f"{user_id}:{endpoint or ''}"
+            await notify(self.engine, CANVAS_CACHE_CHANNEL, payload)
+
+    async def _invalidate_local(self, user_id: str, endpoint: Optional[str]) -> None:
+        prefix = f"{user_id}:{endpoint}:" if endpoint else f"{user_id}:"
+        for key in [key for key in self.inflight if key.startswith(prefix)]:
+            del self.inflight[key]
+        await self.backend.invalidate(user_id, endpoint)
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        user_id, _, endpoint = payload.partition(":")
+        task = asyncio.create_task(self._invalidate_local(user_id, endpoint or None))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def _clear(self) -> None:
+        self.inflight.clear()
+        if isinstance(self.backend, MemoryCacheBackend):
+            self.backend.entries.clear()
+
+    async def start(self) -> None:
+        if self.engine is None or self.shared or self.listener is not None:
+            return
+        # notifications sent while we were not listening are lost
+        self.listener = asyncio.create_task(
+            listen_forever(
+                CANVAS_CACHE_CHANNEL, self._on_notify, on_connect=self._clear
+            )
+        )
+
+    async def stop(self) -> None:
+        if self.listener is None:
+            return
+        self.listener.cancel()
+        await asyncio.gather(self.listener, return_exceptions=True)
+        self.listener = None
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "inflight": len(self.inflight)}
+
+
+@lru_cache
+def get_canvas_cache() -> CanvasResponseCache:
+    from src.deps import engine
+
+    if settings.canvas_cache_backend == "postgres":
+        backend: CacheBackend = PostgresCacheBackend(engine)
+    else:
+        backend = MemoryCacheBackend(max_size=settings.canvas_cache_size)
+    return CanvasResponseCache(backend, settings.canvas_cache_ttls, engine)
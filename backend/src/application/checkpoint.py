@@ -0,0 +1,414 @@
+# conversation state (langgraph checkpoints) for the shared agent graph
+import random
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from functools import lru_cache
+from typing import Any, AsyncIterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+from langgraph.checkpoint.memory import MemorySaver
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from src.database.models import (
+    AgentCheckpoint,
+    AgentCheckpointBlob,
+    AgentCheckpointWrite,
+)
+from src.settings import settings
+
+checkpoint_table = AgentCheckpoint.__table__
+blob_table = AgentCheckpointBlob.__table__
+write_table = AgentCheckpointWrite.__table__
+
+
+class BoundedMemorySaver(MemorySaver):
+    """``MemorySaver`` that forgets threads unused for ``ttl`` seconds.
+
+    At most ``max_threads`` conversations are kept; the least recently used
+    thread is dropped first, so memory no longer grows with every user.
+    """
+
+    def __init__(self, max_threads: int, ttl: float):
+        super().__init__()
+        self.max_threads = max_threads
+        self.ttl = ttl
+        self.last_used: OrderedDict[str, float] = OrderedDict()
+
+    def _touch(self, config: RunnableConfig) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        now = time.monotonic()
+        self.last_used[thread_id] = now
+        self.last_used.move_to_end(thread_id)
+
+        while self.last_used:
+            oldest, used_at = next(iter(self.last_used.items()))
+            if len(self.last_used) <= self.max_threads and now - used_at <= self.ttl:
+                break
+            del self.last_used[oldest]
+            self._forget(oldest)
+
+    def _forget(self, thread_id: str) -> None:
+        self.storage.pop(thread_id, None)
+        for key in [key for key in self.writes if key[0] == thread_id]:
+            del self.writes[key]
+        blobs = getattr(self, "blobs", {})
+        for key in [key for key in blobs if key[0] == thread_id]:
+            del blobs[key]
+
+    def get_tuple(self, config: RunnableConfig):
+        self._touch(config)
+        return super().get_tuple(config)
+
+    def put(self, config: RunnableConfig, *args, **kwargs) -> RunnableConfig:
+        self._touch(config)
+        return super().put(config, *args, **kwargs)
+
+
+class PostgresCheckpointSaver(BaseCheckpointSaver[str]):
+    """Checkpointer storing agent conversations in Postgres via the app's async engine.
+
+    Like langgraph's own Postgres saver, channel values live in a separate
+    blob table keyed by version, so each step only writes the channels it
+    changed. Only the newest ``keep_checkpoints`` checkpoints of a thread are
+    kept (older ones are only needed for time travel, which we do not use),
+    and ``aprune`` drops whole threads that have been idle for a while.
+    """
+
+    def __init__(self, engine: AsyncEngine, keep_checkpoints: int = 20):
+        super().__init__()
+        self.engine = engine
+        self.keep_checkpoints = keep_checkpoints
+
+    def get_next_version(self, current: Optional[str], channel: Any) -> str:
+        # string versions so they sort correctly and fit in a text column
+        if current is None:
+            current_version = 0
+        elif isinstance(current, int):
+            current_version = current
+        else:
+            current_version = int(current.split(".")[0])
+        return f"{current_version + 1:032}.{random.random():016}"
+
+    async def _load_tuple(self, conn: AsyncConnection, row) -> CheckpointTuple:
+        checkpoint = self.serde.loads_typed((row.type, row.checkpoint))
+        channel_versions = row.channel_versions
+
+        channel_values = {}
+        if channel_versions:
+            blobs = await conn.execute(
+                select(
+                    blob_table.c.channel, blob_table.c.type, blob_table.c.blob
+                ).where(
+                    blob_table.c.thread_id == row.thread_id,
+                    blob_table.c.checkpoint_ns == row.checkpoint_ns,
+                    tuple_(blob_table.c.channel, blob_table.c.version).in_(
+                        list(channel_versions.items())
+                    ),
+                )
+            )
+            channel_values = {
+                blob.channel: self.serde.loads_typed((blob.type, blob.blob))
+                for blob in blobs
+                if blob.type != "empty"
+            }
+
+        writes = await conn.execute(
+            select(write_table)
+            .where(
+                write_table.c.thread_id == row.thread_id,
+                write_table.c.checkpoint_ns == row.checkpoint_ns,
+                write_table.c.checkpoint_id == row.checkpoint_id,
+            )
+            .order_by(write_table.c.task_id, write_table.c.idx)
+        )
+
+        def config_for(checkpoint_id: str) -> RunnableConfig:
+            return {
+                "configurable": {
+                    "thread_id": row.thread_id,
+                    "checkpoint_ns": row.checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            }
+
+        return CheckpointTuple(
+            config=config_for(row.checkpoint_id),
+            checkpoint={**checkpoint, "channel_values": channel_values},
+            metadata=self.serde.loads_typed((row.metadata_type, row.meta_data)),
+            parent_config=(
+                config_for(row.parent_checkpoint_id) if row.parent_checkpoint_id else None
+            ),
+            pending_writes=[
+                (
+                    write.task_id,
+                    write.channel,
+                    self.serde.loads_typed((write.type, write.blob)),
+                )
+                for write in writes
+            ],
+        )
+
+    def _select_checkpoints(
+        self, config: Optional[RunnableConfig], before: Optional[RunnableConfig] = None
+    ):
+        stmt = select(checkpoint_table).order_by(checkpoint_table.c.checkpoint_id.desc())
+        if config:
+            configurable = config["configurable"]
+            stmt = stmt.where(checkpoint_table.c.thread_id == configurable["thread_id"])
+            if "checkpoint_ns" in configurable:
+                stmt = stmt.where(
+                    checkpoint_table.c.checkpoint_ns == configurable["checkpoint_ns"]
+                )
+            if checkpoint_id := get_checkpoint_id(config):
+                stmt = stmt.where(checkpoint_table.c.checkpoint_id == checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            stmt = stmt.where(checkpoint_table.c.checkpoint_id < before_id)
+        return stmt
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        config = {"configurable": {"checkpoint_ns": "", **config["configurable"]}}
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(self._select_checkpoints(config).limit(1))).first()
+            if row is None:
+                return None
+            return await self._load_tuple(conn, row)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        stmt = self._select_checkpoints(config, before)
+        if limit is not None and not filter:
+            stmt = stmt.limit(limit)
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(stmt)).all()
+            yielded = 0
+            for row in rows:
+                checkpoint_tuple = await self._load_tuple(conn, row)
+                if filter and any(
+                    checkpoint_tuple.metadata.get(key) != value
+                    for key, value in filter.items()
+                ):
+                    continue
+                yield checkpoint_tuple
+                yielded += 1
+                if limit is not None and yielded >= limit:
+                    return
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        configurable = config["configurable"]
+        thread_id = configurable["thread_id"]
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+
+        checkpoint_ = checkpoint.copy()
+        values = checkpoint_.pop("channel_values")
+        blobs = []
+        for channel, version in new_versions.items():
+            type_, blob = (
+                self.serde.dumps_typed(values[channel])
+                if channel in values
+                else ("empty", None)
+            )
+            blobs.append(
+                {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "channel": channel,
+                    "version": str(version),
+                    "type": type_,
+                    "blob": blob,
+                }
+            )
+
+        type_, serialized = self.serde.dumps_typed(checkpoint_)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(metadata)
+        row = {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint["id"],
+            "parent_checkpoint_id": configurable.get("checkpoint_id"),
+            "type": type_,
+            "checkpoint": serialized,
+            "channel_versions": {
+                channel: str(version)
+                for channel, version in checkpoint["channel_versions"].items()
+            },
+            "metadata_type": metadata_type,
+            "meta_data": serialized_metadata,
+        }
+
+        async with self.engine.begin() as conn:
+            if blobs:
+                await conn.execute(
+                    insert(blob_table).values(blobs).on_conflict_do_nothing()
+                )
+            stmt = insert(checkpoint_table).values(row)
+            await conn.execute(
+                stmt.on_conflict_do_update(
+                    constraint="unique_agent_checkpoint_thread_ns_id",
+                    set_={
+                        key: stmt.excluded[key]
+                        for key in (
+                            "type",
+                            "checkpoint",
+                            "channel_versions",
+                            "metadata_type",
+                            "meta_data",
+                        )
+                    },
+                )
+            )
+            if self.keep_checkpoints > 0:
+                await self._trim_thread(conn, thread_id, checkpoint_ns)
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    async def _trim_thread(
+        self, conn: AsyncConnection, thread_id: str, checkpoint_ns: str
+    ) -> None:
+        """Drop all but the newest checkpoints, and writes/blobs only they used."""
+        in_thread = (checkpoint_table.c.thread_id == thread_id) & (
+            checkpoint_table.c.checkpoint_ns == checkpoint_ns
+        )
+        oldest_kept = (
+            select(checkpoint_table.c.checkpoint_id)
+            .where(in_thread)
+            .order_by(checkpoint_table.c.checkpoint_id.desc())
+            .offset(self.keep_checkpoints - 1)
+            .limit(1)
+            .scalar_subquery()
+        )
+        trimmed = await conn.execute(
+            delete(checkpoint_table).where(
+                in_thread, checkpoint_table.c.checkpoint_id < oldest_kept
+            )
+        )
+        if not trimmed.rowcount:
+            return
+
+        await conn.execute(
+            delete(write_table).where(
+                write_table.c.thread_id == thread_id,
+                write_table.c.checkpoint_ns == checkpoint_ns,
+                write_table.c.checkpoint_id < oldest_kept,
+            )
+        )
+        still_used = (
+            select(checkpoint_table.c.id)
+            .where(
+                in_thread,
+                checkpoint_table.c.channel_versions[blob_table.c.channel].astext
+                == blob_table.c.version,
+            )
+            .exists()
+        )
+        await conn.execute(
+            delete(blob_table).where(
+                blob_table.c.thread_id == thread_id,
+                blob_table.c.checkpoint_ns == checkpoint_ns,
+                ~still_used,
+            )
+        )
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        if not writes:
+            return
+        configurable = config["configurable"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            rows.append(
+                {
+                    "thread_id": configurable["thread_id"],
+                    "checkpoint_ns": configurable.get("checkpoint_ns", ""),
+                    "checkpoint_id": configurable["checkpoint_id"],
+                    "task_id": task_id,
+                    "idx": WRITES_IDX_MAP.get(channel, idx),
+                    "channel": channel,
+                    "type": type_,
+                    "blob": blob,
+                    "task_path": task_path,
+                }
+            )
+
+        stmt = insert(write_table).values(rows)
+        # special writes (errors, interrupts) replace earlier ones of the task
+        if all(channel in WRITES_IDX_MAP for channel, _ in writes):
+            stmt = stmt.on_conflict_do_update(
+                constraint="unique_agent_checkpoint_write_thread_ns_id_task_idx",
+                set_={key: stmt.excluded[key] for key in ("channel", "type", "blob")},
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing()
+        async with self.engine.begin() as conn:
+            await conn.execute(stmt)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        async with self.engine.begin() as conn:
+            for table in (checkpoint_table, blob_table, write_table):
+                await conn.execute(delete(table).where(table.c.thread_id == thread_id))
+
+    async def aprune(self, max_age: float) -> int:
+        """Delete threads whose newest checkpoint is older than ``max_age`` seconds."""
+        stale_threads = (
+            select(checkpoint_table.c.thread_id)
+            .group_by(checkpoint_table.c.thread_id)
+            .having(
+                func.max(checkpoint_table.c.created_at)
+                < func.now() - timedelta(seconds=max_age)
+            )
+        )
+        async with self.engine.begin() as conn:
+            thread_ids = list((await conn.execute(stale_threads)).scalars())
+            for table in (checkpoint_table, blob_table, write_table):
+                await conn.execute(delete(table).where(table.c.thread_id.in_(thread_ids)))
+        return len(thread_ids)
+
+
+@lru_cache
+def get_checkpointer() -> BaseCheckpointSaver:
+    """The process-wide checkpointer selected by ``hai_agent_checkpointer``."""
+    if settings.agent_checkpointer == "memory":
+        return BoundedMemorySaver(
+            max_threads=settings.agent_max_threads, ttl=settings.agent_thread_ttl
+        )
+
+    from src.deps import engine
+
+    return PostgresCheckpointSaver(
+        engine, keep_checkpoints=settings.agent_checkpoints_per_thread
+    )
@@ -0,0 +1,212 @@
+# token-aware, overlapping chunking of extracted course material text
+#
+# benchmark: `python -m src.application.chunking [file.pdf] [--pages N]`
+import argparse
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Protocol
+
+import nltk
+import tiktoken
+from nltk.tokenize.punkt import PunktTokenizer
+
+from src.settings import settings
+
+
+class Encoding(Protocol):
+    def encode_ordinary_batch(self, text: list[str]) -> list[list[int]]: ...
+
+    def decode(self, tokens: list[int]) -> str: ...
+
+
+SentenceSplitter = Callable[[str], list[str]]
+
+
+# longest line taken for a slide or section title
+MAX_HEADING_CHARS = 80
+
+
+@dataclass(frozen=True)
+class Chunk:
+    text: str
+    n_tokens: int
+    # 1-based pages the chunk starts and ends on
+    first_page: int
+    last_page: int
+    # title of the section the chunk starts in, if the pages have any
+    heading: Optional[str] = None
+
+
+class Sentence(NamedTuple):
+    text: str
+    n_tokens: int
+    page: int
+    heading: Optional[str]
+
+
+def page_heading(text: str) -> Optional[str]:
+    """The page's title: its first line, if that reads like one.
+
+    Slide decks put the title on the first line of every page; a line that is
+    short and does not end like a sentence is taken as one.
+    """
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if len(line) > MAX_HEADING_CHARS or line.endswith((".", ",", ";", ":")):
+            return None
+        # page numbers and footers are not titles
+        return line if any(char.isalpha() for char in line) else None
+    return None
+
+
+def load_sentence_splitter(language: str = "english") -> SentenceSplitter:
+    """The punkt sentence splitter, downloading its model only if missing."""
+    try:
+        tokenizer = PunktTokenizer(language)
+    except LookupError:
+        nltk.download("punkt_tab", quiet=True)
+        tokenizer = PunktTokenizer(language)
+    return tokenizer.tokenize
+
+
+def load_encoding(model: str = settings.embedding_model) -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+class Chunker:
+    """Packs sentences into chunks of at most ``max_tokens`` tokens.
+
+    Each chunk starts with the last sentences of the previous one, up to
+    ``overlap_tokens``, so a passage cut at a chunk boundary is still whole in
+    one of them. Sentences longer than ``max_tokens`` are cut into pieces.
+    """
+
+    def __init__(
+        self,
+        encoding: Encoding,
+        split_sentences: SentenceSplitter,
+        max_tokens: int = settings.chunk_max_tokens,
+        overlap_tokens: int = settings.chunk_overlap_tokens,
+    ):
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.encoding = encoding
+        self.split_sentences = split_sentences
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def sentences(self, text: str) -> Iterator[tuple[str, int]]:
+        """Sentences of ``text`` with their token counts, none over the limit."""
+        sentences = [s for s in self.split_sentences(text) if s.strip()]
+        # one call per page; tiktoken encodes the batch in parallel threads
+        for sentence, tokens in zip(
+            sentences, self.encoding.encode_ordinary_batch(sentences)
+        ):
+            if len(tokens) <= self.max_tokens:
+                yield sentence, len(tokens)
+                continue
+            for i in range(0, len(tokens), self.max_tokens):
+                piece = tokens[i : i + self.max_tokens]
+                yield self.encoding.decode(piece), len(piece)
+
+    def chunk_pages(self, pages: Iterable[tuple[int, str]]) -> Iterator[Chunk]:
+        """Chunks of a stream of ``(page number, text)``, yielded as they fill.
+
+        Chunks may span pages. Only the sentences of the chunk being built are
+        held, so pages can come straight from the PDF reader. A page without a
+        title of its own continues the section of the page before it.
+        """
+        window: list[Sentence] = []
+        n_tokens = 0
+        # sentences carried over from the previous chunk, not yet followed by new
+        # text; a chunk of only those would repeat what was already emitted
+        carried = 0
+        heading = None
+
+        for page, text in pages:
+            heading = page_heading(text) or heading
+            for sentence, sentence_tokens in self.sentences(text):
+                if window and n_tokens + sentence_tokens > self.max_tokens:
+                    if len(window) > carried:
+                        yield self._chunk(window, n_tokens)
+                    window, n_tokens = self._overlap(window, sentence_tokens)
+                    carried = len(window)
+                window.append(Sentence(sentence, sentence_tokens, page, heading))
+                n_tokens += sentence_tokens
+
+        if len(window) > carried:
+            yield self._chunk(window, n_tokens)
+
+    def _overlap(
+        self, window: list[Sentence], next_tokens: int
+    ) -> tuple[list[Sentence], int]:
+        """The tail of ``window`` to start the next chunk with."""
+        budget = min(self.overlap_tokens, self.max_tokens - next_tokens)
+        kept = 0
+        start = len(window)
+        while start > 0 and kept + window[start - 1].n_tokens <= budget:
+            start -= 1
+            kept += window[start].n_tokens
+        return window[start:], kept
+
+    def _chunk(self, window: list[Sentence], n_tokens: int) -> Chunk:
+        return Chunk(
+            text=" ".join(sentence.text for sentence in window),
+            n_tokens=n_tokens,
+            first_page=window[0].page,
+            last_page=window[-1].page,
+            heading=window[0].heading,
+        )
+
+
+@lru_cache
+def get_chunker() -> Chunker:
+    """The process-wide chunker; loads the tokenizer and punkt model once."""
+    return Chunker(load_encoding(), load_sentence_splitter())
+
+
+def benchmark(chunker: Chunker, pages: list[str], repeat: int = 3) -> dict[str, float]:
+    """Chunk ``pages`` ``repeat`` times and report the best throughput."""
+    best = float("inf")
+    n_chunks = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        n_chunks = sum(1 for _ in chunker.chunk_pages(enumerate(pages, start=1)))
+        best = min(best, time.perf_counter() - started)
+    return {
+        "pages": len(pages),
+        "chunks": n_chunks,
+        "seconds": round(best, 4),
+        "pages_per_second": round(len(pages) / best, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the material chunker")
+    parser.add_argument("pdf", nargs="?", help="PDF to chunk (default: synthetic)")
+    parser.add_argument("--pages", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.pdf:
+        from src.application.pdf import count_pages, extract_pages
+
+        pages = extract_pages(args.pdf, 0, count_pages(args.pdf))
+    else:
+        sentence = "The derivative of x squared is two x, by the power rule. "
+        pages = [f"Lecture {page}. " + sentence * 40 for page in range(args.pages)]
+
+    started = time.perf_counter()
+    chunker = get_chunker()
+    loaded_in = time.perf_counter() - started
+    print(f"loaded tokenizer and sentence model in {loaded_in:.2f}s")
+    print(benchmark(chunker, pages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import re
+import time
+import unicodedata
+
+import tiktoken
+from openai import AsyncOpenAI
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import EmbeddingCache
+from src.settings import settings
+
+# hard limit of the embeddings endpoint for a single input
+MAX_INPUT_TOKENS = 8191
+
+
+def parse_reset_duration(value: str | None) -> float:
+    """Parse OpenAI's ``x-ratelimit-reset-*`` headers (e.g. ``6m0s``, ``20ms``)."""
+    if not value:
+        return 0.0
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(
+        float(amount) * units[unit]
+        for amount, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    )
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode()).hexdigest()
+
+
+class PostgresEmbeddingCache:
+    """Persistent embedding cache in the ``embedding_cache`` table.
+
+    Lecture files are shared by everyone in a course, so identical chunks
+    are embedded once per model instead of once per upload.
+    """
+
+    def __init__(self, db_session: AsyncSession, model: str):
+        self.db_session = db_session
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+
+    async def get_many(self, hashes: list[str]) -> dict[str, list[float]]:
+        if not hashes:
+            return {}
+        result = await self.db_session.execute(
+            select(EmbeddingCache.content_hash, EmbeddingCache.embedding).where(
+                EmbeddingCache.model == self.model,
+                EmbeddingCache.content_hash.in_(set(hashes)),
+            )
+        )
+        cached = {
+            content_hash: [float(value) for value in embedding]
+            for content_hash, embedding in result.all()
+        }
+        self.hits += sum(1 for content_hash in hashes if content_hash in cached)
+        self.misses += sum(1 for content_hash in hashes if content_hash not in cached)
+        return cached
+
+    async def put_many(self, embeddings: dict[str, list[float]]) -> None:
+        if not embeddings:
+            return
+        stmt = insert(EmbeddingCache).values(
+            [
+                {"content_hash": content_hash, "model": self.model, "embedding": embedding}
+                for content_hash, embedding in embeddings.items()
+            ]
+        )
+        await self.db_session.execute(stmt.on_conflict_do_nothing())
+
+    def stats(self) -> dict[str, int]:
+        return {"embedding_cache_hits": self.hits, "embedding_cache_misses": self.misses}
+
+
+class BatchEmbedder:
+    """Embed many texts with as few OpenAI requests as possible.
+
+    Texts are packed into requests bounded by both input count and total
+    tokens, a bounded number of requests run concurrently, and a request waits
+    for the rate-limit window to reset when the budget left cannot fit it. With
+    a ``cache``, only texts it has not seen before are sent to OpenAI.
+    """
+
+    def __init__(
+        self,
+        client: AsyncOpenAI,
+        cache: PostgresEmbeddingCache | None = None,
+        model: str = settings.embedding_model,
+        max_batch_size: int = settings.embedding_batch_size,
+        max_batch_tokens: int = settings.embedding_batch_tokens,
+        max_concurrency: int = settings.embedding_max_concurrency,
+    ):
+        self.client = client
+        self.cache = cache
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.paused_until = 0.0
+        # token budget left in the current rate-limit window, per the last response
+        self.remaining_tokens: int | None = None
+        self.tokens_reset_at = 0.0
+        self.requests = 0
+        try:
+            self.encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+
+    def truncate(self, text: str) -> tuple[str, int]:
+        tokens = self.encoding.encode(text)
+        if len(tokens) <= MAX_INPUT_TOKENS:
+            return text, len(tokens)
+        return self.encoding.decode(tokens[:MAX_INPUT_TOKENS]), MAX_INPUT_TOKENS
+
+    def make_batches(self, token_counts: list[int]) -> list[list[int]]:
+        """Group text indexes into batches that fit the request limits."""
+        batches: list[list[int]] = []
+        batch: list[int] = []
+        batch_tokens = 0
+        for index, n_tokens in enumerate(token_counts):
+            is_full = (
+                len(batch) >= self.max_batch_size
+                or batch_tokens + n_tokens > self.max_batch_tokens
+            )
+            if batch and is_full:
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(index)
+            batch_tokens += n_tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _update_rate_limit(self, headers) -> None:
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if remaining_requests is not None and int(remaining_requests) <= 0:
+            reset = parse_reset_duration(headers.get("x-ratelimit-reset-requests"))
+            self.paused_until = max(self.paused_until, time.monotonic() + reset)
+        if remaining_tokens is not None:
+            reset = parse_reset_duration(headers.get("x-ratelimit-reset-tokens"))
+            self.remaining_tokens = int(remaining_tokens)
+            self.tokens_reset_at = time.monotonic() + reset
+
+    async def _embed_batch(self, texts: list[str], n_tokens: int) -> list[list[float]]:
+        async with self.semaphore:
+            delay = self.paused_until - time.monotonic()
+            # only wait for the token budget when this batch would not fit in it
+            if self.remaining_tokens is not None and n_tokens > self.remaining_tokens:
+                delay = max(delay, self.tokens_reset_at - time.monotonic())
+                self.remaining_tokens = None
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.remaining_tokens is not None:
+                self.remaining_tokens -= n_tokens
+
+            raw_response = await self.client.embeddings.with_raw_response.create(
+                model=self.model, input=texts
+            )
+            self.requests += 1
+            self._update_rate_limit(raw_response.headers)
+            response = raw_response.parse()
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        """Embed ``texts``, returning vectors in the same order."""
+        if self.cache is None:
+            return await self._embed_uncached(texts)
+
+        hashes = [content_hash(text) for text in texts]
+        cached = await self.cache.get_many(hashes)
+
+        # identical chunks within the batch are only embedded once too
+        missing = {
+            content_hash: text
+            for content_hash, text in zip(hashes, texts)
+            if content_hash not in cached
+        }
+        embedded = await self._embed_uncached(list(missing.values()))
+        fresh = dict(zip(missing.keys(), embedded))
+        await self.cache.put_many(fresh)
+
+        return [cached.get(content_hash) or fresh[content_hash] for content_hash in hashes]
+
+    async def _embed_uncached(self, texts: list[str]) -> list[list[float]]:
+        truncated = [self.truncate(text) for text in texts]
+        texts = [text for text, _ in truncated]
+        batches = self.make_batches([n_tokens for _, n_tokens in truncated])
+        results = await asyncio.gather(
+            *(
+                self._embed_batch(
+                    [texts[index] for index in batch],
+                    sum(truncated[index][1] for index in batch),
+                )
+                for batch in batches
+            )
+        )
+
+        embeddings: list[list[float]] = [[] for _ in texts]
+        for batch, vectors in zip(batches, results):
+            for index, vector in zip(batch, vectors):
+                embeddings[index] = vector
+        return embeddings
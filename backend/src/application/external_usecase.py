@@ -1,71 +1,61 @@
-from canvasapi import Canvas
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+import base64
+import hashlib
 
+from src.deps import CanvasApiError, CanvasClient, GoogleApiError, GoogleCalendarApi
 from src.settings import settings
 
 
-def fetch_canvas_courses(canvas_api_url: str, canvas_api_key: str, **kwargs):
+async def fetch_canvas_courses(canvas_client: CanvasClient, **kwargs):
     """
     Fetches all courses from user's Canvas.
 
     Args:
-        canvas_api_url (str): API URL of Canvas instance
-        canvas_api_key (str): User's Canvas API key
-        **kwargs: Additional keyword arguments
+        canvas_client (CanvasClient): Canvas client authenticated as the user
+        **kwargs: Additional query parameters
 
     Returns:
         list[dict[str, Any]]: List of course dictionaries containing id, name, and created_at
     """
     if not kwargs:
         kwargs = {"enrollment_state": "active", "enrollment_type": "student"}
-    canvas = Canvas(canvas_api_url, canvas_api_key)
-    courses = canvas.get_courses(**kwargs)
+    courses = await canvas_client.list_courses(**kwargs)
     return [
         {
-            "id": course.id,
-            "name": course.name,
-            "created_at": course.created_at,
-            # "start_at": course.start_at,
-            # "end_at": course.end_at,
+            "id": course["id"],
+            "name": course["name"],
+            "created_at": course["created_at"],
+            # "start_at": course["start_at"],
+            # "end_at": course["end_at"],
         }
         for course in courses
     ]
 
 
-def fetch_canvas_events_by_course(
-    canvas_api_url: str, canvas_api_key: str, course_id: str
-):
+async def fetch_canvas_events_by_course(canvas_client: CanvasClient, course_id: str):
     """
     Fetches assignments and exam schedules from user's Canvas.
 
     Args:
-        canvas_api_url (str): API URL of Canvas instance
-        canvas_api_key (str): User's Canvas API key
+        canvas_client (CanvasClient): Canvas client authenticated as the user
         course_id (str): Course ID
 
     Returns:
         list[dict[str, str]]: List of event dictionaries containing title, description, due_at, and html_url
     """
-    canvas = Canvas(canvas_api_url, canvas_api_key)
-    course = canvas.get_course(course_id)
-    assignments = course.get_assignments()
-    events = []
-    for assignment in assignments:
-        events.append(
-            {
-                "title": assignment.name,
-                "description": assignment.description,
-                "due_at": assignment.due_at,
-                "html_url": assignment.html_url,
-            }
-        )
-    return events
+    assignments = await canvas_client.list_assignments(course_id)
+    return [
+        {
+            "title": assignment["name"],
+            "description": assignment.get("description"),
+            "due_at": assignment.get("due_at"),
+            "html_url": assignment.get("html_url"),
+        }
+        for assignment in assignments
+    ]
 
 
-def fetch_canvas_events(
-    canvas_api_url: str,
-    canvas_api_key: str,
+async def fetch_canvas_events(
+    canvas_client: CanvasClient,
     start_date: str,
     end_date: str,
     course_id: str = None,
@@ -74,8 +64,7 @@ def fetch_canvas_events(
     Fetches all assignments and exam schedules from user's Canvas.
 
     Args:
-        canvas_api_url (str): API URL of Canvas instance
-        canvas_api_key (str): User's Canvas API key
+        canvas_client (CanvasClient): Canvas client authenticated as the user
         start_date (str): Start date (RFC3339 format)
         end_date (str): End date (RFC3339 format)
 
@@ -83,21 +72,13 @@ def fetch_canvas_events(
         dict[str, list[dict[str, Any]]]: Dictionary containing 'assignments' and 'quizzes' lists
             Each list contains dictionaries with title, due_at, course_name, course_id, and html_url
     """
-    import requests
-
-    if course_id:
-        additional_params = f"&context_codes[]=course_{course_id}"
-    else:
-        additional_params = ""
-    url = (
-        f"{canvas_api_url}/api/v1/planner/items?start_date={start_date}&end_date={end_date}"
-        + additional_params
-    )
-    headers = {"Authorization": f"Bearer {canvas_api_key}"}
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        raise RuntimeError(f"Failed to fetch Canvas planner items: {response.text}")
-    planner_items = response.json()
+    context_codes = [f"course_{course_id}"] if course_id else None
+    try:
+        planner_items = await canvas_client.list_planner_items(
+            start_date=start_date, end_date=end_date, context_codes=context_codes
+        )
+    except CanvasApiError as e:
+        raise RuntimeError(f"Failed to fetch Canvas planner items: {e.message}")
     assignments = []
     quizzes = []
     for item in planner_items:
@@ -127,77 +108,91 @@ def fetch_canvas_events(
     return {"assignments": assignments, "quizzes": quizzes}
 
 
-def fetch_canvas_modules_or_files(
-    canvas_api_url: str, canvas_api_key: str, course_id: str, **kwargs
+async def fetch_canvas_modules_or_files(
+    canvas_client: CanvasClient, course_id: str, **kwargs
 ):
     """
     Fetches modules or files from user's Canvas.
 
     Parameters:
-    - canvas_api_url: API URL of Canvas instance
-    - canvas_api_key: User's Canvas API key
+    - canvas_client: Canvas client authenticated as the user
     - course_id: Course ID
-    - kwargs: Additional keyword arguments
+    - kwargs: Additional query parameters
 
     Returns:
     - modules: List of modules
     - files: List of files
     """
-    canvas = Canvas(canvas_api_url, canvas_api_key)
-    course = canvas.get_course(course_id)
-    files = course.get_files(course_id=course_id, **kwargs)
+    try:
+        files = await canvas_client.list_files(course_id, **kwargs)
+    except CanvasApiError:
+        # the files tab is often disabled for students
+        files = []
     if not files:
-        modules = course.get_modules(course_id=course_id, **kwargs)
-        module_items = course.get_module_items(
-            module_id=modules[0].id, **kwargs
+        modules = await canvas_client.list_modules(course_id)
+        if not modules:
+            return []
+        module_items = await canvas_client.list_module_items(
+            course_id, modules[0]["id"]
         )  # TODO: handle multiple modules
         return module_items
     else:
         return files
 
 
-def list_google_calendars(google_credentials: Credentials):
+async def list_google_calendars(calendar_client: GoogleCalendarApi):
     """
     Lists all available Google Calendars for the authenticated user.
 
     Parameters:
-    - google_credentials: User's Google OAuth2 credentials
+    - calendar_client: Google Calendar client authenticated as the user
 
     Returns:
     - list: List of dictionaries containing calendar name and ID
     """
-    service = build("calendar", "v3", credentials=google_credentials)
-    calendar_list = service.calendarList().list().execute()
     calendars = []
 
-    for calendar in calendar_list.get("items", []):
+    for calendar in await calendar_client.list_calendars():
         calendars.append({"name": calendar["summary"], "id": calendar["id"], "access_role": calendar["accessRole"]})
 
     return calendars
 
 
-def add_study_schedule_to_google_calendar(
-    google_credentials: Credentials,
+def google_event_id(*parts: str) -> str:
+    """
+    Deterministic Google Calendar event ID for the given parts.
+
+    Google only accepts base32hex characters (a-v, 0-9) in client supplied IDs.
+    Inserting the same ID twice fails with 409, which makes retries idempotent.
+    """
+    digest = hashlib.sha256("\x1f".join(parts).encode()).digest()
+    return base64.b32hexencode(digest).decode().rstrip("=").lower()
+
+
+async def add_study_schedule_to_google_calendar(
+    calendar_client: GoogleCalendarApi,
     calendar_id: str,
     title: str,
     description: str,
     start_time: str,
     end_time: str,
+    event_id: str | None = None,
 ):
     """
     Adds personal study schedule to Google Calendar.
 
     Parameters:
-    - google_credentials: User's Google OAuth2 credentials
+    - calendar_client: Google Calendar client authenticated as the user
     - title: Event title
     - description: Event description
     - start_time: Start time (RFC3339 format)
     - end_time: End time (RFC3339 format)
+    - event_id: Idempotency key; if an event with this ID already exists it is
+      returned instead of creating a duplicate
 
     Returns:
     - event: Created event information
     """
-    service = build("calendar", "v3", credentials=google_credentials)
     event = {
         "summary": title,
         "description": description,
@@ -210,21 +205,31 @@ def add_study_schedule_to_google_calendar(
             "timeZone": "America/New_York",
         },  # TODO: change to user's timezone
     }
-    created_event = (
-        service.events().insert(calendarId=calendar_id, body=event).execute()
-    )
+    if event_id:
+        event["id"] = event_id
+    try:
+        created_event = await calendar_client.insert_event(calendar_id, event)
+    except GoogleApiError as e:
+        if e.status_code != 409 or not event_id:
+            raise
+        # an earlier attempt already created it
+        created_event = await calendar_client.get_event(calendar_id, event_id)
+        if created_event.get("status") == "cancelled":
+            created_event = await calendar_client.update_event(
+                calendar_id, event_id, {**event, "status": "confirmed"}
+            )
     return {
         "id": created_event["id"],
         "title": created_event["summary"],
-        "description": created_event["description"],
+        "description": created_event.get("description"),
         "html_link": created_event["htmlLink"],
         "start": created_event["start"]["dateTime"],
         "end": created_event["end"]["dateTime"],
     }
 
 
-def list_google_calendar_events(
-    google_credentials: Credentials,
+async def list_google_calendar_events(
+    calendar_client: GoogleCalendarApi,
     calendar_id: str,
     start_date: str,
     end_date: str,
@@ -234,7 +239,7 @@ def list_google_calendar_events(
     Lists all events from a specific Google Calendar.
 
     Parameters:
-    - google_credentials: User's Google OAuth2 credentials
+    - calendar_client: Google Calendar client authenticated as the user
     - calendar_id: Calendar ID
     - start_date: Start date (RFC3339 format)
     - end_date: End date (RFC3339 format)
@@ -245,28 +250,20 @@ def list_google_calendar_events(
     """
     if not kwargs:
         kwargs = {"timeMin": start_date, "timeMax": end_date}
-    service = build("calendar", "v3", credentials=google_credentials)
-    events = service.events().list(calendarId=calendar_id, **kwargs).execute()
-    return events
+    return await calendar_client.list_events(calendar_id, **kwargs)
 
 
-def get_google_calendar_event(
-    google_credentials: Credentials,
+async def get_google_calendar_event(
+    calendar_client: GoogleCalendarApi,
     calendar_id: str,
     event_id: str,
     **kwargs,
 ):
-    service = build("calendar", "v3", credentials=google_credentials)
-    event = (
-        service.events()
-        .get(calendarId=calendar_id, eventId=event_id, **kwargs)
-        .execute()
-    )
-    return event
+    return await calendar_client.get_event(calendar_id, event_id, **kwargs)
 
 
-def set_event_reminder(
-    google_credentials: Credentials,
+async def set_event_reminder(
+    calendar_client: GoogleCalendarApi,
     calendar_id: str,
     event_id: str,
     reminder_minutes: int,
@@ -275,24 +272,19 @@ def set_event_reminder(
     Sets a reminder for Google Calendar event.
 
     Parameters:
-    - google_credentials: User's Google OAuth2 credentials
+    - calendar_client: Google Calendar client authenticated as the user
     - event_id: Event ID
     - reminder_minutes: Reminder time (in minutes)
 
     Returns:
     - updated_event: Updated event information
     """
-    service = build("calendar", "v3", credentials=google_credentials)
-    event = service.events().get(calendarId=calendar_id, eventId=event_id).execute()
+    event = await calendar_client.get_event(calendar_id, event_id)
     event["reminders"] = {
         "useDefault": False,
         "overrides": [{"method": "popup", "minutes": reminder_minutes}],
     }
-    updated_event = (
-        service.events()
-        .update(calendarId=calendar_id, eventId=event_id, body=event)
-        .execute()
-    )
+    updated_event = await calendar_client.update_event(calendar_id, event_id, event)
     return {
         "id": updated_event["id"],
         "html_link": updated_event["htmlLink"],
@@ -300,32 +292,27 @@ def set_event_reminder(
     }
 
 
-def fetch_study_progress(
-    canvas_api_url: str, canvas_api_key: str, course_id: str, user_id: str
-):
+async def fetch_study_progress(canvas_client: CanvasClient, course_id: str):
     """
     Fetches user's learning progress and performance from Canvas.
 
     Parameters:
-    - canvas_api_url: API URL of Canvas instance
-    - canvas_api_key: User's Canvas API key
+    - canvas_client: Canvas client authenticated as the user
     - course_id: Course ID
-    - user_id: User ID
 
     Returns:
     - progress: Learning progress and performance information
     """
-    canvas = Canvas(canvas_api_url, canvas_api_key)
-    course = canvas.get_course(course_id)
-    user = canvas.get_user(user_id)
-    enrollments = user.get_enrollments(course_id=course.id)
+    course = await canvas_client.get_course(course_id)
+    enrollments = await canvas_client.list_enrollments(course_id, user_id="self")
     progress = []
     for enrollment in enrollments:
+        grades = enrollment.get("grades", {})
         progress.append(
             {
-                "course_name": course.name,
-                "current_score": enrollment.grades["current_score"],
-                "final_score": enrollment.grades["final_score"],
+                "course_name": course["name"],
+                "current_score": grades.get("current_score"),
+                "final_score": grades.get("final_score"),
             }
         )
     return progress
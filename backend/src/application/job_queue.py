@@ -0,0 +1,141 @@
+# durable job queue on top of the job table, consumed by src/worker.py
+from datetime import timedelta
+from typing import Any
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import Job, JobStatus, JobType
+from src.settings import settings
+
+
+def retry_delay(attempts: int, backoff: float = settings.job_retry_backoff) -> float:
+    """Seconds to wait before retrying a job that has failed ``attempts`` times."""
+    return backoff * 2 ** max(attempts - 1, 0)
+
+
+async def enqueue_job(
+    db_session: AsyncSession,
+    job_type: JobType,
+    user_id: Any,
+    payload: dict[str, Any] | None = None,
+) -> Job:
+    job = Job(
+        type=job_type,
+        status=JobStatus.PENDING,
+        user_id=user_id,
+        payload=payload,
+        max_attempts=settings.job_max_attempts,
+    )
+    db_session.add(job)
+    await db_session.commit()
+    await db_session.refresh(job)
+    return job
+
+
+def claim_statement(worker_id: str, limit: int):
+    # SKIP LOCKED lets any number of workers poll without handing out a job twice
+    claimable = (
+        select(Job.id)
+        .where(Job.status == JobStatus.PENDING, Job.run_at <= func.now())
+        .order_by(Job.run_at, Job.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        update(Job)
+        .where(Job.id.in_(claimable.scalar_subquery()))
+        .values(
+            status=JobStatus.IN_PROGRESS,
+            attempts=Job.attempts + 1,
+            locked_by=worker_id,
+            heartbeat_at=func.now(),
+        )
+        .returning(Job)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def claim_jobs(db_session: AsyncSession, worker_id: str, limit: int) -> list[Job]:
+    """Atomically move up to ``limit`` due jobs to IN_PROGRESS for this worker."""
+    if limit <= 0:
+        return []
+    result = await db_session.execute(claim_statement(worker_id, limit))
+    jobs = list(result.scalars().all())
+    await db_session.commit()
+    return jobs
+
+
+async def heartbeat(db_session: AsyncSession, job_id: int, worker_id: str) -> bool:
+    """Mark the job as alive; returns False if the worker no longer owns it."""
+    result = await db_session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.locked_by == worker_id)
+        .values(heartbeat_at=func.now())
+    )
+    await db_session.commit()
+    return result.rowcount > 0
+
+
+async def complete_job(
+    db_session: AsyncSession, job_id: int, worker_id: str, result: dict[str, Any] | None
+) -> None:
+    await db_session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.locked_by == worker_id)
+        .values(
+            status=JobStatus.COMPLETED,
+            result=result,
+            error_message=None,
+            locked_by=None,
+            heartbeat_at=None,
+        )
+    )
+    await db_session.commit()
+
+
+async def fail_job(db_session: AsyncSession, job: Job, worker_id: str, error: str) -> None:
+    """Schedule a retry with exponential backoff, or give up after ``max_attempts``."""
+    if job.attempts >= job.max_attempts:
+        values: dict[str, Any] = {"status": JobStatus.FAILED}
+    else:
+        delay = timedelta(seconds=retry_delay(job.attempts))
+        values = {"status": JobStatus.PENDING, "run_at": func.now() + delay}
+
+    await db_session.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.locked_by == worker_id)
+        .values(**values, error_message=error, locked_by=None, heartbeat_at=None)
+    )
+    await db_session.commit()
+
+
+async def recover_stale_jobs(
+    db_session: AsyncSession, stale_after: float = settings.job_stale_after
+) -> int:
+    """Requeue (or fail) IN_PROGRESS jobs whose worker stopped sending heartbeats."""
+    is_stale = (Job.status == JobStatus.IN_PROGRESS) & (
+        Job.heartbeat_at < func.now() - timedelta(seconds=stale_after)
+    )
+    exhausted = await db_session.execute(
+        update(Job)
+        .where(is_stale, Job.attempts >= Job.max_attempts)
+        .values(
+            status=JobStatus.FAILED,
+            error_message="Worker stopped responding",
+            locked_by=None,
+            heartbeat_at=None,
+        )
+    )
+    requeued = await db_session.execute(
+        update(Job)
+        .where(is_stale, Job.attempts < Job.max_attempts)
+        .values(
+            status=JobStatus.PENDING,
+            run_at=func.now(),
+            locked_by=None,
+            heartbeat_at=None,
+        )
+    )
+    await db_session.commit()
+    return exhausted.rowcount + requeued.rowcount
@@ -1,125 +1,281 @@
-from canvasapi import Canvas
-from PyPDF2 import PdfReader
-from sqlalchemy import func
+import asyncio
+from collections import defaultdict
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import delete, func, select
 from sqlalchemy.dialects.postgresql import insert
 
+from src.application.canvas_cache import get_canvas_cache
+from src.application.job_queue import enqueue_job
 from src.database.models import (
     Course,
     CourseMaterial,
     CourseMaterialType,
     CourseMembership,
+    CourseSyncState,
+    Integration,
+    Job,
+    JobType,
     MaterialDocument,
 )
-from src.deps import AsyncDBSession
+from src.deps import AsyncDBSession, CanvasApiError, CanvasClient, get_canvas_client
 
 
-def get_course_list(canvas_api_url: str, canvas_api_key: str):
-    canvas = Canvas(canvas_api_url, canvas_api_key)
-    courses = canvas.get_courses(
+async def get_course_list(canvas_client: CanvasClient):
+    return await canvas_client.list_courses(
         enrollment_state="active",
         enrollment_type="student",
         enrollment_role="StudentEnrollment",
         state="available",
     )
-    return courses
 
 
-def get_course_details(canvas_api_url: str, canvas_api_key: str, course_id: str):
-    canvas = Canvas(canvas_api_url, canvas_api_key)
-    course = canvas.get_course(
+async def get_course_details(canvas_client: CanvasClient, course_id: str):
+    return await canvas_client.get_course(
         course_id, include=["syllabus_body", "course_image", "teachers"]
     )
-    return course
-
 
-def get_course_enrollments(canvas_api_url: str, canvas_api_key: str, course_id: str):
-    import requests
 
-    response = requests.get(
-        f"{canvas_api_url}/api/v1/courses/{course_id}/enrollments?type[]=TeacherEnrollment",
-        headers={"Authorization": f"Bearer {canvas_api_key}"},
+async def get_course_enrollments(canvas_client: CanvasClient, course_id: str):
+    return await canvas_client.list_enrollments(
+        course_id, **{"type[]": "TeacherEnrollment"}
     )
-    return response.json()
 
 
-def get_course_files(canvas_api_url: str, canvas_api_key: str, course_id: str):
-    import requests
+async def get_course_files(
+    canvas_client: CanvasClient, course_id: str, etag: str | None = None
+):
+    try:
+        return await canvas_client.get_all_if_modified(
+            f"/api/v1/courses/{course_id}/files", etag=etag
+        )
+    except CanvasApiError:
+        return [], None
 
-    response = requests.get(
-        f"{canvas_api_url}/api/v1/courses/{course_id}/files",
-        headers={"Authorization": f"Bearer {canvas_api_key}"},
-    )
-    if response.status_code != 200:
-        return []
-    return response.json()
 
+async def get_course_modules(
+    canvas_client: CanvasClient, course_id: str, etag: str | None = None
+):
+    # students get 401/403 on courses whose modules tab is hidden
+    try:
+        return await canvas_client.get_all_if_modified(
+            f"/api/v1/courses/{course_id}/modules", etag=etag
+        )
+    except CanvasApiError:
+        return [], None
+
+
+async def get_course_module_items(
+    canvas_client: CanvasClient, course_id: str, module_id: str
+):
+    try:
+        return await canvas_client.list_module_items(course_id, module_id)
+    except CanvasApiError:
+        return []
 
-def get_course_modules(canvas_api_url: str, canvas_api_key: str, course_id: str):
-    import requests
 
-    response = requests.get(
-        f"{canvas_api_url}/api/v1/courses/{course_id}/modules",
-        headers={"Authorization": f"Bearer {canvas_api_key}"},
+async def get_course_file_url(canvas_client: CanvasClient, course_id: str, file_id: str):
+    try:
+        return await canvas_client.get_file(course_id, file_id)
+    except CanvasApiError as e:
+        return {"errors": [{"message": e.message}]}
+
+
+def _material_type(name: str) -> CourseMaterialType:
+    return CourseMaterialType.PDF if name.endswith(".pdf") else CourseMaterialType.URL
+
+
+def _parse_canvas_datetime(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+async def fetch_course_content(
+    canvas_client: CanvasClient,
+    canvas_course_id: int,
+    sync_state: CourseSyncState | None = None,
+    known_canvas_ids: set[str] | None = None,
+) -> dict[str, Any]:
+    """Fetch a course's details and the files that changed since the last sync.
+
+    Details, files and modules are requested together, then module items and
+    file lookups fan out. Concurrency is bounded by the client's per-token
+    semaphore.
+
+    The files and modules listings are conditional on the ETags stored in
+    ``sync_state``; files are only reported if their ``updated_at`` is newer
+    than the stored watermark, and files already in ``known_canvas_ids`` (or
+    referenced by more than one module item) are never looked up again.
+    """
+    known_canvas_ids = known_canvas_ids or set()
+    watermark = sync_state.watermark if sync_state else None
+    (details, (files, files_etag), (modules, modules_etag)) = await asyncio.gather(
+        get_course_details(canvas_client, canvas_course_id),
+        get_course_files(
+            canvas_client, canvas_course_id, sync_state and sync_state.files_etag
+        ),
+        get_course_modules(
+            canvas_client, canvas_course_id, sync_state and sync_state.modules_etag
+        ),
+    )
+    module_items_by_module = await asyncio.gather(
+        *(
+            get_course_module_items(canvas_client, canvas_course_id, module["id"])
+            for module in modules or []
+        )
     )
-    return response.json()
 
+    materials = []
+    # known files that changed since the last sync, whose documents are stale
+    changed_canvas_ids = []
+    skipped = 0
+    new_watermark = watermark
+    for file in files or []:
+        updated_at = _parse_canvas_datetime(file.get("updated_at"))
+        if updated_at and (new_watermark is None or updated_at > new_watermark):
+            new_watermark = updated_at
+
+        is_known = f"file_{file['id']}" in known_canvas_ids
+        if is_known and watermark and updated_at:
+            if updated_at <= watermark:
+                skipped += 1
+                continue
+            changed_canvas_ids.append(f"file_{file['id']}")
 
-def get_course_module_items(
-    canvas_api_url: str, canvas_api_key: str, course_id: str, module_id: str
-):
-    import requests
+        materials.append(
+            {
+                "type": _material_type(file["display_name"]),
+                "url": file.get("url"),
+                "name": file["display_name"],
+                "canvas_id": f"file_{file['id']}",
+            }
+        )
+
+    listed_file_ids = {file["id"] for file in files or []}
+    pending_module_items = {}
+    for module_items in module_items_by_module:
+        for module_item in module_items:
+            content_id = module_item.get("content_id")
+            if not content_id or module_item.get("type", "File") != "File":
+                continue
+            if content_id in listed_file_ids or content_id in pending_module_items:
+                continue
+            if f"file_{content_id}" in known_canvas_ids:
+                skipped += 1
+                continue
+            pending_module_items[content_id] = module_item
 
-    response = requests.get(
-        f"{canvas_api_url}/api/v1/courses/{course_id}/modules/{module_id}/items",
-        headers={"Authorization": f"Bearer {canvas_api_key}"},
+    module_files = await asyncio.gather(
+        *(
+            get_course_file_url(canvas_client, canvas_course_id, content_id)
+            for content_id in pending_module_items
+        )
     )
-    return response.json()
+    for module_item, file in zip(pending_module_items.values(), module_files):
+        if file.get("errors"):
+            continue
 
+        if not all([file.get("url"), file.get("display_name"), file.get("id")]):
+            continue
 
-def get_course_file_url(
-    canvas_api_url: str, canvas_api_key: str, course_id: str, file_id: str
-):
-    import requests
+        materials.append(
+            {
+                "type": _material_type(module_item["title"]),
+                "url": file.get("url"),
+                "name": file.get("display_name"),
+                "canvas_id": f"file_{file.get('id')}",
+            }
+        )
 
-    response = requests.get(
-        f"{canvas_api_url}/api/v1/courses/{course_id}/files/{file_id}",
-        headers={"Authorization": f"Bearer {canvas_api_key}"},
-    )
-    return response.json()
+    is_unchanged = files is None and modules is None
+    if is_unchanged:
+        skipped = len(known_canvas_ids)
+
+    return {
+        "canvas_id": canvas_course_id,
+        "details": details,
+        "materials": materials,
+        "changed_canvas_ids": changed_canvas_ids,
+        "skipped": skipped,
+        "is_unchanged": is_unchanged,
+        "files_etag": files_etag,
+        "modules_etag": modules_etag,
+        "watermark": new_watermark,
+    }
 
 
 async def extract_course_content(
-    canvas_api_url: str,
-    canvas_api_key: str,
+    canvas_client: CanvasClient,
     db_session: AsyncDBSession,
     user_id: str,
-):
-    course_list = get_course_list(canvas_api_url, canvas_api_key)
-
-    for course in course_list:
-        details = get_course_details(canvas_api_url, canvas_api_key, course.id)
-        instructors = details.teachers[0]["display_name"]
-        files = get_course_files(canvas_api_url, canvas_api_key, course.id)
-        all_module_items = []
-        modules = get_course_modules(canvas_api_url, canvas_api_key, course.id)
-        for module in modules:
-            module_items = get_course_module_items(
-                canvas_api_url, canvas_api_key, course.id, module["id"]
+) -> dict[str, int]:
+    """Sync the user's Canvas courses and their materials incrementally.
+
+    Returns counts of courses and materials that were updated versus skipped
+    because Canvas reported no change since the last sync. Files that changed
+    lose their documents and a COURSE_MATERIAL_SYNC job re-embeds them.
+    """
+    course_list = await get_course_list(canvas_client)
+    canvas_course_ids = [canvas_course["id"] for canvas_course in course_list]
+
+    result = await db_session.execute(
+        select(Course.canvas_id, CourseSyncState)
+        .join(CourseSyncState, CourseSyncState.course_id == Course.id)
+        .where(
+            CourseSyncState.user_id == user_id,
+            Course.canvas_id.in_(canvas_course_ids),
+        )
+    )
+    sync_states = {canvas_id: sync_state for canvas_id, sync_state in result.all()}
+
+    result = await db_session.execute(
+        select(Course.canvas_id, CourseMaterial.canvas_id)
+        .join(CourseMaterial, CourseMaterial.course_id == Course.id)
+        .where(Course.canvas_id.in_(canvas_course_ids))
+    )
+    known_canvas_ids = defaultdict(set)
+    for canvas_course_id, material_canvas_id in result.all():
+        known_canvas_ids[canvas_course_id].add(material_canvas_id)
+
+    course_contents = await asyncio.gather(
+        *(
+            fetch_course_content(
+                canvas_client,
+                canvas_course_id,
+                sync_states.get(canvas_course_id),
+                known_canvas_ids[canvas_course_id],
             )
-            all_module_items.extend(module_items)
+            for canvas_course_id in canvas_course_ids
+        )
+    )
+
+    stats = {
+        "courses_updated": 0,
+        "courses_skipped": 0,
+        "materials_updated": 0,
+        "materials_skipped": 0,
+    }
+    for course_content in course_contents:
+        canvas_course_id = course_content["canvas_id"]
+        details = course_content["details"]
+        teachers = details.get("teachers") or [{"display_name": None}]
+        instructors = teachers[0]["display_name"]
+        stats["materials_skipped"] += course_content["skipped"]
 
         stmt = insert(Course).values(
-            name=details.name,
+            name=details["name"],
             instructor=instructors,
-            code=details.course_code,
-            canvas_id=course.id,
+            code=details["course_code"],
+            canvas_id=canvas_course_id,
         )
         stmt = stmt.on_conflict_do_update(
             index_elements=[Course.name],
             set_=dict(
                 instructor=instructors,
-                code=details.course_code,
-                canvas_id=course.id,
+                code=details["course_code"],
+                canvas_id=canvas_course_id,
                 updated_at=func.now(),
             ),
         )
@@ -129,61 +285,42 @@ async def extract_course_content(
         if not course:
             raise Exception("Course not found")
 
-        stmt = insert(CourseMembership).values(course_id=course.id, user_id=user_id)
-        stmt = stmt.on_conflict_do_nothing()
-        stmt = stmt.returning(CourseMembership)
-        result = await db_session.execute(stmt)
-        course_membership = result.scalar_one_or_none()
-        if not course_membership:
-            continue
-
-        course_materials = []
-        for file in files:
-            course_material_type = (
-                CourseMaterialType.PDF
-                if file["display_name"].endswith(".pdf")
-                else CourseMaterialType.URL
-            )
-            url = file.get("url")
-            course_material = {
-                "course_id": course.id,
-                "type": course_material_type,
-                "url": url,
-                "name": file["display_name"],
-                "canvas_id": f"file_{file['id']}",
-            }
-            course_materials.append(course_material)
-
-        for module_item in all_module_items:
-            course_material_type = (
-                CourseMaterialType.PDF
-                if module_item["title"].endswith(".pdf")
-                else CourseMaterialType.URL
-            )
-            content_id = module_item.get("content_id")
-            if not content_id:
-                continue
-
-            file = get_course_file_url(
-                canvas_api_url, canvas_api_key, course.canvas_id, content_id
+        result = await db_session.execute(
+            select(CourseMembership.id).where(
+                CourseMembership.course_id == course.id,
+                CourseMembership.user_id == user_id,
             )
-            if file.get("errors"):
-                continue
-
-            if not bool([file.get("url"), file.get("display_name"), file.get("id")]):
-                continue
+        )
+        if result.scalar_one_or_none() is None:
+            db_session.add(CourseMembership(course_id=course.id, user_id=user_id))
+
+        stmt = insert(CourseSyncState).values(
+            user_id=user_id,
+            course_id=course.id,
+            files_etag=course_content["files_etag"],
+            modules_etag=course_content["modules_etag"],
+            watermark=course_content["watermark"],
+            synced_at=func.now(),
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint="unique_course_sync_state_user_course",
+            set_=dict(
+                files_etag=stmt.excluded.files_etag,
+                modules_etag=stmt.excluded.modules_etag,
+                watermark=stmt.excluded.watermark,
+                synced_at=func.now(),
+            ),
+        )
+        await db_session.execute(stmt)
 
-            course_material = {
-                "course_id": course.id,
-                "type": course_material_type,
-                "url": file.get("url"),
-                "name": file.get("display_name"),
-                "canvas_id": f"file_{file.get('id')}",
-            }
-            course_materials.append(course_material)
+        course_materials = [
+            {"course_id": course.id, **material}
+            for material in course_content["materials"]
+        ]
 
-        # upsert course and course materials
-        if not course_materials:
+        if course_content["is_unchanged"] or not course_materials:
+            stats["courses_skipped"] += 1
+            await db_session.commit()
             continue
 
         # make sure course_materials are unique
@@ -204,53 +341,59 @@ async def extract_course_content(
                 updated_at=func.now(),
             ),
         )
-        stmt = stmt.returning(CourseMaterial)
-        result = await db_session.execute(stmt)
-        course_materials = result.scalars().all()
+        await db_session.execute(stmt)
+
+        changed_canvas_ids = course_content["changed_canvas_ids"]
+        if changed_canvas_ids:
+            # drop the chunks of the old versions, so they are embedded again
+            await db_session.execute(
+                delete(MaterialDocument).where(
+                    MaterialDocument.course_material_id.in_(
+                        select(CourseMaterial.id).where(
+                            CourseMaterial.course_id == course.id,
+                            CourseMaterial.canvas_id.in_(changed_canvas_ids),
+                        )
+                    )
+                )
+            )
         await db_session.commit()
+        if changed_canvas_ids:
+            await enqueue_job(
+                db_session,
+                JobType.COURSE_MATERIAL_SYNC,
+                user_id,
+                payload={"course_id": course.id},
+            )
+        stats["courses_updated"] += 1
+        stats["materials_updated"] += len(course_materials)
+
+    return stats
 
 
 async def process_course_materials(
     course_materials: list[CourseMaterial],
     db_session: AsyncDBSession,
-):
+) -> dict[str, int]:
     """Process course materials by extracting text, chunking, and generating embeddings"""
-    import io
-
-    import nltk
-    import requests
+    import tempfile
 
+    from src.application.chunking import get_chunker
+    from src.application.embeddings import BatchEmbedder, PostgresEmbeddingCache
     from src.application.openai import aclient
+    from src.application.pdf import download_pdf, iter_pdf_pages
+    from src.deps import get_resources
+    from src.settings import settings
 
-    client = await aclient()
-    nltk.download("punkt_tab")
-
-    def chunk_text(text: str, chunk_size: int = 1000) -> list[str]:
-        """Split text into chunks at sentence boundaries"""
-        sentences = nltk.sent_tokenize(text)
-        chunks = []
-        current_chunk = []
-        current_size = 0
-
-        for sentence in sentences:
-            sentence_size = len(sentence)
-            if current_size + sentence_size > chunk_size and current_chunk:
-                chunks.append(" ".join(current_chunk))
-                current_chunk = []
-                current_size = 0
-            current_chunk.append(sentence)
-            current_size += sentence_size
-
-        if current_chunk:
-            chunks.append(" ".join(current_chunk))
-        return chunks
-
-    async def generate_embedding(text: str):
-        """Generate embedding using OpenAI API"""
-        response = await client.embeddings.create(
-            model="text-embedding-ada-002", input=text
-        )
-        return response.data[0].embedding
+    embedding_cache = PostgresEmbeddingCache(db_session, settings.embedding_model)
+    embedder = BatchEmbedder(await aclient(), cache=embedding_cache)
+    chunker = get_chunker()
+    stats = {"materials_processed": 0, "materials_failed": 0, "documents_created": 0}
+
+    # a failed material is rolled back, which would expire the materials still
+    # to process; detached, they keep their loaded values
+    for material in course_materials:
+        if material in db_session:
+            db_session.expunge(material)
 
     for material in course_materials:
         if not material.name.lower().endswith(".pdf"):
@@ -258,42 +401,92 @@ async def process_course_materials(
             continue
 
         try:
-            # Download PDF
-            response = requests.get(material.url)
-            pdf_file = io.BytesIO(response.content)
-
-            # Extract text
-            reader = PdfReader(pdf_file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text()
-
-            # Chunk text
-            chunks = chunk_text(text)
-
-            # Generate embeddings and store documents
-            for index, chunk in enumerate(chunks):
-                embedding = await generate_embedding(chunk)
-                document = MaterialDocument(
-                    content=chunk,
-                    meta_data={
+            # Stream the PDF to disk and extract text in the pdf worker pool
+            with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+                await download_pdf(get_resources().canvas_http, material.url, pdf_file)
+                pages = [
+                    (index + 1, text)
+                    async for index, text in iter_pdf_pages(pdf_file.name)
+                ]
+
+            # Chunk by tokens, off the event loop
+            chunks = await asyncio.to_thread(lambda: list(chunker.chunk_pages(pages)))
+            if not chunks:
+                continue
+
+            # Generate embeddings in batches and store documents in one insert
+            embeddings = await embedder.embed([chunk.text for chunk in chunks])
+            documents = [
+                {
+                    "content": chunk.text,
+                    "meta_data": {
                         "course_id": material.course_id,
                         "course_material_id": material.id,
                         "source": material.url,
                         "name": material.name,
                         "index": index,
                         "total_chunks": len(chunks),
+                        "page_start": chunk.first_page,
+                        "page_end": chunk.last_page,
+                        "heading": chunk.heading,
                     },
-                    embedding=embedding,
-                )
-                db_session.add(document)
-
+                    "embedding": embedding,
+                    "course_id": material.course_id,
+                    "course_material_id": material.id,
+                }
+                for index, (chunk, embedding) in enumerate(zip(chunks, embeddings))
+            ]
+            await db_session.execute(insert(MaterialDocument), documents)
             await db_session.commit()
+            stats["materials_processed"] += 1
+            stats["documents_created"] += len(documents)
 
         except Exception as e:
             print(f"Error processing {material.url}: {str(e)}")
+            # the session is unusable until the failed transaction is rolled back
+            await db_session.rollback()
+            stats["materials_failed"] += 1
             continue
 
+    return {**stats, **embedding_cache.stats()}
+
+
+async def run_course_sync(db_session: AsyncDBSession, job: Job) -> dict[str, int]:
+    """COURSE_SYNC job: pull the user's Canvas courses and materials."""
+    stmt = select(Integration).where(
+        Integration.user_id == job.user_id, Integration.type == "canvas"
+    )
+    result = await db_session.execute(stmt)
+    integration = result.scalar_one_or_none()
+    if not integration or not integration.token:
+        raise ValueError("Canvas integration not found")
+
+    sync_result = await extract_course_content(
+        canvas_client=get_canvas_client(integration.token),
+        db_session=db_session,
+        user_id=str(job.user_id),
+    )
+    # courses and assignments may have changed, drop the user's cached responses
+    await get_canvas_cache().invalidate(str(job.user_id))
+    return sync_result
+
+
+async def run_process_course_materials(
+    db_session: AsyncDBSession, job: Job
+) -> dict[str, int]:
+    """COURSE_MATERIAL_SYNC job: embed the course's PDFs that have no documents yet."""
+    stmt = select(CourseMaterial).where(
+        CourseMaterial.course_id == job.payload["course_id"],
+        CourseMaterial.type == CourseMaterialType.PDF,
+        ~CourseMaterial.documents.any(),
+    )
+    result = await db_session.execute(stmt)
+    course_materials = list(result.scalars().all())
+    return await process_course_materials(
+        course_materials=course_materials,
+        db_session=db_session,
+    )
+
 
 if __name__ == "__main__":
     import asyncio
@@ -308,8 +501,7 @@ if __name__ == "__main__":
     async def main():
         async with async_session() as session:
             await extract_course_content(
-                canvas_api_url=settings.canvas_api_url,
-                canvas_api_key=settings.canvas_api_token,
+                canvas_client=CanvasClient(settings),
                 db_session=session,
                 user_id="",
             )
@@ -0,0 +1,52 @@
+# postgres LISTEN/NOTIFY, used to keep per-process caches in sync across workers
+import asyncio
+from typing import Callable, Optional
+
+import asyncpg
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.settings import settings
+
+NotifyCallback = Callable[[asyncpg.Connection, int, str, str], None]
+
+
+async def listen_forever(
+    channel: str,
+    callback: NotifyCallback,
+    on_connect: Optional[Callable[[], None]] = None,
+    retry_after: float = 5,
+) -> None:
+    """Call ``callback`` for every NOTIFY on ``channel`` until cancelled.
+
+    Reconnects after ``retry_after`` seconds when the connection drops.
+    ``on_connect`` runs once listening, e.g. to clear a cache that missed the
+    notifications sent while we were not listening.
+    """
+    dsn = make_url(settings.database_url).set(drivername="postgresql")
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(
+                dsn.render_as_string(hide_password=False)
+            )
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda _: closed.set())
+            await connection.add_listener(channel, callback)
+            if on_connect is not None:
+                on_connect()
+            await closed.wait()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Listener on {channel} failed: {str(e)}")
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        await asyncio.sleep(retry_after)
+
+
+async def notify(engine: AsyncEngine, channel: str, payload: str) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(select(func.pg_notify(channel, payload)))
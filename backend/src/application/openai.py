@@ -17,15 +17,14 @@ from src.application.usecase_v2 import (
     list_tasks,
     sync_to_google_calendar,
 )
-from src.deps import Container
-from src.settings import settings
+from src.deps import Container, get_resources
 
 
 async def aclient():
-    return AsyncOpenAI(api_key=settings.openai_api_key)
+    return get_resources().async_openai_client
 
 def client():
-    return OpenAI(api_key=settings.openai_api_key)
+    return get_resources().openai_client
 
 # Dictionary to store chat history for each user
 user_chat_histories = {}
@@ -0,0 +1,156 @@
+# pdf text extraction in a process pool, off the event loop
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import IO, AsyncIterator
+
+import httpx
+from PyPDF2 import PdfReader
+
+from src.settings import settings
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+
+class PdfExtractionError(Exception):
+    """Raised when a PDF cannot be parsed within the configured limits."""
+
+
+def _limit_worker_memory(max_memory_mb: int) -> None:
+    if resource is None or max_memory_mb <= 0:
+        return
+    max_bytes = max_memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (max_bytes, max_bytes))
+
+
+def count_pages(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def extract_pages(path: str, start: int, stop: int) -> list[str]:
+    reader = PdfReader(path)
+    return [reader.pages[index].extract_text() or "" for index in range(start, stop)]
+
+
+async def download_pdf(
+    client: httpx.AsyncClient,
+    url: str,
+    file: IO[bytes],
+    max_bytes: int = settings.pdf_max_download_mb * 1024 * 1024,
+) -> int:
+    """Stream ``url`` into ``file`` chunk by chunk and return the bytes written.
+
+    The body is never held in memory as a whole; files larger than
+    ``max_bytes`` raise ``PdfExtractionError`` before or while downloading.
+    """
+    written = 0
+    async with client.stream("GET", url, follow_redirects=True) as response:
+        response.raise_for_status()
+        content_length = response.headers.get("content-length")
+        if content_length is not None and int(content_length) > max_bytes:
+            raise PdfExtractionError(f"{url} is larger than {max_bytes} bytes")
+        async for chunk in response.aiter_bytes():
+            written += len(chunk)
+            if written > max_bytes:
+                raise PdfExtractionError(f"{url} is larger than {max_bytes} bytes")
+            file.write(chunk)
+    file.flush()
+    return written
+
+
+# executors of the files being parsed; each file gets its own worker process
+_executors: set[ProcessPoolExecutor] = set()
+_slots: asyncio.Semaphore | None = None
+
+
+def new_pdf_executor() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=1,
+        # spawn, not fork: the parent runs an event loop and threads
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_limit_worker_memory,
+        initargs=(settings.pdf_max_memory_mb,),
+    )
+
+
+def pdf_slots() -> asyncio.Semaphore:
+    """Bounds the files parsed at once, and so the worker processes."""
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(settings.pdf_max_workers)
+    return _slots
+
+
+def kill_executor(executor: ProcessPoolExecutor) -> None:
+    for process in list(getattr(executor, "_processes", {}).values()):
+        process.kill()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pdf_executor(kill: bool = False) -> None:
+    """Stop the workers of files still being parsed, e.g. on shutdown."""
+    for executor in list(_executors):
+        if kill:
+            kill_executor(executor)
+        else:
+            executor.shutdown(wait=True, cancel_futures=True)
+    _executors.clear()
+
+
+async def iter_pdf_pages(
+    path: str,
+    timeout: float = settings.pdf_timeout,
+    pages_per_task: int = settings.pdf_pages_per_task,
+) -> AsyncIterator[tuple[int, str]]:
+    """Yield ``(page_number, text)`` for a PDF on disk, in page order.
+
+    The file is parsed in a worker process of its own, in ranges of
+    ``pages_per_task`` pages, and each range is yielded as soon as it is done.
+    A file that takes longer than ``timeout`` seconds overall, or that
+    crashes its worker (e.g. by hitting the memory cap), raises
+    ``PdfExtractionError``; only that file's worker is killed, so files
+    parsed at the same time are not affected.
+    """
+    async with pdf_slots():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        executor = new_pdf_executor()
+        _executors.add(executor)
+        futures: list[asyncio.Future] = []
+        try:
+            n_pages = await asyncio.wait_for(
+                loop.run_in_executor(executor, count_pages, path), timeout
+            )
+            starts = range(0, n_pages, pages_per_task)
+            futures = [
+                loop.run_in_executor(
+                    executor,
+                    extract_pages,
+                    path,
+                    start,
+                    min(start + pages_per_task, n_pages),
+                )
+                for start in starts
+            ]
+            for start, future in zip(starts, futures):
+                pages = await asyncio.wait_for(future, max(deadline - loop.time(), 0))
+                for offset, text in enumerate(pages):
+                    yield start + offset, text
+        except asyncio.TimeoutError:
+            kill_executor(executor)
+            raise PdfExtractionError(f"Timed out after {timeout}s parsing {path}")
+        except BrokenProcessPool as e:
+            kill_executor(executor)
+            raise PdfExtractionError(f"PDF worker crashed parsing {path}: {e!r}")
+        except MemoryError:
+            raise PdfExtractionError(f"Memory cap exceeded parsing {path}")
+        finally:
+            for future in futures:
+                future.cancel()
+            # the worker exits once its current task, if any, is done
+            executor.shutdown(wait=False, cancel_futures=True)
+            _executors.discard(executor)
@@ -0,0 +1,188 @@
+# caches in front of the material retriever: query embeddings, and the top-k
+# documents of recent, near-identical queries
+import asyncio
+import re
+from functools import lru_cache
+from typing import Hashable, Optional
+
+import numpy as np
+from openai import AsyncOpenAI
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.application.embeddings import (
+    PostgresEmbeddingCache,
+    content_hash,
+    normalize_text,
+)
+from src.cache import TTLCache
+from src.settings import settings
+
+
+def normalize_query(query: str) -> str:
+    """Casefolded, whitespace-normalized query without trailing punctuation."""
+    return normalize_text(query).casefold().rstrip("?!. ")
+
+
+def exact_terms(query: str) -> frozenset[str]:
+    """Numbers and quoted phrases, which must match exactly rather than closely.
+
+    Embeddings of "problem set 4" and "problem set 5" are nearly identical, but
+    they are different questions.
+    """
+    text = normalize_query(query)
+    quoted = re.findall(r'["“”]([^"“”]+)["“”]', text)
+    return frozenset(re.findall(r"\d+(?:\.\d+)?", text) + quoted)
+
+
+class QueryEmbeddingCache:
+    """LRU/TTL cache of query embeddings keyed by model and normalized query.
+
+    With a ``session_factory`` misses fall through to the ``embedding_cache``
+    table before calling OpenAI, so embeddings survive restarts and are shared
+    by every worker. Concurrent misses for the same query share one request.
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[async_sessionmaker[AsyncSession]] = None,
+        model: str = settings.embedding_model,
+        max_size: int = settings.query_embedding_cache_size,
+        ttl: float = settings.query_embedding_cache_ttl,
+    ):
+        self.session_factory = session_factory
+        self.model = model
+        self.embeddings: TTLCache[str, list[float]] = TTLCache(max_size, ttl)
+        self.inflight: dict[str, asyncio.Task] = {}
+        self.requests = 0
+
+    async def embed(self, client: AsyncOpenAI, query: str) -> list[float]:
+        text = normalize_query(query)
+        key = content_hash(text)
+        embedding = self.embeddings.get(key)
+        if embedding is not None:
+            return embedding
+
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(client, key, text))
+            self.inflight[key] = task
+        # a cancelled caller must not cancel the fetch others are waiting on
+        return await asyncio.shield(task)
+
+    async def _fetch(self, client: AsyncOpenAI, key: str, text: str) -> list[float]:
+        try:
+            embedding = await self._load(key)
+            if embedding is None:
+                response = await client.embeddings.create(model=self.model, input=text)
+                self.requests += 1
+                embedding = response.data[0].embedding
+                await self._store(key, embedding)
+            self.embeddings.set(key, embedding)
+            return embedding
+        finally:
+            del self.inflight[key]
+
+    async def _load(self, key: str) -> Optional[list[float]]:
+        if self.session_factory is None:
+            return None
+        try:
+            async with self.session_factory() as session:
+                cache = PostgresEmbeddingCache(session, self.model)
+                return (await cache.get_many([key])).get(key)
+        except Exception as e:
+            print(f"Failed to load query embedding: {str(e)}")
+            return None
+
+    async def _store(self, key: str, embedding: list[float]) -> None:
+        if self.session_factory is None:
+            return
+        try:
+            async with self.session_factory() as session:
+                await PostgresEmbeddingCache(session, self.model).put_many(
+                    {key: embedding}
+                )
+                await session.commit()
+        except Exception as e:
+            print(f"Failed to persist query embedding: {str(e)}")
+
+    def stats(self) -> dict[str, int]:
+        return {**self.embeddings.stats(), "requests": self.requests}
+
+
+class SemanticResultCache:
+    """Top-k document ids of recent queries, per search scope.
+
+    A scope is whatever the results depend on besides the query, e.g. the
+    course and ``k``. A lookup returns the ids cached for the most similar
+    earlier query in the scope that has the same ``exact_terms``, if its
+    cosine similarity reaches ``threshold``; rephrasings of the same question
+    then skip the search. Entries expire after ``ttl`` so newly ingested
+    materials show up.
+    """
+
+    def __init__(
+        self,
+        max_scopes: int = settings.retriever_result_cache_scopes,
+        max_per_scope: int = settings.retriever_result_cache_per_scope,
+        ttl: float = settings.retriever_result_cache_ttl,
+        threshold: float = settings.retriever_result_cache_threshold,
+    ):
+        self.max_per_scope = max_per_scope
+        self.ttl = ttl
+        self.threshold = threshold
+        self.scopes: TTLCache[Hashable, TTLCache[bytes, tuple]] = TTLCache(
+            max_scopes, ttl
+        )
+
+    def get(
+        self, scope: Hashable, query: str, embedding: list[float]
+    ) -> Optional[list]:
+        entries = self.scopes.get(scope)
+        if entries is None:
+            return None
+        terms = exact_terms(query)
+        cached = [
+            (vector, results)
+            for _, (vector, cached_terms, results) in entries.items()
+            if cached_terms == terms
+        ]
+        if not cached:
+            return None
+        vectors = np.stack([vector for vector, _ in cached])
+        similarities = vectors @ unit_vector(embedding)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        return cached[best][1]
+
+    def set(
+        self, scope: Hashable, query: str, embedding: list[float], results: list
+    ) -> None:
+        entries = self.scopes.get(scope)
+        if entries is None:
+            entries = TTLCache(self.max_per_scope, self.ttl)
+        vector = unit_vector(embedding)
+        terms = exact_terms(query)
+        entries.set(vector.tobytes(), (vector, terms, results))
+        # refreshes the scope's own ttl, so it outlives its entries
+        self.scopes.set(scope, entries)
+
+
+def unit_vector(embedding: list[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+@lru_cache
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    if not settings.query_embedding_cache_persist:
+        return QueryEmbeddingCache()
+    from src.deps import session_factory
+
+    return QueryEmbeddingCache(session_factory)
+
+
+@lru_cache
+def get_result_cache() -> SemanticResultCache:
+    return SemanticResultCache()
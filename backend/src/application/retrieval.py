@@ -0,0 +1,438 @@
+# course-scoped search over material_documents: pgvector, optionally fused with
+# postgres full-text search
+import re
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, replace
+from typing import Any, Optional
+
+from openai import AsyncOpenAI
+from sqlalchemy import column, func, literal_column, select, table
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.application.query_cache import get_query_embedding_cache, get_result_cache
+from src.database.models import TEXT_SEARCH_CONFIG, CourseMembership, MaterialDocument
+from src.settings import settings
+
+# characters of a chunk's start looked up in the previous chunk to find the text
+# they share (chunks overlap, see chunking.Chunker); shorter overlaps are kept
+OVERLAP_PROBE_CHARS = 16
+# first pgvector release that can keep scanning an index until enough rows pass
+# the WHERE clause (hnsw.iterative_scan)
+ITERATIVE_SCAN_VERSION = (0, 8, 0)
+
+_iterative_scan: Optional[bool] = None
+
+
+@dataclass(frozen=True)
+class RetrievedDocument:
+    id: int
+    content: str
+    metadata: dict[str, Any]
+    course_id: Optional[int]
+    # higher is more relevant: cosine similarity for vector search, the fused
+    # reciprocal rank for hybrid search
+    score: float
+
+
+async def embed_query(client: AsyncOpenAI, query: str) -> list[float]:
+    """The query's embedding, from the query embedding cache when possible."""
+    return await get_query_embedding_cache().embed(client, query)
+
+
+def user_course_ids(user_id: str):
+    return select(CourseMembership.course_id).where(
+        CourseMembership.user_id == uuid.UUID(str(user_id))
+    )
+
+
+async def supports_iterative_scan(db_session: AsyncSession) -> bool:
+    global _iterative_scan
+    if _iterative_scan is None:
+        extension = table("pg_extension", column("extname"), column("extversion"))
+        result = await db_session.execute(
+            select(extension.c.extversion).where(extension.c.extname == "vector")
+        )
+        version = result.scalar_one_or_none()
+        _iterative_scan = (
+            version is not None
+            and tuple(int(part) for part in re.findall(r"\d+", version)[:3])
+            >= ITERATIVE_SCAN_VERSION
+        )
+    return _iterative_scan
+
+
+async def set_search_params(
+    db_session: AsyncSession,
+    ef_search: int = settings.retriever_ef_search,
+    probes: int = settings.retriever_ivfflat_probes,
+    exact: bool = False,
+) -> bool:
+    """Tune the ANN index for the current transaction only.
+
+    An HNSW scan visits about ``ef_search`` candidates across *all* courses
+    and the course filters only apply afterwards, so a student whose courses
+    are a small share of the table can get fewer than ``k`` rows. pgvector 0.8
+    keeps scanning until enough rows pass (``iterative_scan``); on older
+    versions callers retry with ``exact``, which turns index scans off so the
+    planner sorts the documents in scope instead. Returns whether the scan is
+    iterative.
+    """
+    iterative = await supports_iterative_scan(db_session)
+    params = [
+        func.set_config("hnsw.ef_search", str(ef_search), True),
+        func.set_config("ivfflat.probes", str(probes), True),
+        func.set_config("enable_indexscan", "off" if exact else "on", True),
+    ]
+    if iterative:
+        params += [
+            func.set_config("hnsw.iterative_scan", "relaxed_order", True),
+            func.set_config("ivfflat.iterative_scan", "relaxed_order", True),
+        ]
+    await db_session.execute(select(*params))
+    return iterative
+
+
+def nearest_documents(query_embedding: list[float], in_scope: list, limit: int):
+    """CTE of the ids and cosine distances of the ``limit`` nearest documents.
+
+    Materialized, so readers re-sort the relaxed order of an iterative scan.
+    """
+    distance = MaterialDocument.embedding.cosine_distance(query_embedding)
+    return (
+        select(MaterialDocument.id, distance.label("distance"))
+        .where(MaterialDocument.embedding.is_not(None), *in_scope)
+        .order_by(distance)
+        .limit(limit)
+        .cte("nearest")
+        .prefix_with("MATERIALIZED")
+    )
+
+
+def course_scope(user_id: str, course_id: Optional[int]) -> list:
+    in_scope = [MaterialDocument.course_id.in_(user_course_ids(user_id))]
+    if course_id is not None:
+        in_scope.append(MaterialDocument.course_id == course_id)
+    return in_scope
+
+
+async def search_material_documents(
+    db_session: AsyncSession,
+    query_embedding: list[float],
+    user_id: str,
+    k: int = settings.retriever_k,
+    course_id: Optional[int] = None,
+    exact: bool = False,
+) -> list[RetrievedDocument]:
+    """The ``k`` documents closest to the query among the user's courses.
+
+    One query, using the HNSW index (or, for a single small course, the
+    course_id index). See ``set_search_params`` for how selective course
+    filters still get ``k`` rows.
+    """
+    iterative = await set_search_params(db_session, exact=exact)
+    nearest = nearest_documents(query_embedding, course_scope(user_id, course_id), k)
+    stmt = (
+        select(
+            MaterialDocument.id,
+            MaterialDocument.content,
+            MaterialDocument.meta_data,
+            MaterialDocument.course_id,
+            nearest.c.distance,
+        )
+        .join(nearest, nearest.c.id == MaterialDocument.id)
+        # "+ 0" keeps postgres from trusting the scan's relaxed order
+        .order_by(nearest.c.distance + 0)
+    )
+
+    rows = list(await db_session.execute(stmt))
+    if len(rows) < k and not iterative and not exact:
+        return await search_material_documents(
+            db_session, query_embedding, user_id, k, course_id, exact=True
+        )
+    return [
+        RetrievedDocument(
+            id=row.id,
+            content=row.content or "",
+            metadata=row.meta_data or {},
+            course_id=row.course_id,
+            score=1 - row.distance,
+        )
+        for row in rows
+    ]
+
+
+async def hybrid_search(
+    db_session: AsyncSession,
+    query: str,
+    query_embedding: list[float],
+    user_id: str,
+    k: int = settings.retriever_k,
+    course_id: Optional[int] = None,
+    candidates: int = settings.retriever_candidates,
+    rrf_k: int = settings.retriever_rrf_k,
+    exact: bool = False,
+) -> list[RetrievedDocument]:
+    """The ``k`` best documents by vector and full-text rank, fused.
+
+    The top ``candidates`` by cosine distance (HNSW index) and by ``ts_rank_cd``
+    (GIN index on ``content_tsv``) are ranked separately, then combined with
+    reciprocal-rank fusion: a document scores ``1 / (rrf_k + rank)`` for each
+    ranking it appears in. Exact terms such as "Problem Set 4" are found by the
+    full-text side even when their embedding is not among the nearest. Both
+    rankings and the fusion run in a single query; it is repeated with an
+    exact vector search if the index came back short (see
+    ``set_search_params``).
+    """
+    iterative = await set_search_params(db_session, exact=exact)
+    in_scope = course_scope(user_id, course_id)
+
+    nearest = nearest_documents(query_embedding, in_scope, candidates)
+    by_vector = select(
+        nearest.c.id,
+        func.row_number().over(order_by=nearest.c.distance + 0).label("rank"),
+    ).cte("by_vector")
+
+    # a constant configuration, so the planner matches it to the index expression
+    text_config = literal_column(f"'{TEXT_SEARCH_CONFIG}'::regconfig")
+    tsquery = func.websearch_to_tsquery(text_config, query)
+    text_rank = func.ts_rank_cd(MaterialDocument.content_tsv, tsquery)
+    by_text = (
+        select(
+            MaterialDocument.id,
+            func.row_number().over(order_by=text_rank.desc()).label("rank"),
+        )
+        .where(MaterialDocument.content_tsv.op("@@")(tsquery), *in_scope)
+        .order_by(text_rank.desc())
+        .limit(candidates)
+        .cte("by_text")
+    )
+
+    score = func.coalesce(1.0 / (rrf_k + by_vector.c.rank), 0.0) + func.coalesce(
+        1.0 / (rrf_k + by_text.c.rank), 0.0
+    )
+    stmt = (
+        select(
+            MaterialDocument.id,
+            MaterialDocument.content,
+            MaterialDocument.meta_data,
+            MaterialDocument.course_id,
+            score.label("score"),
+            select(func.count())
+            .select_from(nearest)
+            .scalar_subquery()
+            .label("vector_hits"),
+        )
+        .select_from(
+            by_vector.join(by_text, by_vector.c.id == by_text.c.id, full=True).join(
+                MaterialDocument,
+                MaterialDocument.id == func.coalesce(by_vector.c.id, by_text.c.id),
+            )
+        )
+        .order_by(score.desc(), MaterialDocument.id)
+        .limit(k)
+    )
+
+    rows = list(await db_session.execute(stmt))
+    vector_hits = rows[0].vector_hits if rows else 0
+    if vector_hits < candidates and not iterative and not exact:
+        return await hybrid_search(
+            db_session,
+            query,
+            query_embedding,
+            user_id,
+            k,
+            course_id,
+            candidates,
+            rrf_k,
+            exact=True,
+        )
+    return [
+        RetrievedDocument(
+            id=row.id,
+            content=row.content or "",
+            metadata=row.meta_data or {},
+            course_id=row.course_id,
+            score=float(row.score),
+        )
+        for row in rows
+    ]
+
+
+async def fetch_documents(
+    db_session: AsyncSession, ranked: list[tuple[int, float]], user_id: str
+) -> list[RetrievedDocument]:
+    """Load ``(id, score)`` pairs in order, dropping those the user cannot see."""
+    if not ranked:
+        return []
+    result = await db_session.execute(
+        select(
+            MaterialDocument.id,
+            MaterialDocument.content,
+            MaterialDocument.meta_data,
+            MaterialDocument.course_id,
+        ).where(
+            MaterialDocument.id.in_([document_id for document_id, _ in ranked]),
+            MaterialDocument.course_id.in_(user_course_ids(user_id)),
+        )
+    )
+    rows = {row.id: row for row in result}
+    return [
+        RetrievedDocument(
+            id=document_id,
+            content=rows[document_id].content or "",
+            metadata=rows[document_id].meta_data or {},
+            course_id=rows[document_id].course_id,
+            score=score,
+        )
+        for document_id, score in ranked
+        if document_id in rows
+    ]
+
+
+async def retrieve(
+    db_session: AsyncSession,
+    client: AsyncOpenAI,
+    query: str,
+    user_id: str,
+    k: int = settings.retriever_k,
+    course_id: Optional[int] = None,
+) -> list[RetrievedDocument]:
+    """Hybrid search behind the query embedding and semantic result caches.
+
+    Results are cached per course (or per user when searching all of their
+    courses); a near-identical earlier query in that scope reuses its ranking
+    and only loads the documents by primary key. Either way the documents are
+    compacted (see ``compact_documents``) before they are returned.
+    """
+    query_embedding = await embed_query(client, query)
+    result_cache = get_result_cache()
+    scope = ("course", course_id, k) if course_id is not None else ("user", user_id, k)
+
+    ranked = result_cache.get(scope, query, query_embedding)
+    if ranked is not None:
+        documents = await fetch_documents(db_session, ranked, user_id)
+        # a course's ranking is shared, but only with its members
+        if len(documents) == len(ranked):
+            return compact_documents(documents)
+
+    documents = await hybrid_search(
+        db_session, query, query_embedding, user_id, k=k, course_id=course_id
+    )
+    if documents:
+        result_cache.set(
+            scope,
+            query,
+            query_embedding,
+            [(document.id, document.score) for document in documents],
+        )
+    return compact_documents(documents)
+
+
+def join_overlapping(first: str, second: str) -> str:
+    """``first`` followed by ``second``, without the text they both repeat."""
+    probe = second[:OVERLAP_PROBE_CHARS]
+    start = first.find(probe)
+    while start != -1:
+        # the earliest match is the longest overlap
+        if second.startswith(first[start:]):
+            return first[:start] + second
+        start = first.find(probe, start + 1)
+    return f"{first} {second}"
+
+
+def merge_adjacent(documents: list[RetrievedDocument]) -> list[RetrievedDocument]:
+    """Merge consecutive chunks of the same material into one document.
+
+    A run of chunks ``index, index + 1, ...`` becomes one document with the
+    overlap between them removed, ranked where its best chunk was.
+    """
+    by_material: dict[Any, list[tuple[int, int]]] = defaultdict(list)
+    runs: list[tuple[int, list[RetrievedDocument]]] = []
+    for position, document in enumerate(documents):
+        material_id = document.metadata.get("course_material_id")
+        index = document.metadata.get("index")
+        if material_id is None or index is None:
+            runs.append((position, [document]))
+        else:
+            by_material[material_id].append((index, position))
+
+    for chunks in by_material.values():
+        chunks.sort()
+        run: list[tuple[int, int]] = []
+        for index, position in chunks:
+            if run and index != run[-1][0] + 1:
+                runs.append((min(p for _, p in run), [documents[p] for _, p in run]))
+                run = []
+            run.append((index, position))
+        runs.append((min(p for _, p in run), [documents[p] for _, p in run]))
+
+    merged = []
+    for _, run_documents in sorted(runs, key=lambda run: run[0]):
+        document = run_documents[0]
+        for following in run_documents[1:]:
+            document = replace(
+                document,
+                content=join_overlapping(document.content, following.content),
+                metadata={
+                    **document.metadata,
+                    "page_end": following.metadata.get("page_end"),
+                },
+                score=max(document.score, following.score),
+            )
+        merged.append(document)
+    return merged
+
+
+def shingles(text: str, size: int = 3) -> set[tuple[str, ...]]:
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i : i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+
+def drop_near_duplicates(
+    documents: list[RetrievedDocument],
+    threshold: float = settings.retriever_dedup_threshold,
+) -> list[RetrievedDocument]:
+    """Drop documents whose word shingles mostly repeat a better-ranked one.
+
+    Catches the same slide in two uploads of a deck, or a chunk already
+    contained in a merged run. With at most ``k`` documents, comparing the
+    shingle sets exactly is cheaper than estimating it with MinHash.
+    """
+    kept: list[tuple[RetrievedDocument, set]] = []
+    for document in documents:
+        document_shingles = shingles(document.content)
+        # share of this document's shingles that the other already shows
+        if not any(
+            len(document_shingles & other) / len(document_shingles) >= threshold
+            for _, other in kept
+        ):
+            kept.append((document, document_shingles))
+    return [document for document, _ in kept]
+
+
+def compact_documents(documents: list[RetrievedDocument]) -> list[RetrievedDocument]:
+    """Merge adjacent chunks, then drop near-duplicates, keeping rank order."""
+    return drop_near_duplicates(merge_adjacent(documents))
+
+
+def document_label(metadata: dict[str, Any]) -> str:
+    """``lecture3.pdf, pp. 4-5: Chain rule``, as far as the metadata goes."""
+    label = metadata.get("name", "unknown")
+    page_start, page_end = metadata.get("page_start"), metadata.get("page_end")
+    if page_start is not None:
+        if page_end is None or page_end == page_start:
+            label += f", p. {page_start}"
+        else:
+            label += f", pp. {page_start}-{page_end}"
+    if metadata.get("heading"):
+        label += f": {metadata['heading']}"
+    return label
+
+
+def format_documents(documents: list[RetrievedDocument]) -> str:
+    """Render documents for the model, each with where it came from."""
+    return "\n\n".join(
+        f"[{document_label(document.metadata)}]\n{document.content}"
+        for document in documents
+    )
@@ -0,0 +1,146 @@
+# free time slot finder over minute bitmaps of a user's busy intervals
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta, timezone
+from typing import Optional
+
+import numpy as np
+from zoneinfo import ZoneInfo
+
+# local hours a study session may fall in, by Preference.study_type:
+# (day start, day end) bounds every slot, (preferred start, end) ranks them
+DAY_WINDOW = (time(7), time(23, 59))
+STUDY_WINDOWS = {
+    "morning": (time(7), time(13)),
+    "night": (time(18), time(23, 59)),
+}
+# slots start on this grid, in minutes
+SLOT_STEP = 15
+
+
+@dataclass(frozen=True)
+class FreeSlot:
+    start: datetime
+    end: datetime
+    score: float
+    preferred: bool
+
+
+def _minute(moment: datetime, origin: datetime) -> int:
+    return int((moment - origin).total_seconds() // 60)
+
+
+def window_mask(
+    origin: datetime, n_minutes: int, window: tuple[time, time], tz: ZoneInfo
+) -> np.ndarray:
+    """Minutes of ``[origin, origin + n_minutes)`` inside the daily local window."""
+    mask = np.zeros(n_minutes, dtype=bool)
+    day = origin.astimezone(tz).date() - timedelta(days=1)
+    last_day = (origin + timedelta(minutes=n_minutes)).astimezone(tz).date()
+    # one iteration per day, so DST changes land on the right minute
+    while day <= last_day:
+        start = _minute(datetime.combine(day, window[0], tz), origin)
+        end = _minute(datetime.combine(day, window[1], tz), origin)
+        mask[max(start, 0) : max(min(end, n_minutes), 0)] = True
+        day += timedelta(days=1)
+    return mask
+
+
+def busy_mask(
+    origin: datetime, n_minutes: int, busy: list[tuple[datetime, datetime]]
+) -> np.ndarray:
+    """Minutes covered by at least one of the busy intervals."""
+    if not busy:
+        return np.zeros(n_minutes, dtype=bool)
+    seconds = np.array(
+        [
+            ((start - origin).total_seconds(), (end - origin).total_seconds())
+            for start, end in busy
+        ]
+    )
+    # a busy interval blocks every minute it touches
+    bounds = np.clip(
+        np.stack([np.floor(seconds[:, 0] / 60), np.ceil(seconds[:, 1] / 60)], axis=1),
+        0,
+        n_minutes,
+    ).astype(np.int64)
+    # +1 where an interval starts, -1 where it ends; busy where the sum is > 0
+    delta = np.zeros(n_minutes + 1, dtype=np.int32)
+    np.add.at(delta, bounds[:, 0], 1)
+    np.add.at(delta, bounds[:, 1], -1)
+    return np.cumsum(delta[:-1]) > 0
+
+
+def find_free_slots(
+    busy: list[tuple[datetime, datetime]],
+    start: datetime,
+    days: int,
+    duration_minutes: int,
+    tz: ZoneInfo,
+    study_type: Optional[str] = None,
+    due_at: Optional[datetime] = None,
+    limit: int = 10,
+) -> list[FreeSlot]:
+    """Rank the free slots of ``duration_minutes`` in the next ``days`` days.
+
+    Busy intervals and the daily windows become minute bitmaps; free runs are
+    cut into candidate slots on a ``SLOT_STEP`` grid. Slots inside the user's
+    study window rank first, then earlier ones. Slots ending after ``due_at``
+    are dropped.
+    """
+    # start on the slot grid, so suggestions look like 14:15 rather than 14:07
+    origin = start.astimezone(timezone.utc).replace(second=0, microsecond=0)
+    origin += timedelta(minutes=-origin.minute % SLOT_STEP)
+    n_minutes = days * 24 * 60
+    if due_at is not None:
+        if due_at.tzinfo is None:
+            due_at = due_at.replace(tzinfo=timezone.utc)
+        n_minutes = min(n_minutes, max(_minute(due_at, origin), 0))
+    if n_minutes < duration_minutes:
+        return []
+
+    free = window_mask(origin, n_minutes, DAY_WINDOW, tz) & ~busy_mask(
+        origin, n_minutes, busy
+    )
+    # runs of free minutes: [run_starts[i], run_ends[i])
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], free.view(np.int8), [0]))))
+    run_starts, run_ends = edges[::2], edges[1::2]
+    run_starts = -(-run_starts // SLOT_STEP) * SLOT_STEP
+    counts = np.maximum((run_ends - run_starts - duration_minutes) // SLOT_STEP + 1, 0)
+    if counts.sum() == 0:
+        return []
+
+    # every grid position in every run that still fits the whole slot
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    slot_starts = np.repeat(run_starts, counts) + offsets * SLOT_STEP
+
+    preferred = np.zeros(n_minutes, dtype=bool)
+    if study_type in STUDY_WINDOWS:
+        preferred = window_mask(origin, n_minutes, STUDY_WINDOWS[study_type], tz)
+    covered = np.concatenate(([0], np.cumsum(preferred)))
+    in_window = (covered[slot_starts + duration_minutes] - covered[slot_starts]) / (
+        duration_minutes
+    )
+    scores = 2 * in_window + (1 - slot_starts / n_minutes)
+
+    # best first; among equal scores the earlier slot
+    best = np.lexsort((slot_starts, -scores))
+    picked: list[FreeSlot] = []
+    taken = np.zeros(n_minutes, dtype=bool)
+    for i in best:
+        slot_start = int(slot_starts[i])
+        slot_end = slot_start + duration_minutes
+        # candidates overlap each other; keep suggestions disjoint
+        if taken[slot_start:slot_end].any():
+            continue
+        taken[slot_start:slot_end] = True
+        picked.append(
+            FreeSlot(
+                start=origin + timedelta(minutes=slot_start),
+                end=origin + timedelta(minutes=slot_end),
+                score=round(float(scores[i]), 3),
+                preferred=bool(in_window[i] == 1),
+            )
+        )
+        if len(picked) == limit:
+            break
+    return picked
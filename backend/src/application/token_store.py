@@ -0,0 +1,213 @@
+# integration tokens cached per process, kept in sync across workers with LISTEN/NOTIFY
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import AsyncIterator, Literal, Optional
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.application.notify import listen_forever
+from src.cache import TTLCache
+from src.database.models import Integration
+from src.settings import settings
+
+# sent by the integration_changed trigger with "<user_id>:<type>" as payload
+INTEGRATION_CHANNEL = "integration_changed"
+
+IntegrationName = Literal["canvas", "google"]
+
+
+class TokenNotFoundError(Exception):
+    """Exception raised when an integration token is not found."""
+
+    pass
+
+
+@dataclass(frozen=True)
+class IntegrationToken:
+    token: str
+    refresh_token: Optional[str] = None
+    expire_at: Optional[datetime] = None
+
+    def expires_within(self, seconds: float) -> bool:
+        if self.expire_at is None:
+            return False
+        return self.expire_at - datetime.now(timezone.utc) <= timedelta(seconds=seconds)
+
+
+def google_credentials(token: IntegrationToken) -> Credentials:
+    # google-auth compares expiry against a naive UTC datetime
+    expiry = None
+    if token.expire_at is not None:
+        expiry = token.expire_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return Credentials(
+        token=token.token,
+        token_uri="https://oauth2.googleapis.com/token",
+        client_id=settings.gcal_client_id,
+        client_secret=settings.gcal_client_secret,
+        refresh_token=token.refresh_token,
+        expiry=expiry,
+    )
+
+
+class TokenStore:
+    """Size-bounded cache of integration tokens.
+
+    Entries live for at most ``ttl`` seconds and never past the token's
+    ``expire_at``. Google tokens about to expire are refreshed by a background
+    task rather than on the request path, and every worker drops its copy when
+    an ``integration`` row changes (``start`` listens for the trigger's NOTIFY).
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        max_size: int = settings.token_cache_size,
+        ttl: float = settings.token_cache_ttl,
+        refresh_margin: float = settings.google_token_refresh_margin,
+        refresh_interval: float = settings.google_token_refresh_interval,
+    ):
+        self.session_factory = session_factory
+        self.tokens: TTLCache[tuple[str, str], IntegrationToken] = TTLCache(
+            max_size, ttl
+        )
+        self.refresh_margin = refresh_margin
+        self.refresh_interval = refresh_interval
+        # per-user refresh locks, with the number of callers holding or awaiting
+        # each; a lock is dropped when that count falls to zero
+        self.refresh_locks: dict[str, asyncio.Lock] = {}
+        self.refresh_waiters: dict[str, int] = {}
+        self.tasks: list[asyncio.Task] = []
+
+    def _cache(self, user_id: str, name: str, token: IntegrationToken) -> None:
+        ttl = None
+        if token.expire_at is not None:
+            ttl = (token.expire_at - datetime.now(timezone.utc)).total_seconds()
+        self.tokens.set((user_id, name), token, ttl=ttl)
+
+    async def get(
+        self, session: AsyncSession, user_id: str, name: IntegrationName
+    ) -> IntegrationToken:
+        user_id = str(user_id)
+        token = self.tokens.get((user_id, name))
+        if token is None:
+            result = await session.execute(
+                select(Integration).where(
+                    Integration.user_id == uuid.UUID(user_id), Integration.type == name
+                )
+            )
+            integration = result.scalar_one_or_none()
+            if not integration:
+                raise TokenNotFoundError(f"No token found for {name}")
+            token = IntegrationToken(
+                integration.token, integration.refresh_token, integration.expire_at
+            )
+
+        # normally the background refresher got here first
+        if name == "google" and token.refresh_token and token.expires_within(60):
+            return await self.refresh_google(user_id, token)
+
+        self._cache(user_id, name, token)
+        return token
+
+    def invalidate(self, user_id: str, name: Optional[str] = None) -> None:
+        for key_name in [name] if name else ["canvas", "google"]:
+            self.tokens.pop((str(user_id), key_name))
+
+    @asynccontextmanager
+    async def _refresh_lock(self, user_id: str) -> AsyncIterator[None]:
+        lock = self.refresh_locks.setdefault(user_id, asyncio.Lock())
+        self.refresh_waiters[user_id] = self.refresh_waiters.get(user_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self.refresh_waiters[user_id] -= 1
+            if not self.refresh_waiters[user_id]:
+                del self.refresh_waiters[user_id]
+                del self.refresh_locks[user_id]
+
+    async def refresh_google(
+        self, user_id: str, token: IntegrationToken
+    ) -> IntegrationToken:
+        async with self._refresh_lock(user_id):
+            # another caller may have refreshed it while we waited
+            current = self.tokens.get((user_id, "google"))
+            if current is not None and not current.expires_within(self.refresh_margin):
+                return current
+
+            credentials = google_credentials(token)
+            await asyncio.to_thread(credentials.refresh, Request())
+            expire_at = None
+            if credentials.expiry is not None:
+                expire_at = credentials.expiry.replace(tzinfo=timezone.utc)
+            refreshed = IntegrationToken(
+                credentials.token,
+                credentials.refresh_token or token.refresh_token,
+                expire_at,
+            )
+            async with self.session_factory() as session:
+                await session.execute(
+                    update(Integration)
+                    .where(
+                        Integration.user_id == uuid.UUID(user_id),
+                        Integration.type == "google",
+                    )
+                    .values(
+                        token=refreshed.token,
+                        refresh_token=refreshed.refresh_token,
+                        expire_at=refreshed.expire_at,
+                    )
+                )
+                await session.commit()
+            self._cache(user_id, "google", refreshed)
+        return refreshed
+
+    async def _refresh_expiring(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            for (user_id, name), token in self.tokens.items():
+                if name != "google" or not token.refresh_token:
+                    continue
+                if not token.expires_within(self.refresh_margin):
+                    continue
+                try:
+                    await self.refresh_google(user_id, token)
+                except Exception as e:
+                    print(f"Failed to refresh google token of {user_id}: {str(e)}")
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        user_id, _, name = payload.partition(":")
+        self.invalidate(user_id, name or None)
+
+    async def _listen(self) -> None:
+        # notifications sent while we were not listening are lost
+        await listen_forever(
+            INTEGRATION_CHANNEL, self._on_notify, on_connect=self.tokens.clear
+        )
+
+    async def start(self) -> None:
+        if not self.tasks:
+            self.tasks = [
+                asyncio.create_task(self._listen()),
+                asyncio.create_task(self._refresh_expiring()),
+            ]
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+
+@lru_cache
+def get_token_store() -> TokenStore:
+    from src.deps import session_factory
+
+    return TokenStore(session_factory)
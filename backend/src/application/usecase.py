@@ -1,9 +1,12 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Any, Optional
 
 from pydantic import BaseModel
+from zoneinfo import ZoneInfo
 
-from src.deps import CanvasClient, GoogleCalendarClient
+from src.application.scheduling import find_free_slots
+from src.deps import CanvasClient, GoogleCalendarApi, GoogleCalendarClient
+from src.settings import settings
 
 
 class Course(BaseModel):
@@ -85,13 +88,72 @@ async def get_schedules(calendar_client: GoogleCalendarClient, time_min: datetim
     return [TimeSlot(name=event["summary"], start=event["start"], end=event["end"]).model_dump(mode="json") for event in calendar_events]
 
 
-def suggest_timeslots(availability: list[TimeSlot], task: Assignment) -> list[TimeSlot]:
-    ...
-
-
-def add_to_calendar(timeslot: TimeSlot, calendar: GoogleCalendarClient):
-    ...
+def suggest_timeslots(
+    busy: list[TimeSlot],
+    task: Assignment,
+    duration_minutes: int = 60,
+    n_days: int = 7,
+    study_type: Optional[str] = None,
+    limit: int = 5,
+) -> list[TimeSlot]:
+    """
+    Suggest free time slots to work on a task, best first.
+
+    :param busy: Time slots that are already taken (events, other tasks).
+    :param task: The task to schedule; slots end before its due date.
+    :param duration_minutes: Length of each slot.
+    :param n_days: Number of days to look ahead.
+    :param study_type: Preference.study_type, e.g. "morning" or "night".
+    :param limit: Maximum number of slots.
+    :return: list[TimeSlot].
+    """
+    slots = find_free_slots(
+        [(slot.start_time, slot.end_time) for slot in busy],
+        start=datetime.now(timezone.utc),
+        days=n_days,
+        duration_minutes=duration_minutes,
+        tz=ZoneInfo(settings.default_timezone),
+        study_type=study_type,
+        due_at=task.due_date,
+        limit=limit,
+    )
+    return [TimeSlot(name=task.name, start_time=slot.start, end_time=slot.end) for slot in slots]
+
+
+async def add_to_calendar(timeslot: TimeSlot, calendar: GoogleCalendarApi, calendar_id: str = "primary") -> dict[str, Any]:
+    """
+    Add a time slot to Google Calendar as an event.
 
+    :param timeslot: TimeSlot to add.
+    :param calendar: Google Calendar client authenticated as the user.
+    :param calendar_id: Calendar to add the event to.
+    :return: The created event.
+    """
+    return await calendar.insert_event(
+        calendar_id,
+        {
+            "summary": timeslot.name,
+            "location": timeslot.location,
+            "start": {"dateTime": timeslot.start_time.isoformat()},
+            "end": {"dateTime": timeslot.end_time.isoformat()},
+        },
+    )
+
+
+async def modify_schedule(event_id: str, timeslot: TimeSlot, calendar: GoogleCalendarApi, calendar_id: str = "primary") -> dict[str, Any]:
+    """
+    Move an existing Google Calendar event to a new time slot.
 
-def modify_schedule(timeslot: TimeSlot, calendar: GoogleCalendarClient):
-    ...
+    :param event_id: ID of the event to move.
+    :param timeslot: The new time slot.
+    :param calendar: Google Calendar client authenticated as the user.
+    :param calendar_id: Calendar of the event.
+    :return: The updated event.
+    """
+    event = await calendar.get_event(calendar_id, event_id)
+    event["summary"] = timeslot.name
+    event["start"] = {"dateTime": timeslot.start_time.isoformat()}
+    event["end"] = {"dateTime": timeslot.end_time.isoformat()}
+    if timeslot.location is not None:
+        event["location"] = timeslot.location
+    return await calendar.update_event(calendar_id, event_id, event)
@@ -1,47 +1,35 @@
+import asyncio
 import json
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Any, Literal, Optional
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
+import httpx
 from openai import AsyncOpenAI
 from pydantic import BaseModel
-from sqlalchemy import select, update
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-
-from src.application import external_usecase
-from src.database.models import Integration, Preference, Task
-from src.schema import CourseInfo, GenerateSubtasksOut, SubTaskOut, TaskIn, TaskOut
+from zoneinfo import ZoneInfo
+
+from src.application import calendar_mirror, external_usecase, scheduling
+from src.application.canvas_cache import get_canvas_cache
+from src.application.token_store import (
+    TokenNotFoundError,
+    get_token_store,
+)
+from src.database.models import Preference, Task
+from src.deps import ExternalApiError, get_canvas_client, get_google_calendar_api
+from src.schema import (
+    CourseInfo,
+    FreeSlotOut,
+    GenerateSubtasksOut,
+    SubTaskOut,
+    TaskIn,
+    TaskOut,
+)
 from src.settings import settings
 
 
-class TokenNotFoundError(Exception):
-    """Exception raised when an integration token is not found."""
-
-    pass
-
-
-# Dictionary to store cached tokens
-_token_cache = {}
-
-
-def get_cached_token(
-    user_id: str, integration_name: str
-) -> Optional[tuple[str, str | None]]:
-    """Retrieve an integration token from the in-memory cache.
-
-    Args:
-        user_id (str): The unique identifier of the user.
-        integration_name (str): The name of the integration (e.g., "canvas", "google").
-
-    Returns:
-        Optional[tuple[str, str | None]]: Tuple of (token, refresh_token) if found, None otherwise.
-    """
-    cache_key = (user_id, integration_name)
-    return _token_cache.get(cache_key)
-
-
 def invalidate_token_cache(user_id: str, integration_name: str) -> None:
     """Remove a specific token from the cache.
 
@@ -49,9 +37,7 @@ def invalidate_token_cache(user_id: str, integration_name: str) -> None:
         user_id (str): The unique identifier of the user.
         integration_name (str): The name of the integration to invalidate.
     """
-    cache_key = (user_id, integration_name)
-    if cache_key in _token_cache:
-        del _token_cache[cache_key]
+    get_token_store().invalidate(user_id, integration_name)
 
 
 async def get_integration_token(
@@ -59,6 +45,8 @@ async def get_integration_token(
 ) -> tuple[str, str | None]:
     """Retrieve an integration token from cache or database.
 
+    Google tokens close to expiry are refreshed before being returned.
+
     Args:
         session (AsyncSession): The database session.
         user_id (str): The unique identifier of the user.
@@ -70,24 +58,7 @@ async def get_integration_token(
     Raises:
         TokenNotFoundError: If no token is found for the specified integration.
     """
-    cached_tokens = get_cached_token(user_id, integration_name)
-    if cached_tokens:
-        return cached_tokens
-
-    uuid_user_id = uuid.UUID(user_id)
-    query = select(Integration).where(
-        Integration.user_id == uuid_user_id, Integration.type == integration_name
-    )
-    result = await session.execute(query)
-    token = result.scalar_one_or_none()
-
-    if not token:
-        raise TokenNotFoundError(f"No token found for {integration_name}")
-
-    # Cache both tokens
-    cache_key = (user_id, integration_name)
-    _token_cache[cache_key] = (token.token, token.refresh_token)
-
+    token = await get_token_store().get(session, user_id, integration_name)
     return token.token, token.refresh_token
 
 
@@ -114,8 +85,13 @@ async def list_canvas_courses(
         TokenNotFoundError: If no Canvas token is found for the user.
     """
     canvas_token, _ = await get_integration_token(session, user_id, "canvas")
-    courses = external_usecase.fetch_canvas_courses(
-        canvas_api_url=settings.canvas_api_url, canvas_api_key=canvas_token
+    courses = await get_canvas_cache().get_or_fetch(
+        str(user_id),
+        "courses",
+        {},
+        lambda: external_usecase.fetch_canvas_courses(
+            canvas_client=get_canvas_client(canvas_token)
+        ),
     )
     return [CanvasCourse.model_validate(course) for course in courses]
 
@@ -154,12 +130,23 @@ async def get_upcoming_assignments_and_quizzes(
     else:
         end_date_dt = datetime.strptime(end_date, "%Y-%m-%d")
 
-    return external_usecase.fetch_canvas_events(
-        canvas_api_url=settings.canvas_api_url,
-        canvas_api_key=canvas_token,
-        start_date=start_date_dt.isoformat(),
-        end_date=end_date_dt.isoformat(),
-        course_id=course_id,
+    # keyed by the arguments rather than the resolved dates, which move with now()
+    params = {
+        "n_days": n_days,
+        "start_date": start_date,
+        "end_date": end_date,
+        "course_id": course_id,
+    }
+    return await get_canvas_cache().get_or_fetch(
+        str(user_id),
+        "upcoming_work",
+        params,
+        lambda: external_usecase.fetch_canvas_events(
+            canvas_client=get_canvas_client(canvas_token),
+            start_date=start_date_dt.isoformat(),
+            end_date=end_date_dt.isoformat(),
+            course_id=course_id,
+        ),
     )
 
 
@@ -168,6 +155,8 @@ class EventIn(BaseModel):
     start_time: str
     end_time: str
     description: Optional[str]
+    # defaults to the title and times, so re-sending the same event is a no-op
+    idempotency_key: Optional[str] = None
 
 
 class GoogleCalendarEvent(BaseModel):
@@ -178,8 +167,15 @@ class GoogleCalendarEvent(BaseModel):
     description: Optional[str]
 
 
+class FailedGoogleCalendarEvent(BaseModel):
+    index: int
+    title: str
+    error: str
+
+
 class SyncToGoogleCalendarOutput(BaseModel):
     created_events: list[GoogleCalendarEvent]
+    failed_events: list[FailedGoogleCalendarEvent] = []
 
 
 async def sync_to_google_calendar(
@@ -187,6 +183,10 @@ async def sync_to_google_calendar(
 ) -> SyncToGoogleCalendarOutput:
     """Synchronize Canvas events to Google Calendar.
 
+    Events are inserted concurrently (up to ``gcal_insert_concurrency`` at a
+    time) under deterministic event IDs, so retrying a sync does not create
+    duplicates. A failed insert does not stop the others.
+
     Args:
         session (AsyncSession): The database session.
         user_id (str): The unique identifier of the user.
@@ -194,49 +194,56 @@ async def sync_to_google_calendar(
         events (str): Json String of a list of Canvas events to sync. e.g., '[{"title": "Event 1", "start_time": "2024-11-01T00:00:00Z", "end_time": "2024-11-01T01:00:00Z", "description": "Description of Event 1"}]'
 
     Returns:
-        SyncToGoogleCalendarOutput: List of created Google Calendar events.
+        SyncToGoogleCalendarOutput: Created events (already existing ones
+            included) and the events that failed, with their index in ``events``.
 
     Raises:
         TokenNotFoundError: If no Google token is found for the user.
     """
-    google_token_data, refresh_token = await get_integration_token(
-        session, user_id, "google"
-    )
+    token = await get_token_store().get(session, user_id, "google")
+    calendar_client = get_google_calendar_api(token.token)
+    semaphore = asyncio.Semaphore(settings.gcal_insert_concurrency)
 
-    credentials = Credentials(
-        token=google_token_data,
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=settings.gcal_client_id,
-        client_secret=settings.gcal_client_secret,
-        refresh_token=refresh_token,
-    )
-
-    if credentials.expired:
-        credentials.refresh(Request())
-        await session.execute(
-            update(Integration)
-            .where(
-                Integration.user_id == uuid.UUID(user_id), Integration.type == "google"
-            )
-            .values(token=credentials.token, refresh_token=credentials.refresh_token)
+    async def insert(event: EventIn) -> dict[str, Any]:
+        key = event.idempotency_key or "|".join(
+            [event.title, event.start_time, event.end_time]
         )
+        async with semaphore:
+            return await external_usecase.add_study_schedule_to_google_calendar(
+                calendar_client=calendar_client,
+                calendar_id=calendar_id,
+                title=event.title,
+                description=event.description,
+                start_time=event.start_time,
+                end_time=event.end_time,
+                event_id=external_usecase.google_event_id(
+                    str(user_id), calendar_id, key
+                ),
+            )
 
-    created_events = []
     events_dict = json.loads(events)
     events_parsed = [EventIn.model_validate(event) for event in events_dict]
-    for event in events_parsed:
-        created_event = external_usecase.add_study_schedule_to_google_calendar(
-            google_credentials=credentials,
-            calendar_id=calendar_id,
-            title=event.title,
-            description=event.description,
-            start_time=event.start_time,
-            end_time=event.end_time,
-        )
-        created_events.append(created_event)
+    results = await asyncio.gather(
+        *(insert(event) for event in events_parsed), return_exceptions=True
+    )
+
+    created_events = []
+    failed_events = []
+    for index, (event, result) in enumerate(zip(events_parsed, results)):
+        if isinstance(result, (ExternalApiError, httpx.HTTPError)):
+            failed_events.append(
+                {"index": index, "title": event.title, "error": str(result)}
+            )
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            created_events.append(result)
+    if created_events:
+        # pick the new events up on the next read instead of waiting for a push
+        await calendar_mirror.mark_stale(session, user_id, calendar_id)
 
     return SyncToGoogleCalendarOutput.model_validate(
-        {"created_events": created_events}
+        {"created_events": created_events, "failed_events": failed_events}
     )
 
 
@@ -258,11 +265,14 @@ async def get_study_progress(
     """
     canvas_token, _ = await get_integration_token(session, user_id, "canvas")
 
-    return external_usecase.fetch_study_progress(
-        canvas_api_url=settings.canvas_api_url,
-        canvas_api_key=canvas_token,
-        course_id=course_id,
-        user_id=user_id,
+    return await get_canvas_cache().get_or_fetch(
+        str(user_id),
+        "study_progress",
+        {"course_id": course_id},
+        lambda: external_usecase.fetch_study_progress(
+            canvas_client=get_canvas_client(canvas_token),
+            course_id=course_id,
+        ),
     )
 
 
@@ -392,36 +402,114 @@ async def generate_subtasks(
     return [task.model_dump(mode="json") for task in subtasks]
 
 
-async def get_events_on_date(
-    session: AsyncSession, user_id: str, date: datetime
-) -> list[dict[str, Any]]:
-    google_token_data, refresh_token = await get_integration_token(
-        session, user_id, "google"
-    )
-    preference_result = await session.execute(
-        select(Preference).where(Preference.user_id == uuid.UUID(user_id))
+async def get_events_between(
+    session: AsyncSession,
+    user_id: str,
+    start: datetime,
+    end: datetime,
+    calendar_id: str = "primary",
+) -> dict[str, Any]:
+    """List the user's Google Calendar events overlapping ``[start, end)``.
+
+    Events are served from the local mirror, which is synced first if it is
+    stale (see ``calendar_mirror.is_fresh``).
+
+    Args:
+        session (AsyncSession): The database session.
+        user_id (str): The unique identifier of the user.
+        start (datetime): Start of the range; naive datetimes are taken as UTC.
+        end (datetime): End of the range; naive datetimes are taken as UTC.
+        calendar_id (str): The ID of the Google Calendar.
+
+    Returns:
+        dict[str, Any]: ``{"items": [...]}`` with events as returned by Google.
+
+    Raises:
+        TokenNotFoundError: If no Google token is found for the user.
+    """
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    await calendar_mirror.refresh_if_stale(session, user_id, calendar_id)
+    items = await calendar_mirror.list_mirrored_events(
+        session, user_id, start, end, calendar_id
     )
-    preference = preference_result.scalar_one_or_none()
-    google_calendar_id = None
-    if preference:
-        google_calendar_id = preference.primary_calendar
-
-    credentials = Credentials(
-        token=google_token_data,
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=settings.gcal_client_id,
-        client_secret=settings.gcal_client_secret,
-        refresh_token=refresh_token,
+    return {"items": items}
+
+
+async def find_free_slots(
+    session: AsyncSession,
+    user_id: str,
+    duration_minutes: int = 60,
+    days: int = 7,
+    due_at: Optional[datetime] = None,
+    limit: int = 5,
+) -> list[dict[str, Any]]:
+    """Suggest free time slots for studying, best first.
+
+    Busy time is taken from the user's Google Calendar (through the local
+    mirror) and from their scheduled tasks; slots in the window of the user's
+    ``study_type`` preference rank first.
+
+    Args:
+        session (AsyncSession): The database session.
+        user_id (str): The unique identifier of the user.
+        duration_minutes (int): Length of each slot in minutes.
+        days (int): How many days ahead to look.
+        due_at (Optional[datetime]): Only suggest slots that end before this.
+        limit (int): Maximum number of slots to return.
+
+    Returns:
+        list[dict[str, Any]]: Free slots with start, end, score and preferred.
+    """
+    start = datetime.now(timezone.utc)
+    end = start + timedelta(days=days)
+    if due_at is not None and due_at.tzinfo is None:
+        due_at = due_at.replace(tzinfo=timezone.utc)
+
+    tz = ZoneInfo(settings.default_timezone)
+    busy = []
+    try:
+        await calendar_mirror.refresh_if_stale(session, user_id, "primary")
+        busy = await calendar_mirror.list_busy_intervals(
+            session, user_id, start, end, tz=tz
+        )
+    except TokenNotFoundError:
+        # no google calendar connected; plan around tasks only
+        pass
+    except ExternalApiError as e:
+        # e.g. a revoked google token; still suggest slots around tasks
+        print(f"Failed to read the calendar of {user_id}: {str(e)}")
+        await session.rollback()
+
+    tasks = await session.execute(
+        select(Task.start_at, Task.end_at).where(
+            Task.user_id == uuid.UUID(user_id),
+            Task.start_at < end,
+            Task.end_at > start,
+        )
     )
-    start_date = (
-        date.replace(hour=0, minute=0, second=0, microsecond=0).isoformat() + "Z"
+    busy.extend((task.start_at, task.end_at) for task in tasks)
+
+    preference = await session.execute(
+        select(Preference.study_type).where(Preference.user_id == uuid.UUID(user_id))
     )
-    end_date = (date + timedelta(days=1)).replace(
-        hour=0, minute=0, second=0, microsecond=0
-    ).isoformat() + "Z"
-    return external_usecase.list_google_calendar_events(
-        google_credentials=credentials,
-        calendar_id="primary",
-        start_date=start_date,
-        end_date=end_date,
+    slots = scheduling.find_free_slots(
+        busy,
+        start=start,
+        days=days,
+        duration_minutes=duration_minutes,
+        tz=tz,
+        study_type=preference.scalar_one_or_none(),
+        due_at=due_at,
+        limit=limit,
     )
+    return [FreeSlotOut.model_validate(slot).model_dump(mode="json") for slot in slots]
+
+
+async def get_events_on_date(
+    session: AsyncSession, user_id: str, date: datetime
+) -> dict[str, Any]:
+    start = date.replace(hour=0, minute=0, second=0, microsecond=0)
+    return await get_events_between(session, user_id, start, start + timedelta(days=1))
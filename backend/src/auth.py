@@ -0,0 +1,135 @@
+# in-process verification of supabase access tokens
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+import httpx
+import jwt
+from supabase_auth import User
+
+from src.cache import TTLCache
+from src.settings import Settings
+
+SYMMETRIC_ALGORITHMS = {"HS256", "HS384", "HS512"}
+ASYMMETRIC_ALGORITHMS = {"RS256", "RS384", "RS512", "ES256", "ES384", "PS256"}
+
+
+def hash_token(access_token: str) -> str:
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+
+def token_ttl(access_token: str) -> Optional[float]:
+    """Seconds until the token's ``exp`` claim, without verifying it."""
+    try:
+        claims = jwt.decode(access_token, options={"verify_signature": False})
+    except jwt.InvalidTokenError:
+        return None
+    if "exp" not in claims:
+        return None
+    return claims["exp"] - time.time()
+
+
+def user_from_claims(claims: dict[str, Any]) -> User:
+    issued_at = datetime.fromtimestamp(claims.get("iat", time.time()), timezone.utc)
+    return User(
+        id=claims["sub"],
+        aud=claims.get("aud") or "",
+        email=claims.get("email"),
+        phone=claims.get("phone"),
+        role=claims.get("role"),
+        app_metadata=claims.get("app_metadata") or {},
+        user_metadata=claims.get("user_metadata") or {},
+        is_anonymous=claims.get("is_anonymous", False),
+        created_at=issued_at,
+    )
+
+
+class JWTVerifier:
+    """Verify Supabase JWTs locally with a cached signing key.
+
+    ``verify`` returns ``None`` when the token cannot be checked locally (no
+    secret configured, unknown ``kid``, unsupported algorithm) so the caller
+    can fall back to GoTrue, and raises ``jwt.InvalidTokenError`` when the
+    token is definitely bad (signature, expiry, audience).
+    """
+
+    def __init__(self, settings: Settings):
+        self.secret = settings.gotrue_jwt_secret
+        self.audience = settings.gotrue_jwt_audience
+        self.jwks_url = f"{settings.gotrue_url.rstrip('/')}/.well-known/jwks.json"
+        self.jwks_ttl = settings.gotrue_jwks_ttl
+        self.leeway = settings.gotrue_jwt_leeway
+        self._keys: dict[str, jwt.PyJWK] = {}
+        self._keys_fetched_at = 0.0
+        self._keys_lock = asyncio.Lock()
+
+    async def _fetch_keys(self) -> None:
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            response = await client.get(self.jwks_url)
+        response.raise_for_status()
+        keys = {}
+        for key in jwt.PyJWKSet.from_dict(response.json()).keys:
+            if key.key_id:
+                keys[key.key_id] = key
+        self._keys = keys
+        self._keys_fetched_at = time.monotonic()
+
+    async def _get_signing_key(self, kid: Optional[str]) -> Optional[jwt.PyJWK]:
+        if kid is None:
+            return None
+
+        is_stale = time.monotonic() - self._keys_fetched_at > self.jwks_ttl
+        if kid in self._keys and not is_stale:
+            return self._keys[kid]
+
+        async with self._keys_lock:
+            # another request may have refreshed the keys while we waited
+            if kid not in self._keys or time.monotonic() - self._keys_fetched_at > self.jwks_ttl:
+                try:
+                    await self._fetch_keys()
+                except (httpx.HTTPError, jwt.PyJWKSetError):
+                    # keep serving the old keys; unknown kids fall back to GoTrue
+                    self._keys_fetched_at = time.monotonic()
+        return self._keys.get(kid)
+
+    async def verify(self, access_token: str) -> Optional[User]:
+        header = jwt.get_unverified_header(access_token)
+        algorithm = header.get("alg")
+
+        if algorithm in SYMMETRIC_ALGORITHMS:
+            if not self.secret:
+                return None
+            key: Any = self.secret
+        elif algorithm in ASYMMETRIC_ALGORITHMS:
+            signing_key = await self._get_signing_key(header.get("kid"))
+            if signing_key is None:
+                return None
+            key = signing_key.key
+        else:
+            return None
+
+        claims = jwt.decode(
+            access_token,
+            key,
+            algorithms=[algorithm],
+            audience=self.audience,
+            leeway=self.leeway,
+            options={"require": ["exp", "sub"]},
+        )
+        return user_from_claims(claims)
+
+
+class UserCache(TTLCache[str, User]):
+    """Decoded users keyed by a hash of their access token."""
+
+    def get_user(self, access_token: str) -> Optional[User]:
+        return self.get(hash_token(access_token))
+
+    def set_user(self, access_token: str, user: User) -> None:
+        ttl = token_ttl(access_token)
+        self.set(hash_token(access_token), user, ttl=ttl)
+
+    def revoke(self, access_token: str) -> None:
+        self.pop(hash_token(access_token))
@@ -5,14 +5,18 @@ from sqlalchemy import (
     BigInteger,
     Boolean,
     Column,
+    Computed,
     DateTime,
     Enum,
     ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
     String,
     Text,
     UniqueConstraint,
 )
-from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR, UUID
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, relationship
 from sqlalchemy.sql import func
@@ -228,10 +232,55 @@ class CourseMembership(Base):
 
     course = relationship("Course")
 
+    __table_args__ = (
+        Index("ix_course_membership_user_id", "user_id", "course_id"),
+    )
+
     def __repr__(self):
         return f"<CourseMembership(id={self.id}, course_id='{self.course_id}', user_id='{self.user_id}')>"
 
 
+class CourseSyncState(Base):
+    """Per-user watermark of the last Canvas sync of a course."""
+
+    __tablename__ = "course_sync_state"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    created_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    updated_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
+    user_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("profiles.id", onupdate="CASCADE", ondelete="CASCADE"),
+        nullable=False,
+    )
+    course_id = Column(
+        BigInteger,
+        ForeignKey("course.id", onupdate="CASCADE", ondelete="CASCADE"),
+        nullable=False,
+    )
+    files_etag = Column(String, nullable=True)
+    modules_etag = Column(String, nullable=True)
+    # newest canvas `updated_at` seen across the course's files
+    watermark = Column(DateTime(timezone=True), nullable=True)
+    synced_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "course_id", name="unique_course_sync_state_user_course"
+        ),
+    )
+
+    def __repr__(self):
+        return f"<CourseSyncState(user_id='{self.user_id}', course_id={self.course_id}, watermark='{self.watermark}')>"
+
+
 class Preference(Base):
     __tablename__ = "preference"
 
@@ -264,6 +313,7 @@ class JobStatus(enum.Enum):
 class JobType(enum.Enum):
     COURSE_SYNC = "COURSE_SYNC"
     COURSE_MATERIAL_SYNC = "COURSE_MATERIAL_SYNC"
+    CALENDAR_SYNC = "CALENDAR_SYNC"
 
 
 class Job(Base):
@@ -284,6 +334,15 @@ class Job(Base):
         Enum(JobStatus, name="job_status"), nullable=False, default=JobStatus.PENDING
     )
     error_message = Column(Text, nullable=True)
+    result = Column(JSONB, nullable=True)
+    # job arguments, e.g. {"course_id": 1} for COURSE_MATERIAL_SYNC
+    payload = Column(JSONB, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    max_attempts = Column(Integer, nullable=False, default=3, server_default="3")
+    # earliest time a worker may pick the job up; pushed back on retry
+    run_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    locked_by = Column(Text, nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
     user_id = Column(
         UUID(as_uuid=True),
         ForeignKey("profiles.id", onupdate="CASCADE", ondelete="CASCADE"),
@@ -292,6 +351,8 @@ class Job(Base):
 
     profile = relationship("Profiles", lazy="selectin")
 
+    __table_args__ = (Index("ix_job_status_run_at", "status", "run_at"),)
+
     def __repr__(self):
         return f"<Job(id={self.id}, type='{self.type}', status='{self.status}', user_id='{self.user_id}')>"
 
@@ -363,17 +424,33 @@ class ChatroomMember(Base):
         return f"<ChatroomMember(chatroom_id={self.chatroom_id}, user_id='{self.user_id}', is_admin={self.is_admin})>"
 
 
+# dimensions of settings.embedding_model (text-embedding-ada-002)
+EMBEDDING_DIMENSIONS = 1536
+# postgres text search configuration of material_documents.content_tsv; queries
+# must parse with the same one to use its index
+TEXT_SEARCH_CONFIG = "english"
+
+
 class MaterialDocument(Base):
     __tablename__ = "material_documents"
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     content = Column(Text, nullable=True)
     meta_data = Column("metadata", JSONB, nullable=True)
-    embedding = Column(Vector, nullable=True)
+    embedding = Column(Vector(EMBEDDING_DIMENSIONS), nullable=True)
+    # kept up to date by postgres, for full-text search next to the embedding
+    content_tsv = Column(
+        TSVECTOR,
+        Computed(
+            f"to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(content, ''))",
+            persisted=True,
+        ),
+    )
     course_id = Column(
         BigInteger,
         ForeignKey("course.id", onupdate="CASCADE", ondelete="CASCADE"),
         nullable=True,
+        index=True,
     )
     course_material_id = Column(
         BigInteger,
@@ -385,5 +462,202 @@ class MaterialDocument(Base):
         "CourseMaterial", back_populates="documents", lazy="selectin"
     )
 
+    __table_args__ = (
+        Index(
+            "ix_material_documents_embedding_hnsw",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+        Index(
+            "ix_material_documents_content_tsv",
+            "content_tsv",
+            postgresql_using="gin",
+        ),
+    )
+
     def __repr__(self):
         return f"<MaterialDocument(id={self.id})>"
+
+
+class EmbeddingCache(Base):
+    """Embeddings keyed by a hash of the normalized chunk text and model."""
+
+    __tablename__ = "embedding_cache"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    created_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    content_hash = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    embedding = Column(Vector, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("content_hash", "model", name="unique_embedding_cache_hash_model"),
+    )
+
+    def __repr__(self):
+        return f"<EmbeddingCache(id={self.id}, model='{self.model}', content_hash='{self.content_hash}')>"
+
+
+class AgentCheckpoint(Base):
+    """LangGraph checkpoint without its channel values (see AgentCheckpointBlob)."""
+
+    __tablename__ = "agent_checkpoint"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    created_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+    thread_id = Column(String, nullable=False)
+    checkpoint_ns = Column(String, nullable=False, server_default="")
+    checkpoint_id = Column(String, nullable=False)
+    parent_checkpoint_id = Column(String, nullable=True)
+    type = Column(String, nullable=False)
+    checkpoint = Column(LargeBinary, nullable=False)
+    # channel -> version, used to find the blobs of a checkpoint
+    channel_versions = Column(JSONB, nullable=False)
+    metadata_type = Column(String, nullable=False)
+    meta_data = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "thread_id",
+            "checkpoint_ns",
+            "checkpoint_id",
+            name="unique_agent_checkpoint_thread_ns_id",
+        ),
+    )
+
+    def __repr__(self):
+        return f"<AgentCheckpoint(thread_id='{self.thread_id}', checkpoint_id='{self.checkpoint_id}')>"
+
+
+class AgentCheckpointBlob(Base):
+    """One version of a channel value, shared by every checkpoint that uses it."""
+
+    __tablename__ = "agent_checkpoint_blob"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    thread_id = Column(String, nullable=False)
+    checkpoint_ns = Column(String, nullable=False, server_default="")
+    channel = Column(String, nullable=False)
+    version = Column(String, nullable=False)
+    type = Column(String, nullable=False)
+    blob = Column(LargeBinary, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "thread_id",
+            "checkpoint_ns",
+            "channel",
+            "version",
+            name="unique_agent_checkpoint_blob_thread_ns_channel_version",
+        ),
+    )
+
+
+class AgentCheckpointWrite(Base):
+    """Pending writes of a task, stored against the checkpoint they apply to."""
+
+    __tablename__ = "agent_checkpoint_write"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    thread_id = Column(String, nullable=False)
+    checkpoint_ns = Column(String, nullable=False, server_default="")
+    checkpoint_id = Column(String, nullable=False)
+    task_id = Column(String, nullable=False)
+    idx = Column(Integer, nullable=False)
+    channel = Column(String, nullable=False)
+    type = Column(String, nullable=False)
+    blob = Column(LargeBinary, nullable=False)
+    task_path = Column(String, nullable=False, server_default="")
+
+    __table_args__ = (
+        UniqueConstraint(
+            "thread_id",
+            "checkpoint_ns",
+            "checkpoint_id",
+            "task_id",
+            "idx",
+            name="unique_agent_checkpoint_write_thread_ns_id_task_idx",
+        ),
+    )
+
+
+class CanvasCacheEntry(Base):
+    """Shared backend of the Canvas response cache (hai_canvas_cache_backend=postgres)."""
+
+    __tablename__ = "canvas_response_cache"
+
+    key = Column(String, primary_key=True)
+    user_id = Column(String, nullable=False, index=True)
+    value = Column(JSONB, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class CalendarEvent(Base):
+    """Local mirror of a user's Google Calendar event (see calendar_mirror.py)."""
+
+    __tablename__ = "calendar_event"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    user_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("profiles.id", onupdate="CASCADE", ondelete="CASCADE"),
+        nullable=False,
+    )
+    calendar_id = Column(String, nullable=False)
+    event_id = Column(String, nullable=False)
+    summary = Column(String, nullable=True)
+    start_at = Column(DateTime(timezone=True), nullable=False)
+    end_at = Column(DateTime(timezone=True), nullable=False)
+    all_day = Column(Boolean, nullable=False, default=False)
+    # the event as returned by events.list
+    raw = Column(JSONB, nullable=False)
+    synced_at = Column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id",
+            "calendar_id",
+            "event_id",
+            name="unique_calendar_event_user_calendar_event",
+        ),
+        Index(
+            "ix_calendar_event_user_calendar_start",
+            "user_id",
+            "calendar_id",
+            "start_at",
+        ),
+    )
+
+
+class CalendarSyncState(Base):
+    """Google ``syncToken`` and push channel of a mirrored calendar."""
+
+    __tablename__ = "calendar_sync_state"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    user_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("profiles.id", onupdate="CASCADE", ondelete="CASCADE"),
+        nullable=False,
+    )
+    calendar_id = Column(String, nullable=False)
+    sync_token = Column(String, nullable=True)
+    synced_at = Column(DateTime(timezone=True), nullable=True)
+    channel_id = Column(String, nullable=True, unique=True)
+    channel_resource_id = Column(String, nullable=True)
+    channel_token = Column(String, nullable=True)
+    channel_expires_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "calendar_id", name="unique_calendar_sync_state_user_calendar"
+        ),
+    )
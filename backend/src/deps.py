@@ -1,17 +1,34 @@
 # client to interact with google calendar
+import asyncio
+import hashlib
+import json
+import random
 from datetime import datetime, timedelta, timezone
-from typing import Annotated, Any
+from functools import cached_property, lru_cache
+from typing import Annotated, Any, AsyncIterator
+from urllib.parse import quote
 
 import httpx
+import jwt
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import Resource, build
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from openai import AsyncOpenAI, OpenAI
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.pool import QueuePool
+from supabase import Client as SupabaseClient
 from supabase import create_client
 from supabase_auth import AsyncGoTrueClient, User
 from supabase_auth.errors import AuthApiError
 
+from src.auth import JWTVerifier, UserCache, hash_token
+from src.cache import TTLCache
 from src.settings import Settings, settings
 
 
@@ -30,10 +47,13 @@ class ExternalApiError(Exception):
 class CanvasApiError(ExternalApiError): ...
 
 
+class GoogleApiError(ExternalApiError): ...
+
+
 class GoogleCalendarClient:
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, flow: Flow | None = None):
         self.settings = settings
-        self.flow = get_flow()
+        self.flow = flow or get_flow()
         self.client: Resource | None = None
 
     def authenticate(self, code: str):
@@ -65,25 +85,265 @@ class GoogleCalendarClient:
         return event_list.get("items", [])
 
 
+class GoogleCalendarApi:
+    """Async client for the Google Calendar v3 REST API.
+
+    Talks to the API directly over a shared ``httpx.AsyncClient`` instead of a
+    ``googleapiclient`` service, so no discovery document is built per call and
+    connections are pooled across users. The OAuth access token lives on the
+    instance; refreshing it is up to the caller (see ``TokenStore``).
+    """
+
+    BASE_URL = "https://www.googleapis.com/calendar/v3"
+
+    def __init__(self, token: str, client: httpx.AsyncClient | None = None):
+        self.client = client or httpx.AsyncClient(base_url=self.BASE_URL)
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    async def request(self, method: str, url: str, **kwargs) -> Any:
+        response = await self.client.request(
+            method, url, headers=self.headers, **kwargs
+        )
+        if response.status_code >= 400:
+            raise GoogleApiError(response.status_code, response.text)
+        return response.json()
+
+    async def list_calendars(self) -> list[dict[str, Any]]:
+        items: list[dict[str, Any]] = []
+        params: dict[str, Any] = {}
+        while True:
+            page = await self.request("GET", "/users/me/calendarList", params=params)
+            items.extend(page.get("items", []))
+            if "nextPageToken" not in page:
+                return items
+            params["pageToken"] = page["nextPageToken"]
+
+    async def list_events(self, calendar_id: str, **params) -> dict[str, Any]:
+        return await self.request(
+            "GET", f"/calendars/{quote(calendar_id)}/events", params=params
+        )
+
+    async def get_event(
+        self, calendar_id: str, event_id: str, **params
+    ) -> dict[str, Any]:
+        return await self.request(
+            "GET",
+            f"/calendars/{quote(calendar_id)}/events/{quote(event_id)}",
+            params=params,
+        )
+
+    async def insert_event(
+        self, calendar_id: str, event: dict[str, Any]
+    ) -> dict[str, Any]:
+        return await self.request(
+            "POST", f"/calendars/{quote(calendar_id)}/events", json=event
+        )
+
+    async def update_event(
+        self, calendar_id: str, event_id: str, event: dict[str, Any]
+    ) -> dict[str, Any]:
+        return await self.request(
+            "PUT",
+            f"/calendars/{quote(calendar_id)}/events/{quote(event_id)}",
+            json=event,
+        )
+
+    async def watch_events(
+        self, calendar_id: str, channel: dict[str, Any]
+    ) -> dict[str, Any]:
+        """Open a push notification channel for changes to the calendar's events."""
+        return await self.request(
+            "POST", f"/calendars/{quote(calendar_id)}/events/watch", json=channel
+        )
+
+    async def stop_channel(self, channel_id: str, resource_id: str) -> None:
+        response = await self.client.post(
+            "/channels/stop",
+            headers=self.headers,
+            json={"id": channel_id, "resourceId": resource_id},
+        )
+        if response.status_code >= 400:
+            raise GoogleApiError(response.status_code, response.text)
+
+
 # client to interact with canvas api
 class CanvasClient:
-    def __init__(self, settings: Settings):
+    """Async Canvas API client.
+
+    The underlying ``httpx.AsyncClient`` is shared between instances, so the
+    access token lives on the instance and is sent per request instead of
+    being set on the (shared) client headers. List endpoints follow the
+    ``Link`` header until every page is read, and throttled requests are
+    retried with exponential backoff.
+    """
+
+    RETRY_STATUS_CODES = {429, 502, 503, 504}
+    # marks the combined ETag of a listing longer than one page
+    PAGED_ETAG_PREFIX = "pages:"
+
+    def __init__(
+        self,
+        settings: Settings,
+        client: httpx.AsyncClient | None = None,
+        token: str | None = None,
+        semaphores: TTLCache[str, asyncio.Semaphore] | None = None,
+    ):
         self.settings = settings
-        self.client = httpx.AsyncClient(
-            base_url=settings.canvas_api_url,
-            headers={"Authorization": f"Bearer {settings.canvas_api_token}"},
+        self.client = client or httpx.AsyncClient(base_url=settings.canvas_api_url)
+        self.headers = {
+            "Authorization": f"Bearer {token or settings.canvas_api_token}"
+        }
+        # bound fan-out per token so one sync can't exhaust canvas rate limits;
+        # keyed by token hash and shared by every client built from ``Resources``
+        self.semaphores = semaphores if semaphores is not None else TTLCache(16, 3600)
+
+    def update_api_token(self, token: str):
+        self.headers["Authorization"] = f"Bearer {token}"
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        key = hash_token(self.headers["Authorization"])
+        semaphore = self.semaphores.get(key)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.settings.canvas_max_concurrency)
+        # refreshes its ttl, so a token in use keeps its semaphore
+        self.semaphores.set(key, semaphore)
+        return semaphore
+
+    def _is_throttled(self, response: httpx.Response) -> bool:
+        if response.status_code in self.RETRY_STATUS_CODES:
+            return True
+        # canvas reports an exhausted rate limit bucket as a 403
+        return response.status_code == 403 and "Rate Limit Exceeded" in response.text
+
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> float:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        backoff = self.settings.canvas_retry_backoff * 2**attempt
+        return backoff + random.uniform(0, backoff)
+
+    async def request(
+        self, method: str, url: str, headers: dict[str, str] | None = None, **kwargs
+    ) -> httpx.Response:
+        if self.headers.get("Authorization") is None:
+            raise CanvasApiError(401, "Unauthorized")
+
+        headers = {**self.headers, **(headers or {})}
+        semaphore = self._semaphore()
+        for attempt in range(self.settings.canvas_max_retries + 1):
+            async with semaphore:
+                response = await self.client.request(
+                    method, url, headers=headers, **kwargs
+                )
+            if not self._is_throttled(response):
+                break
+            if attempt == self.settings.canvas_max_retries:
+                break
+            await asyncio.sleep(self._retry_delay(response, attempt))
+
+        if response.status_code >= 400:
+            raise CanvasApiError(response.status_code, response.text)
+        return response
+
+    async def get(self, url: str, **params) -> Any:
+        response = await self.request("GET", url, params=params or None)
+        return response.json()
+
+    async def get_all(self, url: str, **params) -> list[dict[str, Any]]:
+        """GET every page of a list endpoint by following ``Link: rel="next"``."""
+        items, _ = await self.get_all_if_modified(url, **params)
+        return items
+
+    async def get_all_if_modified(
+        self, url: str, etag: str | None = None, **params
+    ) -> tuple[list[dict[str, Any]] | None, str | None]:
+        """Conditional ``get_all``.
+
+        The returned ETag covers every page: the page's own ETag for a single
+        page listing, otherwise a hash of all the page ETags. Only the former
+        is sent as ``If-None-Match``, since a 304 for the first page says
+        nothing about the pages after it; a longer listing is read again and
+        reported unchanged if its combined ETag is the same.
+
+        Returns ``(None, etag)`` when nothing changed, otherwise every item and
+        the new ETag (None if a page came without one).
+        """
+        params.setdefault("per_page", self.settings.canvas_page_size)
+        headers = None
+        if etag and not etag.startswith(self.PAGED_ETAG_PREFIX):
+            headers = {"If-None-Match": etag}
+        response = await self.request("GET", url, headers=headers, params=params)
+        if response.status_code == 304:
+            return None, etag
+
+        page_etags = [response.headers.get("ETag")]
+        items = response.json()
+        next_url = response.links.get("next", {}).get("url")
+        while next_url:
+            # the next link already carries the query string
+            response = await self.request("GET", next_url)
+            page_etags.append(response.headers.get("ETag"))
+            items.extend(response.json())
+            next_url = response.links.get("next", {}).get("url")
+
+        new_etag = self._combine_etags(page_etags)
+        if etag and new_etag == etag:
+            return None, etag
+        return items, new_etag
+
+    def _combine_etags(self, etags: list[str | None]) -> str | None:
+        if None in etags:
+            return None
+        if len(etags) == 1:
+            return etags[0]
+        digest = hashlib.sha256("\n".join(etags).encode()).hexdigest()
+        return f"{self.PAGED_ETAG_PREFIX}{digest}"
+
+    async def list_courses(self, **params) -> list[dict[str, Any]]:
+        return await self.get_all("/api/v1/courses", **params)
+
+    async def get_course(
+        self, course_id: int | str, include: list[str] | None = None
+    ) -> dict[str, Any]:
+        params = {"include[]": include} if include else {}
+        return await self.get(f"/api/v1/courses/{course_id}", **params)
+
+    async def list_planner_items(
+        self, start_date: str, end_date: str, context_codes: list[str] | None = None
+    ) -> list[dict[str, Any]]:
+        params = {"start_date": start_date, "end_date": end_date}
+        if context_codes:
+            params["context_codes[]"] = context_codes
+        return await self.get_all("/api/v1/planner/items", **params)
+
+    async def list_assignments(self, course_id: int | str) -> list[dict[str, Any]]:
+        return await self.get_all(f"/api/v1/courses/{course_id}/assignments")
+
+    async def list_modules(self, course_id: int | str) -> list[dict[str, Any]]:
+        return await self.get_all(f"/api/v1/courses/{course_id}/modules")
+
+    async def list_module_items(
+        self, course_id: int | str, module_id: int | str
+    ) -> list[dict[str, Any]]:
+        return await self.get_all(
+            f"/api/v1/courses/{course_id}/modules/{module_id}/items"
         )
 
-    async def update_api_token(self, token: str):
-        self.client.headers["Authorization"] = f"Bearer {token}"
+    async def list_files(self, course_id: int | str, **params) -> list[dict[str, Any]]:
+        return await self.get_all(f"/api/v1/courses/{course_id}/files", **params)
+
+    async def get_file(self, course_id: int | str, file_id: int | str) -> dict[str, Any]:
+        return await self.get(f"/api/v1/courses/{course_id}/files/{file_id}")
+
+    async def list_enrollments(
+        self, course_id: int | str, **params
+    ) -> list[dict[str, Any]]:
+        return await self.get_all(f"/api/v1/courses/{course_id}/enrollments", **params)
 
     async def list_registered_courses(self) -> list[dict[str, Any]]:
-        if self.client.headers.get("Authorization") is None:
-            raise CanvasApiError(401, "Unauthorized")
-        response = await self.client.get(
-            "/api/v1/courses?enrollment_type[]=student&enrollment_state[]=active"
+        return await self.list_courses(
+            **{"enrollment_type[]": "student", "enrollment_state[]": "active"}
         )
-        return response.json()
 
     async def get_upcoming_tasks(
         self, n_days: int = 7, start_date: datetime = None, end_date: datetime = None
@@ -112,52 +372,208 @@ class CanvasClient:
             end_date_str = end_date.strftime("%Y-%m-%dT%H:%M:%S.000Z")
         except ValueError as e:
             raise ValueError(f"Error formatting dates: {str(e)}")
-        response = await self.client.get(
-            f"/api/v1/planner/items?start_date={start_date_str}&end_date={end_date_str}"
-        )
-        if response.status_code != 200:
-            raise CanvasApiError(response.status_code, response.text)
-        return response.json()
+        return await self.list_planner_items(start_date_str, end_date_str)
 
 
-# dependency injection container
-class Container:
-    def __init__(self, settings: Settings):
-        from src.application.openai import client as create_openai_client
+engine = create_async_engine(
+    settings.database_url,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=True,
+)
+session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+
+def _db_pool_metrics(engine: AsyncEngine) -> dict[str, Any]:
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"status": pool.status()}
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
 
+
+def _http_pool_metrics(client: httpx.AsyncClient) -> dict[str, Any]:
+    # httpx does not expose pool stats publicly, so peek at the httpcore pool
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []))
+    return {
+        "connections": len(connections),
+        "idle": sum(1 for connection in connections if connection.is_idle()),
+        "max_connections": getattr(pool, "_max_connections", None),
+    }
+
+
+class Resources:
+    """Application-scoped clients shared by every request.
+
+    Built once per process (see ``src.api.lifespan``) and closed on shutdown.
+    Everything here is safe to share between concurrent requests; per-user
+    state such as tokens or OAuth flows belongs on ``Container`` instead.
+    """
+
+    def __init__(self, settings: Settings):
         self.settings = settings
-        self.google_calendar_client = GoogleCalendarClient(settings)
-        self.canvas_client = CanvasClient(settings=settings)
-        async_session = async_sessionmaker(bind=engine)
-        self.db_session = async_session()
-        self.openai_client = create_openai_client()
-        self.supabase = create_client(settings.supabase_url, settings.supabase_anon_key)
+        self.engine = engine
+        self.session_factory = session_factory
+        self.canvas_http = httpx.AsyncClient(
+            base_url=settings.canvas_api_url,
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive_connections,
+            ),
+            timeout=settings.http_timeout,
+        )
+        self.canvas_semaphores: TTLCache[str, asyncio.Semaphore] = TTLCache(
+            settings.token_cache_size, settings.token_cache_ttl
+        )
+        self.google_http = httpx.AsyncClient(
+            base_url=GoogleCalendarApi.BASE_URL,
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive_connections,
+            ),
+            timeout=settings.http_timeout,
+        )
+        self.openai_client = OpenAI(api_key=settings.openai_api_key)
+        self.async_openai_client = AsyncOpenAI(api_key=settings.openai_api_key)
+        self.supabase: SupabaseClient = create_client(
+            settings.supabase_url, settings.supabase_anon_key
+        )
+        self.containers_created = 0
+        self.containers_active = 0
 
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "containers": {
+                "created": self.containers_created,
+                "active": self.containers_active,
+            },
+            "db": _db_pool_metrics(self.engine),
+            "canvas_http": _http_pool_metrics(self.canvas_http),
+            "google_http": _http_pool_metrics(self.google_http),
+        }
 
-ApplicationContainer = Annotated[Container, Depends(lambda: Container(settings))]
+    async def aclose(self):
+        await self.canvas_http.aclose()
+        await self.google_http.aclose()
+        await self.async_openai_client.close()
+        self.openai_client.close()
+        await self.engine.dispose()
 
 
-def get_flow():
-    return Flow.from_client_secrets_file(
-        settings.client_secrets_file,
-        scopes=settings.scopes,
-        redirect_uri=settings.redirect_uri,
-    )
+_resources: Resources | None = None
 
 
-GoogleCalendarFlow = Annotated[Flow, Depends(get_flow)]
+def get_resources() -> Resources:
+    """Return the process-wide ``Resources``, creating them on first use."""
+    global _resources
+    if _resources is None:
+        _resources = Resources(settings)
+    return _resources
+
+
+async def close_resources():
+    global _resources
+    if _resources is None:
+        return
+    await _resources.aclose()
+    _resources = None
+
+
+# dependency injection container
+class Container:
+    """Request-scoped view over the shared ``Resources``.
+
+    Only the cheap, per-request parts (DB session, per-user clients) are
+    created here; the expensive clients are borrowed from ``Resources``.
+    """
+
+    def __init__(self, resources: Resources, db_session: AsyncSession | None = None):
+        self.resources = resources
+        self.settings = resources.settings
+        self.openai_client = resources.openai_client
+        self.async_openai_client = resources.async_openai_client
+        self.supabase = resources.supabase
+        self._owns_db_session = db_session is None
+        self.db_session = db_session or resources.session_factory()
+        resources.containers_created += 1
+        resources.containers_active += 1
+
+    @cached_property
+    def google_calendar_client(self) -> GoogleCalendarClient:
+        return GoogleCalendarClient(self.settings)
+
+    @cached_property
+    def canvas_client(self) -> CanvasClient:
+        return CanvasClient(
+            self.settings,
+            client=self.resources.canvas_http,
+            semaphores=self.resources.canvas_semaphores,
+        )
 
-engine = create_async_engine(settings.database_url)
+    async def aclose(self):
+        self.resources.containers_active -= 1
+        if self._owns_db_session:
+            await self.db_session.close()
+
+
+def get_canvas_client(token: str) -> CanvasClient:
+    """Canvas client for one user's token, backed by the shared connection pool."""
+    resources = get_resources()
+    return CanvasClient(
+        resources.settings,
+        client=resources.canvas_http,
+        token=token,
+        semaphores=resources.canvas_semaphores,
+    )
+
+
+def get_google_calendar_api(token: str) -> GoogleCalendarApi:
+    """Google Calendar client for one user's access token, on the shared pool."""
+    return GoogleCalendarApi(token, client=get_resources().google_http)
 
 
 async def get_session():
-    async_session = async_sessionmaker(bind=engine, expire_on_commit=False)
-    async with async_session() as session:
+    async with session_factory() as session:
         yield session
 
 
 AsyncDBSession = Annotated[AsyncSession, Depends(get_session)]
 
+
+async def get_container(db_session: AsyncDBSession) -> AsyncIterator[Container]:
+    container = Container(get_resources(), db_session=db_session)
+    try:
+        yield container
+    finally:
+        await container.aclose()
+
+
+ApplicationContainer = Annotated[Container, Depends(get_container)]
+
+
+@lru_cache
+def load_client_config(client_secrets_file: str) -> dict[str, Any]:
+    """Read the Google client secrets once instead of on every OAuth flow."""
+    with open(client_secrets_file) as f:
+        return json.load(f)
+
+
+def get_flow():
+    return Flow.from_client_config(
+        load_client_config(settings.client_secrets_file),
+        scopes=settings.scopes,
+        redirect_uri=settings.redirect_uri,
+    )
+
+
+GoogleCalendarFlow = Annotated[Flow, Depends(get_flow)]
+
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl="please login by supabase-js to get token"
 )
@@ -172,17 +588,51 @@ gotrue_client = AsyncGoTrueClient(
 )
 
 
-async def get_current_user(access_token: AccessTokenDep) -> User:
-    """get current user from access_token and validate same time"""
+jwt_verifier = JWTVerifier(settings)
+user_cache = UserCache(max_size=settings.auth_cache_size, ttl=settings.auth_cache_ttl)
+# tokens GoTrue has rejected, so replays don't cost another round-trip
+revoked_tokens: TTLCache[str, bool] = TTLCache(
+    max_size=settings.auth_cache_size, ttl=settings.auth_cache_ttl
+)
+
+
+async def verify_access_token(access_token: str) -> User:
+    """Resolve an access token to a user, verifying locally when possible.
+
+    Decoded users are cached by token hash until the token expires (or the
+    cache TTL passes). GoTrue is only consulted for tokens that cannot be
+    verified in-process, e.g. when no JWT secret is configured or the
+    signing key is unknown.
+    """
+    cached_user = user_cache.get_user(access_token)
+    if cached_user is not None:
+        return cached_user
+
+    if hash_token(access_token) in revoked_tokens:
+        raise HTTPException(status_code=401, detail="Invalid access token")
+
+    user = None
+    if settings.gotrue_jwt_verification == "local":
+        try:
+            user = await jwt_verifier.verify(access_token)
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid access token")
+
+    if user is None:
+        user = await _get_user_from_gotrue(access_token)
+
+    user_cache.set_user(access_token, user)
+    return user
+
+
+async def _get_user_from_gotrue(access_token: str) -> User:
     if not gotrue_client:
         raise HTTPException(status_code=500, detail="Super client not initialized")
 
-    if not access_token:
-        raise HTTPException(status_code=401, detail="Access token not found")
-
     try:
         user_rsp = await gotrue_client.get_user(jwt=access_token)
     except AuthApiError:
+        revoked_tokens.set(hash_token(access_token), True)
         raise HTTPException(status_code=401, detail="Invalid access token")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
@@ -193,6 +643,14 @@ async def get_current_user(access_token: AccessTokenDep) -> User:
     return user_rsp.user
 
 
+async def get_current_user(access_token: AccessTokenDep) -> User:
+    """get current user from access_token and validate same time"""
+    if not access_token:
+        raise HTTPException(status_code=401, detail="Access token not found")
+
+    return await verify_access_token(access_token)
+
+
 CurrentUser = Annotated[User, Depends(get_current_user)]
 
 
@@ -1,20 +1,24 @@
 import base64
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
-import uuid
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Header, HTTPException, Query
 from fastapi.responses import RedirectResponse
-from google.oauth2.credentials import Credentials
 from pydantic import BaseModel
-from sqlalchemy import select, update
+from sqlalchemy import select
 from starlette.requests import Request
 
-from src.application import usecase_v2
+from src.application import calendar_mirror, usecase_v2
 from src.application.external_usecase import list_google_calendars
+from src.application.token_store import TokenNotFoundError, get_token_store
 from src.database.models import Integration
-from src.deps import ApplicationContainer, AsyncDBSession, CurrentUser, gotrue_client
-from src.settings import settings
+from src.deps import (
+    ApplicationContainer,
+    AsyncDBSession,
+    CurrentUser,
+    get_google_calendar_api,
+    verify_access_token,
+)
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -58,15 +62,7 @@ async def oauth2callback(
         if not access_token:
             raise HTTPException(status_code=400, detail="Missing access token in state")
 
-        # Get user from Supabase using the access token
-        if not gotrue_client:
-            raise HTTPException(status_code=500, detail="Auth client not initialized")
-
-        user_response = await gotrue_client.get_user(jwt=access_token)
-        if not user_response:
-            raise HTTPException(status_code=401, detail="Invalid access token")
-
-        user = user_response.user
+        user = await verify_access_token(access_token)
 
         # Get Google credentials
         calendar_client = container.google_calendar_client
@@ -96,6 +92,7 @@ async def oauth2callback(
             session.add(integration)
 
         await session.commit()
+        get_token_store().invalidate(user.id, "google")
 
         # Redirect back to the original page
         return RedirectResponse(url=f"{redirect_uri}?success=true")
@@ -163,6 +160,7 @@ async def canvas_connect(
         )
         session.add(integration)
     await session.commit()
+    get_token_store().invalidate(current_user.id, "canvas")
 
     return CanvasConnectOut(success=True, message="Connected to Canvas API")
 
@@ -193,45 +191,46 @@ async def check_required_integrations(
 
 @router.get("/google/calendars")
 async def get_google_calendars(current_user: CurrentUser, session: AsyncDBSession):
-    stmt = select(Integration).where(
-        Integration.user_id == current_user.id, Integration.type == "google"
-    )
-    integration = await session.execute(stmt)
-    integration = integration.scalar_one_or_none()
-    if integration is None:
+    try:
+        token = await get_token_store().get(session, current_user.id, "google")
+    except TokenNotFoundError:
         raise HTTPException(status_code=400, detail="Missing Google integration")
 
-    credentials = Credentials(
-        token=integration.token,
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=settings.gcal_client_id,
-        client_secret=settings.gcal_client_secret,
-        refresh_token=integration.refresh_token,
-    )
-
-    if credentials.expired:
-        credentials.refresh(Request())
-        await session.execute(
-            update(Integration)
-            .where(
-                Integration.user_id == uuid.UUID(current_user.id),
-                Integration.type == "google",
-            )
-            .values(token=credentials.token, refresh_token=credentials.refresh_token)
-        )
-    calendars = list_google_calendars(credentials)
+    calendars = await list_google_calendars(get_google_calendar_api(token.token))
     return calendars
 
 
 @router.get("/google/events")
 async def get_google_events(
-    current_user: CurrentUser, session: AsyncDBSession, date: str
+    current_user: CurrentUser,
+    session: AsyncDBSession,
+    date: str,
+    days: int = Query(1, ge=1, le=31),
 ):
-    datetime_obj = datetime.strptime(date, "%Y-%m-%d")
-    events = await usecase_v2.get_events_on_date(session, current_user.id, datetime_obj)
+    start = datetime.strptime(date, "%Y-%m-%d")
+    events = await usecase_v2.get_events_between(
+        session, current_user.id, start, start + timedelta(days=days)
+    )
     return events
 
 
+@router.post("/google/notifications")
+async def google_calendar_notification(
+    session: AsyncDBSession,
+    x_goog_channel_id: str = Header(),
+    x_goog_resource_state: str = Header(),
+    x_goog_channel_token: str = Header(""),
+):
+    """Push notification from Google that a mirrored calendar changed."""
+    try:
+        job = await calendar_mirror.handle_notification(
+            session, x_goog_channel_id, x_goog_channel_token, x_goog_resource_state
+        )
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    return {"queued": job is not None}
+
+
 @router.post("/google/events")
 async def create_google_event(
     current_user: CurrentUser,
@@ -12,8 +12,10 @@ from sqlalchemy.orm import joinedload
 
 from src.application.agent import (
     ToolInvocation,
-    get_or_create_agent,
-    invalidate_agent_cache,
+    agent_config,
+    get_agent,
+    sse_response,
+    stream_agent_response,
 )
 from src.database.models import Chat, Chatroom, ChatroomMember, ChatroomType, Profiles
 from src.deps import (
@@ -215,6 +217,22 @@ async def get_chatroom_chats(chatroom_id: int, session: AsyncDBSession):
     ]
 
 
+CHATROOM_SYSTEM_PROMPT = """
+                              You are a helpful assistant that can help the user with their tasks.
+
+                              You can use the following tools to help the user:
+                              - get_study_progress_tool: Get the user's study progress.
+                              - sync_calendar_tool: Synchronize tasks with Google Calendar.
+                              - list_courses_tool: List all Canvas courses.
+                              - get_upcoming_assignments_and_quizzes_tool: Get upcoming assignments and quizzes.
+
+                              By using the tools, you can get information about the user's existing schedules, assignments, and quizzes. 
+                              With this information, you can help the user find available time slots for studying.
+
+                              If you cannot find any available time slots, you can suggest the user to create a new task.
+                              """
+
+
 class HandleMessageRequest(BaseModel):
     message: str
     thread_id: Optional[str] = None
@@ -245,28 +263,13 @@ async def handle_message(
     db_session.add(human_message)
 
     try:
-        agent = get_or_create_agent(container, str(current_user.id))
-        config = {"configurable": {"thread_id": request.thread_id or "default"}}
+        agent = get_agent()
+        config = agent_config(container, str(current_user.id), request.thread_id)
 
         response = await agent.ainvoke(
             {
                 "messages": [
-                    SystemMessage(
-                        content="""
-                              You are a helpful assistant that can help the user with their tasks.
-
-                              You can use the following tools to help the user:
-                              - get_study_progress_tool: Get the user's study progress.
-                              - sync_calendar_tool: Synchronize tasks with Google Calendar.
-                              - list_courses_tool: List all Canvas courses.
-                              - get_upcoming_assignments_and_quizzes_tool: Get upcoming assignments and quizzes.
-
-                              By using the tools, you can get information about the user's existing schedules, assignments, and quizzes. 
-                              With this information, you can help the user find available time slots for studying.
-
-                              If you cannot find any available time slots, you can suggest the user to create a new task.
-                              """
-                    ),
+                    SystemMessage(content=CHATROOM_SYSTEM_PROMPT),
                     HumanMessage(content=request.message),
                 ]
             },
@@ -323,10 +326,26 @@ async def handle_message(
 
         return response
     except Exception as e:
-        invalidate_agent_cache(str(current_user.id))
-
         raise HTTPException(
             status_code=500, detail={"message": f"Agent error: {str(e)}"}
         )
     finally:
         await db_session.commit()
+
+
+@router.post("/{chatroom_id}/messages/stream")
+async def stream_message(
+    chatroom_id: int,
+    request: HandleMessageRequest,
+    current_user: CurrentUser,
+):
+    """Like ``handle_message``, but streams the agent's answer as Server-Sent Events."""
+    return sse_response(
+        stream_agent_response(
+            CHATROOM_SYSTEM_PROMPT,
+            request.message,
+            current_user.id,
+            request.thread_id,
+            chatroom_id=chatroom_id,
+        )
+    )
@@ -1,7 +1,13 @@
 from fastapi import APIRouter
 
+from src.deps import get_resources
+
 router = APIRouter(prefix="/health", tags=["health"])
 
 @router.get("/")
 async def health():
     return {"status": "ok"}
+
+@router.get("/pools")
+async def pool_metrics():
+    return get_resources().metrics()
@@ -1,21 +1,13 @@
 from datetime import datetime
-from typing import List
+from typing import Any, List
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from sqlalchemy import desc, select
 
-from src.application.jobs import extract_course_content, process_course_materials
-from src.database.models import (
-    CourseMaterial,
-    CourseMaterialType,
-    Integration,
-    Job,
-    JobStatus,
-    JobType,
-)
+from src.application.job_queue import enqueue_job
+from src.database.models import CourseMaterial, CourseMaterialType, Job, JobType
 from src.deps import AsyncDBSession, CurrentUser
-from src.settings import settings
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
@@ -25,97 +17,25 @@ class JobResponse(BaseModel):
     type: str
     status: str
     error_message: str | None
+    result: dict[str, Any] | None = None
     created_at: datetime
     updated_at: datetime
 
 
-async def run_course_sync(
-    db_session: AsyncDBSession,
-    user_id: str,
-    job_id: int,
-):
-    try:
-        # Get Canvas integration
-        stmt = select(Integration).where(
-            Integration.user_id == user_id, Integration.type == "canvas"
-        )
-        result = await db_session.execute(stmt)
-        integration = result.scalar_one_or_none()
-
-        if not integration:
-            raise Exception("Canvas integration not found")
-
-        # Update job status to IN_PROGRESS
-        stmt = (
-            Job.__table__.update()
-            .where(Job.id == job_id)
-            .values(status=JobStatus.IN_PROGRESS)
-        )
-        await db_session.execute(stmt)
-        await db_session.commit()
-        await db_session.refresh(integration)
-
-        assert integration.token is not None
-
-        # Run the extraction
-        await extract_course_content(
-            canvas_api_url=settings.canvas_api_url,
-            canvas_api_key=integration.token,
-            db_session=db_session,
-            user_id=user_id,
-        )
-
-        # Update job status to COMPLETED
-        stmt = (
-            Job.__table__.update()
-            .where(Job.id == job_id)
-            .values(status=JobStatus.COMPLETED)
-        )
-        await db_session.execute(stmt)
-        await db_session.commit()
-
-    except Exception as e:
-        # Update job status to FAILED with error message
-        stmt = (
-            Job.__table__.update()
-            .where(Job.id == job_id)
-            .values(status=JobStatus.FAILED, error_message=str(e))
-        )
-        await db_session.execute(stmt)
-        await db_session.commit()
-        raise
-
-
 @router.post("/course-sync", response_model=JobResponse)
 async def trigger_course_sync(
-    background_tasks: BackgroundTasks,
     current_user: CurrentUser,
     db_session: AsyncDBSession,
 ):
-    """Trigger a course sync job"""
-    # Create new job record
-    job = Job(
-        type=JobType.COURSE_SYNC,
-        status=JobStatus.PENDING,
-        user_id=current_user.id,
-    )
-    db_session.add(job)
-    await db_session.commit()
-    await db_session.refresh(job)
-
-    # Start background task
-    background_tasks.add_task(
-        run_course_sync,
-        db_session=db_session,
-        user_id=str(current_user.id),
-        job_id=job.id,
-    )
+    """Queue a course sync job; it is picked up by a worker (src/worker.py)"""
+    job = await enqueue_job(db_session, JobType.COURSE_SYNC, current_user.id)
 
     return JobResponse(
         id=job.id,
         type=job.type.value,
         status=job.status.value,
         error_message=job.error_message,
+        result=job.result,
         created_at=job.created_at,
         updated_at=job.updated_at,
     )
@@ -140,6 +60,7 @@ async def get_job_status(
         type=job.type.value,
         status=job.status.value,
         error_message=job.error_message,
+        result=job.result,
         created_at=job.created_at,
         updated_at=job.updated_at,
     )
@@ -170,6 +91,7 @@ async def list_jobs(
             type=job.type.value,
             status=job.status.value,
             error_message=job.error_message,
+            result=job.result,
             created_at=job.created_at,
             updated_at=job.updated_at,
         )
@@ -182,7 +104,6 @@ async def trigger_process_course_materials(
     course_id: int,
     db_session: AsyncDBSession,
     current_user: CurrentUser,
-    background_tasks: BackgroundTasks,
 ):
     # Get course materials
     stmt = select(CourseMaterial).where(
@@ -190,25 +111,15 @@ async def trigger_process_course_materials(
         CourseMaterial.type == CourseMaterialType.PDF,
         ~CourseMaterial.documents.any(),
     )
-    result = await db_session.execute(stmt)
-    course_materials = result.scalars().all()
-    if not course_materials:
+    result = await db_session.execute(stmt.limit(1))
+    if result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail="No course materials found")
 
-    # Create new job record
-    job = Job(
-        type=JobType.COURSE_MATERIAL_SYNC,
-        status=JobStatus.PENDING,
-        user_id=current_user.id,
-    )
-    db_session.add(job)
-    await db_session.commit()
-    await db_session.refresh(job)
-
-    background_tasks.add_task(
-        process_course_materials,
-        db_session=db_session,
-        course_materials=course_materials,
+    job = await enqueue_job(
+        db_session,
+        JobType.COURSE_MATERIAL_SYNC,
+        current_user.id,
+        payload={"course_id": course_id},
     )
 
     return JobResponse(
@@ -216,6 +127,7 @@ async def trigger_process_course_materials(
         type=job.type.value,
         status=job.status.value,
         error_message=job.error_message,
+        result=job.result,
         created_at=job.created_at,
         updated_at=job.updated_at,
     )
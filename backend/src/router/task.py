@@ -1,8 +1,11 @@
-from fastapi import APIRouter
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Query
 
 from src.application import usecase_v2
 from src.deps import AsyncDBSession, CurrentUser
-from src.schema import TaskIn, TaskOut
+from src.schema import FreeSlotOut, TaskIn, TaskOut
 
 router = APIRouter(prefix="/task", tags=["task"])
 
@@ -14,6 +17,19 @@ async def create_task(request: TaskIn, current_user: CurrentUser, session: Async
 async def list_tasks(current_user: CurrentUser, session: AsyncDBSession):
     return await usecase_v2.list_tasks(session, current_user.id)
 
+@router.get("/free-slots", response_model=list[FreeSlotOut])
+async def find_free_slots(
+    current_user: CurrentUser,
+    session: AsyncDBSession,
+    duration_minutes: int = Query(60, ge=15, le=480),
+    days: int = Query(7, ge=1, le=28),
+    due_at: Optional[datetime] = None,
+    limit: int = Query(5, ge=1, le=50),
+):
+    return await usecase_v2.find_free_slots(
+        session, current_user.id, duration_minutes, days, due_at, limit
+    )
+
 @router.get("/{task_id}", response_model=TaskOut)
 async def get_task(task_id: int, current_user: CurrentUser, session: AsyncDBSession):
     return await usecase_v2.get_task(session, current_user.id, task_id)
@@ -44,3 +44,12 @@ class SubTaskOut(BaseModel):
     description: Optional[str]
     estimated_time: Optional[int]
 
+
+class FreeSlotOut(BaseModel):
+    start: datetime
+    end: datetime
+    score: float
+    # whether the whole slot is inside the user's study_type window
+    preferred: bool
+
+    model_config = ConfigDict(from_attributes=True)
@@ -1,3 +1,5 @@
+from typing import Literal, Optional
+
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -5,16 +7,114 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class Settings(BaseSettings):
     canvas_api_url: str
     canvas_api_token: str
+    canvas_page_size: int = 100
+    canvas_max_concurrency: int = 8
+    canvas_max_retries: int = 5
+    canvas_retry_backoff: float = 0.5
+    # "memory" caches per process (invalidations reach every process via NOTIFY);
+    # "postgres" shares the cache between workers
+    canvas_cache_backend: Literal["memory", "postgres"] = "memory"
+    canvas_cache_size: int = 10000
+    # seconds to keep each kind of canvas response
+    canvas_cache_ttls: dict[str, float] = {
+        "courses": 3600,
+        "upcoming_work": 300,
+        "study_progress": 600,
+    }
 
     # gotrue
     gotrue_url: str
     gotrue_anon_key: str
+    # "local" verifies JWTs in-process and only asks GoTrue about tokens it
+    # cannot check itself; "remote" always asks GoTrue
+    gotrue_jwt_verification: Literal["local", "remote"] = "local"
+    gotrue_jwt_secret: Optional[str] = None
+    gotrue_jwt_audience: str = "authenticated"
+    gotrue_jwt_leeway: int = 10
+    gotrue_jwks_ttl: int = 3600
+    auth_cache_size: int = 10000
+    auth_cache_ttl: int = 300
+
+    # integration tokens (canvas/google), cached per worker
+    token_cache_size: int = 10000
+    token_cache_ttl: int = 600
+    # google access tokens are refreshed in the background this long before expiry
+    google_token_refresh_margin: int = 600
+    google_token_refresh_interval: int = 120
 
     # database
     database_url: str
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_recycle: int = 1800
+
+    # shared http connection pool
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_timeout: float = 30.0
 
     # openai
     openai_api_key: str
+    agent_model: str = "gpt-4o-mini"
+    # tool calls of one step run concurrently, at most this many per request
+    agent_tool_concurrency: int = 4
+    agent_tool_timeout: float = 20.0
+    # "postgres" keeps conversations in the database so they survive restarts
+    # and are shared by all workers; "memory" is for local development
+    agent_checkpointer: Literal["postgres", "memory"] = "postgres"
+    agent_checkpoints_per_thread: int = 20
+    # in-memory conversation threads kept by the "memory" checkpointer
+    agent_max_threads: int = 1000
+    # threads idle for longer than this are dropped
+    agent_thread_ttl: int = 24 * 3600
+    embedding_model: str = "text-embedding-ada-002"
+    # the embeddings endpoint accepts at most 2048 inputs / 300k tokens per request
+    embedding_batch_size: int = 512
+    embedding_batch_tokens: int = 250_000
+    embedding_max_concurrency: int = 4
+    # material chunks, counted in embedding_model tokens; each chunk repeats up to
+    # chunk_overlap_tokens of the end of the previous one
+    chunk_max_tokens: int = 300
+    chunk_overlap_tokens: int = 50
+
+    # material document retrieval (pgvector)
+    retriever_k: int = 6
+    # candidates visited per hnsw / lists scanned per ivfflat search
+    retriever_ef_search: int = 100
+    retriever_ivfflat_probes: int = 10
+    # hybrid retrieval: candidates taken from each of the vector and full-text
+    # rankings, and the reciprocal-rank fusion constant (60 in the RRF paper)
+    retriever_candidates: int = 40
+    retriever_rrf_k: int = 60
+    # query embeddings, per worker and (when persisted) in the embedding_cache table
+    query_embedding_cache_size: int = 10000
+    query_embedding_cache_ttl: int = 7 * 24 * 3600
+    query_embedding_cache_persist: bool = True
+    # results reused for a query at least this similar (cosine) to an earlier one
+    # in the same course; short-lived so newly ingested materials show up
+    retriever_result_cache_scopes: int = 1000
+    retriever_result_cache_per_scope: int = 128
+    retriever_result_cache_ttl: int = 600
+    retriever_result_cache_threshold: float = 0.97
+    # retrieved documents with at least this share of their word 3-grams already in
+    # a better-ranked one are dropped
+    retriever_dedup_threshold: float = 0.8
+
+    # pdf parsing: files parsed at once, each in a worker process of its own
+    pdf_max_workers: int = 2
+    pdf_timeout: float = 120.0
+    pdf_max_memory_mb: int = 1024
+    pdf_pages_per_task: int = 16
+    pdf_max_download_mb: int = 100
+
+    # background job worker (src/worker.py)
+    job_worker_concurrency: int = 2
+    job_poll_interval: float = 2.0
+    job_heartbeat_interval: float = 15.0
+    # in-progress jobs without a heartbeat for this long are requeued
+    job_stale_after: float = 120.0
+    job_max_attempts: int = 3
+    job_retry_backoff: float = 30.0
 
     # google calendar
     client_secrets_file: str = Field(
@@ -22,6 +122,15 @@ class Settings(BaseSettings):
     )
     gcal_client_id: str = Field(alias="GCAL_CLIENT_ID")
     gcal_client_secret: str = Field(alias="GCAL_CLIENT_SECRET")
+    # concurrent event inserts per calendar sync
+    gcal_insert_concurrency: int = 5
+    # local calendar mirror; without a push channel it is resynced once this old
+    calendar_mirror_max_age: float = 300.0
+    # public url of /auth/google/notifications, push channels are skipped if unset
+    gcal_webhook_url: Optional[str] = None
+    gcal_channel_ttl: int = 7 * 24 * 3600
+    # users have no timezone setting yet; used for study windows
+    default_timezone: str = "America/New_York"
     scopes: list[str] = Field(
         default=[
             "https://www.googleapis.com/auth/userinfo.profile",
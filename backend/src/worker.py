@@ -0,0 +1,168 @@
+# background job worker, run next to the api with `python -m src.worker`
+import asyncio
+import os
+import signal
+import socket
+import traceback
+import uuid
+from typing import Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.application.calendar_mirror import run_calendar_sync
+from src.application.canvas_cache import PostgresCacheBackend, get_canvas_cache
+from src.application.checkpoint import PostgresCheckpointSaver, get_checkpointer
+from src.application.chunking import get_chunker
+from src.application.job_queue import (
+    claim_jobs,
+    complete_job,
+    fail_job,
+    heartbeat,
+    recover_stale_jobs,
+)
+from src.application.jobs import run_course_sync, run_process_course_materials
+from src.application.pdf import shutdown_pdf_executor
+from src.application.token_store import get_token_store
+from src.database.models import Job, JobType
+from src.deps import close_resources, get_resources
+from src.settings import Settings, settings
+
+JobHandler = Callable[[AsyncSession, Job], Awaitable[dict | None]]
+
+JOB_HANDLERS: dict[JobType, JobHandler] = {
+    JobType.COURSE_SYNC: run_course_sync,
+    JobType.COURSE_MATERIAL_SYNC: run_process_course_materials,
+    JobType.CALENDAR_SYNC: run_calendar_sync,
+}
+
+
+class Worker:
+    """Claims jobs from the job table and runs at most ``concurrency`` at a time.
+
+    Several workers can run against the same database; ``SKIP LOCKED`` keeps
+    them from picking the same job. Running jobs send heartbeats, and jobs of
+    a worker that died are requeued by whichever worker polls next.
+    """
+
+    def __init__(
+        self,
+        settings: Settings,
+        session_factory: async_sessionmaker[AsyncSession],
+        worker_id: str | None = None,
+    ):
+        self.settings = settings
+        self.session_factory = session_factory
+        self.worker_id = (
+            worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        )
+        self.running: set[asyncio.Task] = set()
+        self.stopping = asyncio.Event()
+        self.pruned_at: float | None = None
+
+    def stop(self) -> None:
+        self.stopping.set()
+
+    async def run(self) -> None:
+        print(f"Worker {self.worker_id} started")
+        while not self.stopping.is_set():
+            try:
+                await self.poll()
+            except Exception as e:
+                print(f"Worker {self.worker_id} failed to poll jobs: {str(e)}")
+            try:
+                await asyncio.wait_for(
+                    self.stopping.wait(), timeout=self.settings.job_poll_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+
+        # let in-flight jobs finish; anything killed mid-way is recovered later
+        if self.running:
+            await asyncio.gather(*self.running, return_exceptions=True)
+        print(f"Worker {self.worker_id} stopped")
+
+    async def poll(self) -> None:
+        async with self.session_factory() as db_session:
+            recovered = await recover_stale_jobs(db_session, self.settings.job_stale_after)
+            if recovered:
+                print(f"Requeued {recovered} stale jobs")
+            free_slots = self.settings.job_worker_concurrency - len(self.running)
+            jobs = await claim_jobs(db_session, self.worker_id, free_slots)
+
+        for job in jobs:
+            task = asyncio.create_task(self.run_job(job))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+        await self.prune()
+
+    async def prune(self) -> None:
+        """Drop idle agent threads and expired cache rows, at most hourly."""
+        now = asyncio.get_running_loop().time()
+        if self.pruned_at is not None and now - self.pruned_at < 3600:
+            return
+        self.pruned_at = now
+
+        checkpointer = get_checkpointer()
+        if isinstance(checkpointer, PostgresCheckpointSaver):
+            pruned = await checkpointer.aprune(self.settings.agent_thread_ttl)
+            if pruned:
+                print(f"Pruned {pruned} idle agent threads")
+
+        cache_backend = get_canvas_cache().backend
+        if isinstance(cache_backend, PostgresCacheBackend):
+            purged = await cache_backend.purge_expired()
+            if purged:
+                print(f"Purged {purged} expired canvas cache entries")
+
+    async def run_job(self, job: Job) -> None:
+        beat = asyncio.create_task(self.send_heartbeats(job.id))
+        try:
+            async with self.session_factory() as db_session:
+                result = await JOB_HANDLERS[job.type](db_session, job)
+        except Exception as e:
+            traceback.print_exc()
+            async with self.session_factory() as db_session:
+                await fail_job(db_session, job, self.worker_id, str(e))
+        else:
+            async with self.session_factory() as db_session:
+                await complete_job(db_session, job.id, self.worker_id, result)
+        finally:
+            beat.cancel()
+
+    async def send_heartbeats(self, job_id: int) -> None:
+        while True:
+            await asyncio.sleep(self.settings.job_heartbeat_interval)
+            try:
+                async with self.session_factory() as db_session:
+                    if not await heartbeat(db_session, job_id, self.worker_id):
+                        print(f"Lost the lock on job {job_id}")
+                        return
+            except Exception as e:
+                print(f"Failed to send heartbeat for job {job_id}: {str(e)}")
+
+
+async def main() -> None:
+    resources = get_resources()
+    worker = Worker(settings, resources.session_factory)
+    # load the tokenizer and sentence model now rather than in the first job
+    await asyncio.to_thread(get_chunker)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    # like the api, follow the other processes' token and cache invalidations
+    await get_token_store().start()
+    await get_canvas_cache().start()
+    try:
+        await worker.run()
+    finally:
+        await get_canvas_cache().stop()
+        await get_token_store().stop()
+        shutdown_pdf_executor()
+        await close_resources()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,175 @@
+import json
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+
+from src.application import agent
+from src.application.agent import stream_agent_response
+from src.deps import get_current_user
+from src.router import chatroom
+
+USER_ID = uuid.uuid4()
+
+
+class FakeSession:
+    def __init__(self):
+        self.added = []
+        self.commits = 0
+
+    def add(self, row):
+        self.added.append(row)
+
+    async def commit(self):
+        self.commits += 1
+
+
+class FakeContainer:
+    def __init__(self, resources):
+        self.db_session = FakeSession()
+        self.closed = False
+        containers.append(self)
+
+    async def aclose(self):
+        self.closed = True
+
+
+containers: list[FakeContainer] = []
+
+
+class StubGraph:
+    """Replays ``events`` for any input; raises ``error`` after them if given."""
+
+    def __init__(self, events, answer="Hello!", error=None):
+        self.events = events
+        self.answer = answer
+        self.error = error
+
+    async def astream_events(self, inputs, config, version):
+        for event in self.events:
+            yield event
+        if self.error is not None:
+            raise self.error
+
+    async def aget_state(self, config):
+        return SimpleNamespace(values={"messages": [AIMessage(content=self.answer)]})
+
+
+EVENTS = [
+    {
+        "event": "on_tool_start",
+        "name": "list_courses",
+        "data": {"input": {}},
+    },
+    {
+        "event": "on_tool_end",
+        "name": "list_courses",
+        "data": {
+            "output": ToolMessage(content='{"courses": []}', tool_call_id="call-1")
+        },
+    },
+    {"event": "on_chat_model_stream", "data": {"chunk": AIMessageChunk(content="Hel")}},
+    {"event": "on_chat_model_stream", "data": {"chunk": AIMessageChunk(content="")}},
+    {"event": "on_chat_model_stream", "data": {"chunk": AIMessageChunk(content="lo!")}},
+]
+
+
+@pytest.fixture
+def use_graph(monkeypatch):
+    containers.clear()
+    monkeypatch.setattr(agent, "Container", FakeContainer)
+    monkeypatch.setattr(agent, "get_resources", lambda: None)
+
+    def use(graph):
+        monkeypatch.setattr(agent, "get_agent", lambda: graph)
+
+    return use
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(agent.router)
+    app.include_router(chatroom.router)
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=USER_ID)
+    return TestClient(app)
+
+
+def parse_sse(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for frame in body.split("\n\n"):
+        if not frame:
+            continue
+        event, data = frame.split("\n")
+        assert event.startswith("event: ") and data.startswith("data: ")
+        events.append((event[len("event: ") :], json.loads(data[len("data: ") :])))
+    return events
+
+
+@pytest.mark.parametrize(
+    "path", ["/agent/stream", "/chatrooms/7/messages/stream"], ids=["agent", "chatroom"]
+)
+def test_stream_frames_tool_calls_tokens_and_answer(client, use_graph, path):
+    use_graph(StubGraph(EVENTS))
+
+    response = client.post(path, json={"message": "What are my courses?"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+    events = parse_sse(response.text)
+    assert [event for event, _ in events] == [
+        "tool_start",
+        "tool_end",
+        "token",
+        "token",
+        "done",
+    ]
+    assert events[1][1] == {
+        "name": "list_courses",
+        "result": {"courses": []},
+        "state": "result",
+    }
+    assert [data["delta"] for event, data in events if event == "token"] == [
+        "Hel",
+        "lo!",
+    ]
+    assert events[-1][1]["message"] == "Hello!"
+
+    (container,) = containers
+    user, answer = container.db_session.added
+    assert (user.author, user.content) == ("user", "What are my courses?")
+    assert (answer.author, answer.content) == ("agent", "Hello!")
+    assert container.db_session.commits == 1 and container.closed
+
+
+def test_stream_reports_agent_failure_as_an_error_event(client, use_graph):
+    use_graph(StubGraph(EVENTS[:1], error=RuntimeError("model unavailable")))
+
+    response = client.post("/agent/stream", json={"message": "Hi"})
+
+    events = parse_sse(response.text)
+    assert events[-1] == ("error", {"message": "Agent error: model unavailable"})
+    # the user's message is still saved
+    (container,) = containers
+    assert [chat.author for chat in container.db_session.added] == ["user"]
+    assert container.db_session.commits == 1 and container.closed
+
+
+@pytest.mark.asyncio
+async def test_chat_is_saved_when_the_client_disconnects(use_graph):
+    use_graph(StubGraph(EVENTS))
+    stream = stream_agent_response("prompt", "What are my courses?", USER_ID, None)
+
+    assert (await stream.__anext__()).startswith("event: tool_start")
+    # what the streaming response does when the client goes away mid-answer
+    await stream.aclose()
+
+    (container,) = containers
+    assert [chat.content for chat in container.db_session.added] == [
+        "What are my courses?"
+    ]
+    assert container.db_session.commits == 1 and container.closed
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from src.application import agent
+from src.application.agent import agent_config, make_tool
+from src.settings import settings
+
+
+@pytest.mark.asyncio
+async def test_slow_tool_times_out_with_an_error_the_model_can_read():
+    async def slow_search(query: str):
+        """Search something slow."""
+        await asyncio.sleep(1)
+
+    tool = make_tool("slow_search", "Search something slow.", slow_search, timeout=0.01)
+
+    result = await tool.ainvoke(
+        {"query": "exams"}, config=agent_config(None, "user-1", None)
+    )
+
+    assert result == {"error": "slow_search did not finish within 0.01 seconds"}
+
+
+@pytest.mark.asyncio
+async def test_tool_calls_of_a_request_share_the_concurrency_cap(mocker):
+    container = mocker.patch.object(agent, "Container")
+    running = 0
+    most_running = 0
+
+    async def lookup(query: str):
+        """Look something up."""
+        nonlocal running, most_running
+        running += 1
+        most_running = max(most_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return {"query": query}
+
+    tool = make_tool("lookup", "Look something up.", lookup)
+    config = agent_config(None, "user-1", None)
+    calls = 2 * settings.agent_tool_concurrency
+
+    results = await asyncio.gather(
+        *(tool.ainvoke({"query": str(i)}, config=config) for i in range(calls))
+    )
+
+    assert [result["query"] for result in results] == [str(i) for i in range(calls)]
+    assert most_running == settings.agent_tool_concurrency
+    # the tool takes no config, so no container or DB session is opened for it
+    container.assert_not_called()
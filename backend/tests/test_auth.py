@@ -0,0 +1,69 @@
+import time
+
+import jwt
+import pytest
+
+from src.auth import JWTVerifier, UserCache
+from src.settings import settings
+
+TEST_SECRET_KEY = "test_secret_key_123456789_abcdefghij"
+TEST_USER_ID = "5d0f7bb9-3c3a-4a36-9d1b-8a5b0c6f2f11"
+
+
+@pytest.fixture
+def verifier():
+    return JWTVerifier(
+        settings.model_copy(update={"gotrue_jwt_secret": TEST_SECRET_KEY})
+    )
+
+
+def make_token(secret: str = TEST_SECRET_KEY, expires_in: int = 300, **claims):
+    now = int(time.time())
+    payload = {
+        "sub": TEST_USER_ID,
+        "aud": "authenticated",
+        "email": "john.doe@example.com",
+        "role": "authenticated",
+        "iat": now,
+        "exp": now + expires_in,
+        **claims,
+    }
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+@pytest.mark.asyncio
+async def test_verify_returns_user_for_valid_token(verifier: JWTVerifier):
+    user = await verifier.verify(make_token())
+    assert user.id == TEST_USER_ID
+    assert user.email == "john.doe@example.com"
+
+
+@pytest.mark.asyncio
+async def test_verify_rejects_expired_token(verifier: JWTVerifier):
+    with pytest.raises(jwt.ExpiredSignatureError):
+        await verifier.verify(make_token(expires_in=-60))
+
+
+@pytest.mark.asyncio
+async def test_verify_rejects_wrong_signature(verifier: JWTVerifier):
+    with pytest.raises(jwt.InvalidSignatureError):
+        await verifier.verify(make_token(secret="another_secret_key_123456789_abcdefg"))
+
+
+@pytest.mark.asyncio
+async def test_verify_defers_to_gotrue_without_secret():
+    verifier = JWTVerifier(settings.model_copy(update={"gotrue_jwt_secret": None}))
+    assert await verifier.verify(make_token()) is None
+
+
+@pytest.mark.asyncio
+async def test_user_cache_is_keyed_by_token(verifier: JWTVerifier):
+    token = make_token()
+    cache = UserCache(max_size=10, ttl=60)
+    cache.set_user(token, await verifier.verify(token))
+
+    assert cache.get_user(token).id == TEST_USER_ID
+    assert cache.get_user(make_token(email="other@example.com")) is None
+
+    cache.revoke(token)
+    assert cache.get_user(token) is None
@@ -0,0 +1,103 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from zoneinfo import ZoneInfo
+
+from src.application.calendar_mirror import (
+    event_row,
+    fetch_changes,
+    is_fresh,
+    list_busy_intervals,
+)
+from src.database.models import CalendarSyncState
+from src.deps import GoogleCalendarApi
+
+
+def make_client(handler) -> GoogleCalendarApi:
+    http = httpx.AsyncClient(
+        base_url=GoogleCalendarApi.BASE_URL, transport=httpx.MockTransport(handler)
+    )
+    return GoogleCalendarApi("token", client=http)
+
+
+def test_event_row_handles_timed_and_all_day_events():
+    user_id = uuid.uuid4()
+    timed = event_row(
+        user_id,
+        "primary",
+        {
+            "id": "a",
+            "start": {"dateTime": "2024-11-01T09:00:00-04:00"},
+            "end": {"dateTime": "2024-11-01T10:00:00-04:00"},
+        },
+    )
+    assert timed["start_at"] == datetime(2024, 11, 1, 13, tzinfo=timezone.utc)
+    assert not timed["all_day"]
+
+    all_day = event_row(
+        user_id,
+        "primary",
+        {"id": "b", "start": {"date": "2024-11-01"}, "end": {"date": "2024-11-02"}},
+    )
+    assert all_day["all_day"]
+    assert all_day["end_at"] - all_day["start_at"] == timedelta(days=1)
+
+
+@pytest.mark.asyncio
+async def test_fetch_changes_falls_back_to_full_sync_when_token_expired():
+    def handler(request: httpx.Request) -> httpx.Response:
+        params = request.url.params
+        if "syncToken" in params:
+            return httpx.Response(410, json={"error": "fullSyncRequired"})
+        if params.get("pageToken") == "2":
+            return httpx.Response(
+                200, json={"items": [{"id": "b"}], "nextSyncToken": "fresh"}
+            )
+        return httpx.Response(200, json={"items": [{"id": "a"}], "nextPageToken": "2"})
+
+    events, sync_token, full = await fetch_changes(
+        make_client(handler), "primary", "expired"
+    )
+    assert [event["id"] for event in events] == ["a", "b"]
+    assert sync_token == "fresh"
+    assert full
+
+
+def test_is_fresh_trusts_open_push_channel():
+    now = datetime.now(timezone.utc)
+    stale = CalendarSyncState(synced_at=now - timedelta(hours=1))
+    assert not is_fresh(stale)
+    assert not is_fresh(None)
+
+    stale.channel_expires_at = now + timedelta(days=3)
+    assert is_fresh(stale)
+
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def execute(self, stmt):
+        return self.rows
+
+
+@pytest.mark.asyncio
+async def test_all_day_events_block_the_local_day():
+    new_york = ZoneInfo("America/New_York")
+    stored = event_row(
+        uuid.uuid4(),
+        "primary",
+        {"id": "b", "start": {"date": "2024-11-01"}, "end": {"date": "2024-11-02"}},
+    )
+    session = FakeSession([SimpleNamespace(**stored)])
+    start = datetime(2024, 11, 1, tzinfo=new_york)
+
+    busy = await list_busy_intervals(
+        session, str(uuid.uuid4()), start, start + timedelta(days=7), tz=new_york
+    )
+
+    # not 20:00 the day before, which midnight utc is in new york
+    assert busy == [(start, datetime(2024, 11, 2, tzinfo=new_york))]
@@ -1,6 +1,10 @@
+import asyncio
+
+import httpx
 import pytest
 from pytest import fixture
 
+from src.cache import TTLCache
 from src.deps import CanvasApiError, CanvasClient
 from src.settings import Settings
 
@@ -57,3 +61,141 @@ async def test_get_upcoming_tasks_with_invalid_response(canvas_client: CanvasCli
     mocker.patch.object(canvas_client, "get_upcoming_tasks", side_effect=CanvasApiError(400, "Bad Request"))
     with pytest.raises(CanvasApiError):
         await canvas_client.get_upcoming_tasks()
+
+
+@pytest.mark.asyncio
+async def test_get_all_follows_link_header(settings_in_test: Settings):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.params.get("page") == "2":
+            return httpx.Response(200, json=[{"id": 3}])
+        return httpx.Response(
+            200,
+            json=[{"id": 1}, {"id": 2}],
+            headers={
+                "Link": '<https://canvas.instructure.com/api/v1/courses?page=2&per_page=2>; rel="next"'
+            },
+        )
+
+    client = httpx.AsyncClient(
+        base_url=settings_in_test.canvas_api_url,
+        transport=httpx.MockTransport(handler),
+    )
+    canvas_client = CanvasClient(settings_in_test, client=client, token="token")
+
+    courses = await canvas_client.list_courses()
+    assert [course["id"] for course in courses] == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_request_retries_when_throttled(settings_in_test: Settings, mocker):
+    mocker.patch("src.deps.asyncio.sleep")
+    responses = iter(
+        [
+            httpx.Response(429, headers={"Retry-After": "1"}),
+            httpx.Response(200, json={"id": 1, "name": "Course 1"}),
+        ]
+    )
+    client = httpx.AsyncClient(
+        base_url=settings_in_test.canvas_api_url,
+        transport=httpx.MockTransport(lambda request: next(responses)),
+    )
+    canvas_client = CanvasClient(settings_in_test, client=client, token="token")
+
+    course = await canvas_client.get_course(1)
+    assert course["name"] == "Course 1"
+
+
+def etag_client(settings: Settings, pages: dict[str, list[int]], sent_etags: list):
+    """A Canvas client serving ``pages`` keyed by page number, each with an ETag
+    derived from its ids; requests' ``If-None-Match`` are recorded."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent_etags.append(request.headers.get("If-None-Match"))
+        page = request.url.params.get("page", "1")
+        ids = pages[page]
+        etag = f'"{page}-{"-".join(map(str, ids))}"'
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304)
+        headers = {"ETag": etag}
+        if str(int(page) + 1) in pages:
+            headers["Link"] = (
+                f"<https://canvas.instructure.com/api/v1/courses/1/files"
+                f'?page={int(page) + 1}&per_page=2>; rel="next"'
+            )
+        return httpx.Response(200, json=[{"id": id} for id in ids], headers=headers)
+
+    client = httpx.AsyncClient(
+        base_url=settings.canvas_api_url, transport=httpx.MockTransport(handler)
+    )
+    return CanvasClient(settings, client=client, token="token")
+
+
+@pytest.mark.asyncio
+async def test_single_page_listing_is_revalidated_with_its_etag(
+    settings_in_test: Settings,
+):
+    sent_etags = []
+    canvas_client = etag_client(settings_in_test, {"1": [1, 2]}, sent_etags)
+    url = "/api/v1/courses/1/files"
+
+    items, etag = await canvas_client.get_all_if_modified(url)
+    unchanged, same_etag = await canvas_client.get_all_if_modified(url, etag=etag)
+
+    assert [item["id"] for item in items] == [1, 2]
+    assert unchanged is None and same_etag == etag
+    assert sent_etags == [None, etag]
+
+
+@pytest.mark.asyncio
+async def test_paged_listing_etag_covers_every_page(settings_in_test: Settings):
+    sent_etags = []
+    pages = {"1": [1, 2], "2": [3]}
+    canvas_client = etag_client(settings_in_test, pages, sent_etags)
+    url = "/api/v1/courses/1/files"
+
+    items, etag = await canvas_client.get_all_if_modified(url)
+    assert [item["id"] for item in items] == [1, 2, 3]
+    assert etag.startswith(CanvasClient.PAGED_ETAG_PREFIX)
+
+    unchanged, same_etag = await canvas_client.get_all_if_modified(url, etag=etag)
+    assert unchanged is None and same_etag == etag
+
+    # only the last page changed; a 304 for the first must not hide it
+    pages["2"] = [3, 4]
+    items, new_etag = await canvas_client.get_all_if_modified(url, etag=etag)
+    assert [item["id"] for item in items] == [1, 2, 3, 4]
+    assert new_etag != etag
+    # the combined ETag is never sent as If-None-Match
+    assert sent_etags == [None] * 6
+
+
+@pytest.mark.asyncio
+async def test_clients_with_the_same_token_share_a_concurrency_limit():
+    settings = Settings(
+        canvas_api_url="https://canvas.instructure.com", canvas_max_concurrency=2
+    )
+    in_flight = 0
+    most_in_flight = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, most_in_flight
+        in_flight += 1
+        most_in_flight = max(most_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return httpx.Response(200, json={"id": 1})
+
+    client = httpx.AsyncClient(
+        base_url=settings.canvas_api_url, transport=httpx.MockTransport(handler)
+    )
+    semaphores = TTLCache(10, 60)
+    # one client per call, as get_canvas_client hands out
+    await asyncio.gather(
+        *(
+            CanvasClient(
+                settings, client=client, token="token", semaphores=semaphores
+            ).get_course(1)
+            for _ in range(6)
+        )
+    )
+    assert most_in_flight == 2
@@ -0,0 +1,86 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from src.application.canvas_cache import (
+    CANVAS_CACHE_CHANNEL,
+    CanvasResponseCache,
+    MemoryCacheBackend,
+)
+
+
+class FakeEngine:
+    def __init__(self):
+        self.statements = []
+
+    @asynccontextmanager
+    async def begin(self):
+        yield self
+
+    async def execute(self, stmt):
+        compiled = stmt.compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        )
+        self.statements.append(str(compiled))
+
+
+@pytest.fixture
+def cache():
+    return CanvasResponseCache(MemoryCacheBackend(max_size=100), {"courses": 60})
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_fetch(cache: CanvasResponseCache):
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return [{"id": 1}]
+
+    results = await asyncio.gather(
+        *(cache.get_or_fetch("user-1", "courses", {}, fetch) for _ in range(5))
+    )
+    assert results == [[{"id": 1}]] * 5
+    assert calls == 1
+
+    assert await cache.get_or_fetch("user-1", "courses", {}, fetch) == [{"id": 1}]
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_invalidate_drops_only_that_users_entries(cache: CanvasResponseCache):
+    async def fetch():
+        return ["fresh"]
+
+    await cache.get_or_fetch("user-1", "courses", {}, fetch)
+    await cache.get_or_fetch("user-2", "courses", {}, fetch)
+    await cache.invalidate("user-1")
+
+    assert await cache.backend.get("user-1:courses:{}") is None
+    assert await cache.backend.get("user-2:courses:{}") == ["fresh"]
+
+
+@pytest.mark.asyncio
+async def test_invalidation_reaches_other_processes_through_notify():
+    async def fetch():
+        return ["fresh"]
+
+    engine = FakeEngine()
+    # the job worker invalidates; the api worker holds the entries
+    worker = CanvasResponseCache(MemoryCacheBackend(max_size=100), {}, engine)
+    api = CanvasResponseCache(MemoryCacheBackend(max_size=100), {}, engine)
+    await api.get_or_fetch("user-1", "courses", {}, fetch)
+
+    await worker.invalidate("user-1")
+    assert engine.statements == [
+        f"SELECT pg_notify('{CANVAS_CACHE_CHANNEL}', 'user-1:') AS pg_notify_1"
+    ]
+
+    # what the listener does with the notification
+    api._on_notify(None, 0, CANVAS_CACHE_CHANNEL, "user-1:")
+    await asyncio.gather(*api.tasks)
+    assert api.backend.entries.keys() == []
@@ -0,0 +1,136 @@
+import re
+from types import SimpleNamespace
+
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.graph import StateGraph
+from sqlalchemy import Delete, Insert
+from sqlalchemy.dialects import postgresql
+
+from src.application.checkpoint import BoundedMemorySaver, PostgresCheckpointSaver
+
+
+@pytest.mark.asyncio
+async def test_bounded_memory_saver_forgets_least_recently_used_thread():
+    builder = StateGraph(int)
+    builder.add_node("add_one", lambda x: x + 1)
+    builder.set_entry_point("add_one")
+    builder.set_finish_point("add_one")
+    checkpointer = BoundedMemorySaver(max_threads=2, ttl=60)
+    graph = builder.compile(checkpointer=checkpointer)
+
+    for thread_id in ("user-1:default", "user-2:default", "user-3:default"):
+        await graph.ainvoke(1, {"configurable": {"thread_id": thread_id}})
+
+    assert set(checkpointer.storage) == {"user-2:default", "user-3:default"}
+    assert all(key[0] != "user-1:default" for key in checkpointer.writes)
+
+
+class FakeResult:
+    def __init__(self, rows=(), rowcount=0):
+        self.rows = list(rows)
+        self.rowcount = rowcount
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def all(self):
+        return self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeConnection:
+    """Keeps inserted rows per table and answers selects from them.
+
+    Only what the saver's statements need: equality filters on columns,
+    ``(channel, version) IN (...)`` for blobs, and newest-first checkpoints.
+    """
+
+    def __init__(self, tables: dict[str, list[dict]]):
+        self.tables = tables
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, stmt):
+        params = stmt.compile(dialect=postgresql.dialect()).params
+        if isinstance(stmt, Delete):
+            return FakeResult()
+        if isinstance(stmt, Insert):
+            rows = self.tables.setdefault(stmt.table.name, [])
+            by_row: dict[str, dict] = {}
+            for key, value in params.items():
+                column, _, row = re.fullmatch(r"(.+?)(_m(\d+))?", key).groups()
+                by_row.setdefault(row, {})[column] = value
+            rows.extend(by_row.values())
+            return FakeResult(rowcount=len(by_row))
+
+        table = stmt.get_final_froms()[0].name
+        rows = self.tables.get(table, [])
+        for key, value in params.items():
+            if isinstance(value, list):
+                rows = [
+                    row for row in rows if (row["channel"], row["version"]) in value
+                ]
+            elif (column := key.rsplit("_", 1)[0]) in stmt.selected_columns:
+                rows = [row for row in rows if row.get(column) == value]
+        if table == "agent_checkpoint":
+            rows = sorted(rows, key=lambda row: row["checkpoint_id"], reverse=True)
+        return FakeResult(SimpleNamespace(**row) for row in rows)
+
+
+class FakeEngine:
+    def __init__(self):
+        self.tables: dict[str, list[dict]] = {}
+
+    def connect(self):
+        return FakeConnection(self.tables)
+
+    begin = connect
+
+
+def checkpoint_with(saver, previous, messages):
+    checkpoint = empty_checkpoint()
+    version = saver.get_next_version(
+        previous and previous["channel_versions"]["messages"], None
+    )
+    checkpoint["channel_values"] = {"messages": messages}
+    checkpoint["channel_versions"] = {"messages": version}
+    return checkpoint
+
+
+@pytest.mark.asyncio
+async def test_postgres_saver_round_trips_checkpoints_and_writes():
+    saver = PostgresCheckpointSaver(FakeEngine())
+    thread = {"configurable": {"thread_id": "user-1:default", "checkpoint_ns": ""}}
+
+    first = checkpoint_with(saver, None, ["hi"])
+    first_config = await saver.aput(
+        thread, first, {"step": 0}, first["channel_versions"]
+    )
+    second = checkpoint_with(saver, first, ["hi", "hello"])
+    second_config = await saver.aput(
+        first_config, second, {"step": 1}, second["channel_versions"]
+    )
+    await saver.aput_writes(second_config, [("messages", "pending")], "task-1")
+
+    latest = await saver.aget_tuple(thread)
+    assert latest.config == second_config
+    assert latest.parent_config == first_config
+    assert latest.checkpoint["channel_values"] == {"messages": ["hi", "hello"]}
+    assert latest.metadata == {"step": 1}
+    assert latest.pending_writes == [("task-1", "messages", "pending")]
+
+    earlier = await saver.aget_tuple(first_config)
+    assert earlier.checkpoint["channel_values"] == {"messages": ["hi"]}
+    assert earlier.pending_writes == []
+
+    listed = [checkpoint async for checkpoint in saver.alist(thread)]
+    assert [c.config for c in listed] == [second_config, first_config]
+    filtered = [c async for c in saver.alist(thread, filter={"step": 0})]
+    assert [c.config for c in filtered] == [first_config]
@@ -0,0 +1,66 @@
+import pytest
+
+from src.application.chunking import Chunker
+
+
+class WordEncoding:
+    """One token per word, enough to check the chunk arithmetic."""
+
+    def encode_ordinary_batch(self, text: list[str]) -> list[list[str]]:
+        return [sentence.split() for sentence in text]
+
+    def decode(self, tokens: list[str]) -> str:
+        return " ".join(tokens)
+
+
+def split_sentences(text: str) -> list[str]:
+    return [sentence.strip() + "." for sentence in text.split(".") if sentence.strip()]
+
+
+def chunker(max_tokens: int, overlap_tokens: int) -> Chunker:
+    return Chunker(WordEncoding(), split_sentences, max_tokens, overlap_tokens)
+
+
+def test_chunks_stay_under_the_limit_and_overlap_by_whole_sentences():
+    pages = [(1, "one two three. four five. six seven eight."), (2, "nine ten.")]
+
+    chunks = list(chunker(max_tokens=6, overlap_tokens=3).chunk_pages(pages))
+
+    assert [chunk.text for chunk in chunks] == [
+        "one two three. four five.",
+        "four five. six seven eight.",
+        "six seven eight. nine ten.",
+    ]
+    assert all(chunk.n_tokens <= 6 for chunk in chunks)
+    assert (chunks[-1].first_page, chunks[-1].last_page) == (1, 2)
+
+
+def test_oversized_sentences_are_split():
+    pages = [(1, " ".join(f"w{i}" for i in range(10)) + ". short.")]
+
+    chunks = list(chunker(max_tokens=4, overlap_tokens=0).chunk_pages(pages))
+
+    assert [chunk.n_tokens for chunk in chunks] == [4, 4, 3]
+    assert chunks[0].text == "w0 w1 w2 w3"
+    assert chunks[-1].text == "w8 w9. short."
+
+
+def test_overlap_must_be_smaller_than_chunks():
+    with pytest.raises(ValueError):
+        chunker(max_tokens=4, overlap_tokens=4)
+
+
+def test_chunks_carry_the_heading_of_their_section():
+    pages = [
+        (1, "Chain Rule\nIt composes. It nests."),
+        (2, "More on it. Still the chain rule."),
+        (3, "Integration\nBy parts. By substitution."),
+    ]
+
+    chunks = list(chunker(max_tokens=8, overlap_tokens=0).chunk_pages(pages))
+
+    assert [(chunk.first_page, chunk.heading) for chunk in chunks] == [
+        (1, "Chain Rule"),
+        (2, "Chain Rule"),
+        (3, "Integration"),
+    ]
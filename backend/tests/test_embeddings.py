@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.application import embeddings
+from src.application.embeddings import BatchEmbedder
+
+
+class FakeEncoding:
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+class FakeEmbeddings:
+    """``client.embeddings.with_raw_response`` answering with fixed headers."""
+
+    def __init__(self, headers):
+        self.headers = headers
+        self.with_raw_response = self
+
+    async def create(self, model, input):
+        data = [SimpleNamespace(index=i, embedding=[0.1]) for i in range(len(input))]
+        return SimpleNamespace(
+            headers=self.headers, parse=lambda: SimpleNamespace(data=data)
+        )
+
+
+def make_embedder(monkeypatch, remaining_tokens):
+    monkeypatch.setattr(
+        embeddings.tiktoken, "encoding_for_model", lambda model: FakeEncoding()
+    )
+    headers = {
+        "x-ratelimit-remaining-requests": "2999",
+        "x-ratelimit-remaining-tokens": str(remaining_tokens),
+        "x-ratelimit-reset-tokens": "1m0s",
+    }
+    client = SimpleNamespace(embeddings=FakeEmbeddings(headers))
+    return BatchEmbedder(client, max_batch_size=2, max_concurrency=1)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(embeddings.asyncio, "sleep", sleep)
+    return delays
+
+
+@pytest.mark.asyncio
+async def test_batches_are_not_paused_while_the_token_budget_fits_them(
+    monkeypatch, sleeps
+):
+    # far below the default embedding_batch_tokens, far above these batches
+    embedder = make_embedder(monkeypatch, remaining_tokens=200_000)
+
+    vectors = await embedder.embed([f"chunk number {i}" for i in range(6)])
+
+    assert len(vectors) == 6 and embedder.requests == 3
+    assert sleeps == []
+
+
+@pytest.mark.asyncio
+async def test_batch_waits_for_the_reset_when_the_budget_cannot_fit_it(
+    monkeypatch, sleeps
+):
+    embedder = make_embedder(monkeypatch, remaining_tokens=4)
+
+    await embedder.embed([f"chunk number {i}" for i in range(4)])
+
+    # the first response leaves 4 tokens; the next 6-token batch waits a minute
+    assert len(sleeps) == 1 and 59 < sleeps[0] <= 60
@@ -0,0 +1,73 @@
+import json
+
+import httpx
+import pytest
+
+from src.application.external_usecase import (
+    add_study_schedule_to_google_calendar,
+    google_event_id,
+    list_google_calendars,
+)
+from src.deps import GoogleApiError, GoogleCalendarApi
+
+
+def make_client(handler) -> GoogleCalendarApi:
+    http = httpx.AsyncClient(
+        base_url=GoogleCalendarApi.BASE_URL, transport=httpx.MockTransport(handler)
+    )
+    return GoogleCalendarApi("token", client=http)
+
+
+@pytest.mark.asyncio
+async def test_list_google_calendars_follows_page_tokens():
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.headers["Authorization"] == "Bearer token"
+        assert request.url.path == "/calendar/v3/users/me/calendarList"
+        if request.url.params.get("pageToken") == "next":
+            items = [{"summary": "School", "id": "school", "accessRole": "reader"}]
+            return httpx.Response(200, json={"items": items})
+        items = [{"summary": "Me", "id": "primary", "accessRole": "owner"}]
+        return httpx.Response(200, json={"items": items, "nextPageToken": "next"})
+
+    calendars = await list_google_calendars(make_client(handler))
+    assert [calendar["id"] for calendar in calendars] == ["primary", "school"]
+
+
+@pytest.mark.asyncio
+async def test_google_calendar_api_raises_on_error():
+    client = make_client(lambda request: httpx.Response(401, json={"error": "expired"}))
+    with pytest.raises(GoogleApiError):
+        await client.list_events("primary", timeMin="2024-11-01T00:00:00Z")
+
+
+@pytest.mark.asyncio
+async def test_add_event_with_existing_id_returns_existing_event():
+    event_id = google_event_id("user", "primary", "Study")
+    assert set(event_id) <= set("0123456789abcdefghijklmnopqrstuv")
+
+    stored = {
+        "id": event_id,
+        "summary": "Study",
+        "htmlLink": "https://calendar.google.com/event",
+        "start": {"dateTime": "2024-11-01T00:00:00Z"},
+        "end": {"dateTime": "2024-11-01T01:00:00Z"},
+    }
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            assert json.loads(request.content)["id"] == event_id
+            return httpx.Response(409, json={"error": {"message": "duplicate"}})
+        assert request.url.path.endswith(f"/events/{event_id}")
+        return httpx.Response(200, json=stored)
+
+    event = await add_study_schedule_to_google_calendar(
+        make_client(handler),
+        calendar_id="primary",
+        title="Study",
+        description=None,
+        start_time="2024-11-01T00:00:00Z",
+        end_time="2024-11-01T01:00:00Z",
+        event_id=event_id,
+    )
+    assert event["id"] == event_id
+    assert event["description"] is None
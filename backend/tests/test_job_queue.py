@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from src.application.job_queue import (
+    claim_statement,
+    fail_job,
+    heartbeat,
+    recover_stale_jobs,
+    retry_delay,
+)
+from src.database.models import Job, JobStatus
+
+
+class FakeSession:
+    """Records each statement's SQL and parameters; updates match ``rowcount`` rows."""
+
+    def __init__(self, *rowcounts):
+        self.rowcounts = list(rowcounts)
+        self.statements = []
+        self.commits = 0
+
+    async def execute(self, stmt):
+        compiled = stmt.compile(dialect=postgresql.dialect())
+        self.statements.append((str(compiled), compiled.params))
+        return SimpleNamespace(rowcount=self.rowcounts.pop(0))
+
+    async def commit(self):
+        self.commits += 1
+
+
+def test_retry_delay_backs_off_exponentially():
+    assert [retry_delay(attempts, backoff=10) for attempts in (1, 2, 3)] == [10, 20, 40]
+
+
+def test_claim_statement_skips_locked_jobs():
+    sql = str(claim_statement("worker-1", 2).compile(dialect=postgresql.dialect()))
+    assert "FOR UPDATE SKIP LOCKED" in sql
+    assert "RETURNING" in sql
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_retried_until_attempts_run_out():
+    session = FakeSession(1, 1)
+
+    await fail_job(session, Job(id=1, attempts=1, max_attempts=3), "worker-1", "boom")
+    await fail_job(session, Job(id=1, attempts=3, max_attempts=3), "worker-1", "boom")
+
+    (retry_sql, retry), (give_up_sql, give_up) = session.statements
+    assert retry["status"] == JobStatus.PENDING and "run_at=(now() +" in retry_sql
+    assert give_up["status"] == JobStatus.FAILED and "run_at" not in give_up_sql
+    for sql, params in session.statements:
+        # only the worker holding the job may release it
+        assert params["locked_by_1"] == "worker-1"
+        assert params["locked_by"] is None and params["error_message"] == "boom"
+    assert session.commits == 2
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_reports_a_job_taken_over_by_another_worker():
+    session = FakeSession(1, 0)
+
+    assert await heartbeat(session, 1, "worker-1")
+    assert not await heartbeat(session, 1, "worker-1")
+
+
+@pytest.mark.asyncio
+async def test_stale_jobs_are_requeued_or_failed_by_attempts():
+    session = FakeSession(1, 2)
+
+    assert await recover_stale_jobs(session, stale_after=60) == 3
+
+    (failed_sql, failed), (requeued_sql, requeued) = session.statements
+    for sql in (failed_sql, requeued_sql):
+        assert "job.status = %(status_1)s" in sql and "job.heartbeat_at <" in sql
+    assert "job.attempts >= job.max_attempts" in failed_sql
+    assert failed["status"] == JobStatus.FAILED
+    assert "job.attempts < job.max_attempts" in requeued_sql
+    assert requeued["status"] == JobStatus.PENDING and "run_at=now()" in requeued_sql
+    assert failed["status_1"] == requeued["status_1"] == JobStatus.IN_PROGRESS
@@ -0,0 +1,287 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from src import deps
+from src.application import chunking, embeddings, openai, pdf
+from src.application.chunking import Chunk
+from src.application.jobs import (
+    extract_course_content,
+    fetch_course_content,
+    process_course_materials,
+)
+from src.database.models import (
+    Course,
+    CourseMaterial,
+    CourseSyncState,
+    Job,
+    JobType,
+)
+from src.deps import CanvasApiError
+
+WATERMARK = datetime(2024, 9, 1, tzinfo=timezone.utc)
+
+
+class FakeCanvasClient:
+    """Serves one course's listings; ``None`` listings answer "not modified"."""
+
+    def __init__(self, files, modules, module_items=None):
+        self.files = files
+        self.modules = modules
+        self.module_items = module_items or {}
+        self.etags = {}
+        self.looked_up = []
+
+    async def list_courses(self, **params):
+        return [{"id": 7}]
+
+    async def get_course(self, course_id, include=None):
+        return {"id": course_id, "name": "Calculus", "course_code": "MATH 101"}
+
+    async def get_all_if_modified(self, url, etag=None, **params):
+        self.etags[url.rsplit("/", 1)[-1]] = etag
+        listing = self.files if url.endswith("/files") else self.modules
+        return listing, f'"{url}"' if listing is not None else etag
+
+    async def list_module_items(self, course_id, module_id):
+        return self.module_items.get(module_id, [])
+
+    async def get_file(self, course_id, file_id):
+        self.looked_up.append(file_id)
+        return {
+            "id": file_id,
+            "url": f"https://files/{file_id}",
+            "display_name": "x.pdf",
+        }
+
+
+def file(id, updated_at):
+    return {
+        "id": id,
+        "display_name": f"{id}.pdf",
+        "url": f"https://files/{id}",
+        "updated_at": updated_at,
+    }
+
+
+@pytest.mark.asyncio
+async def test_only_files_newer_than_the_watermark_are_synced_again():
+    canvas_client = FakeCanvasClient(
+        files=[
+            file(1, "2024-08-01T00:00:00Z"),
+            file(2, "2024-09-15T00:00:00Z"),
+            file(3, "2024-08-01T00:00:00Z"),
+        ],
+        modules=[{"id": 10}],
+        module_items={
+            10: [
+                # listed above, known, and new: only the last is looked up
+                {"type": "File", "content_id": 1, "title": "1.pdf"},
+                {"type": "File", "content_id": 4, "title": "4.pdf"},
+                {"type": "File", "content_id": 5, "title": "5.pdf"},
+                {"type": "File", "content_id": 5, "title": "5.pdf"},
+                {"type": "Page", "content_id": 6, "title": "Intro"},
+            ]
+        },
+    )
+    sync_state = CourseSyncState(
+        files_etag='"files"', modules_etag='"modules"', watermark=WATERMARK
+    )
+
+    content = await fetch_course_content(
+        canvas_client, 7, sync_state, {"file_1", "file_2", "file_4"}
+    )
+
+    # file 1 is known and unchanged; file 2 changed; file 3 is new
+    assert [m["canvas_id"] for m in content["materials"]] == [
+        "file_2",
+        "file_3",
+        "file_5",
+    ]
+    assert content["skipped"] == 2
+    assert content["changed_canvas_ids"] == ["file_2"]
+    assert canvas_client.looked_up == [5]
+    assert content["watermark"] == datetime(2024, 9, 15, tzinfo=timezone.utc)
+    assert canvas_client.etags == {"files": '"files"', "modules": '"modules"'}
+    assert not content["is_unchanged"]
+
+
+@pytest.mark.asyncio
+async def test_unchanged_listings_skip_the_course():
+    canvas_client = FakeCanvasClient(files=None, modules=None)
+    sync_state = CourseSyncState(
+        files_etag='"files"', modules_etag='"modules"', watermark=WATERMARK
+    )
+
+    content = await fetch_course_content(
+        canvas_client, 7, sync_state, {"file_1", "file_2"}
+    )
+
+    assert content["is_unchanged"]
+    assert content["materials"] == []
+    assert content["skipped"] == 2
+    assert content["watermark"] == WATERMARK
+    assert (content["files_etag"], content["modules_etag"]) == ('"files"', '"modules"')
+
+
+class FakeSession:
+    """Fails like postgres: once a statement errors, nothing runs until rollback."""
+
+    def __init__(self):
+        self.failed = False
+        self.rollbacks = 0
+        self.inserted = []
+
+    def __contains__(self, instance):
+        return False
+
+    async def execute(self, stmt, rows=None):
+        if self.failed:
+            raise RuntimeError("current transaction is aborted")
+        self.inserted.extend(rows or [])
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        self.failed = False
+        self.rollbacks += 1
+
+
+class FakeEmbedder:
+    def __init__(self, client, cache):
+        self.session = cache.db_session
+
+    async def embed(self, texts):
+        if texts == ["broken"]:
+            self.session.failed = True
+            raise RuntimeError("embedding cache write failed")
+        return [[0.1] * 3 for _ in texts]
+
+
+@pytest.mark.asyncio
+async def test_a_failed_material_does_not_fail_the_ones_after_it(monkeypatch):
+    async def download_pdf(client, url, file):
+        pass
+
+    async def iter_pdf_pages(path):
+        yield 0, "text"
+
+    async def aclient():
+        return None
+
+    class FakeChunker:
+        texts = iter(["broken", "fine"])
+
+        def chunk_pages(self, pages):
+            return [Chunk(next(self.texts), 1, 1, 1)]
+
+    monkeypatch.setattr(
+        deps, "get_resources", lambda: SimpleNamespace(canvas_http=None)
+    )
+    monkeypatch.setattr(pdf, "download_pdf", download_pdf)
+    monkeypatch.setattr(pdf, "iter_pdf_pages", iter_pdf_pages)
+    monkeypatch.setattr(openai, "aclient", aclient)
+    monkeypatch.setattr(embeddings, "BatchEmbedder", FakeEmbedder)
+    monkeypatch.setattr(chunking, "get_chunker", FakeChunker)
+    materials = [
+        CourseMaterial(id=1, name="a.pdf", url="https://files/1", course_id=7),
+        CourseMaterial(id=2, name="b.pdf", url="https://files/2", course_id=7),
+    ]
+    session = FakeSession()
+
+    stats = await process_course_materials(materials, session)
+
+    assert stats["materials_failed"] == 1 and stats["materials_processed"] == 1
+    assert session.rollbacks == 1
+    assert [row["course_material_id"] for row in session.inserted] == [2]
+
+
+class SyncSession:
+    """Answers the sync's lookups for one known course and records the rest."""
+
+    def __init__(self, sync_state, known_canvas_ids):
+        self.sync_state = sync_state
+        self.known_canvas_ids = known_canvas_ids
+        self.statements = []
+        self.added = []
+        self.commits = 0
+
+    async def execute(self, stmt):
+        sql = str(
+            stmt.compile(
+                dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+            )
+        )
+        self.statements.append(sql)
+        rows, scalar = [], None
+        if sql.startswith("SELECT course.canvas_id, course_sync_state"):
+            rows = [(7, self.sync_state)]
+        elif sql.startswith("SELECT course.canvas_id, course_material.canvas_id"):
+            rows = [(7, canvas_id) for canvas_id in self.known_canvas_ids]
+        elif sql.startswith("INSERT INTO course "):
+            scalar = Course(id=1)
+        elif sql.startswith("SELECT course_membership.id"):
+            scalar = 1
+        return SimpleNamespace(all=lambda: rows, scalar_one_or_none=lambda: scalar)
+
+    def add(self, row):
+        self.added.append(row)
+
+    async def commit(self):
+        self.commits += 1
+
+    async def refresh(self, row):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_changed_files_lose_their_documents_and_are_embedded_again():
+    canvas_client = FakeCanvasClient(
+        files=[file(1, "2024-08-01T00:00:00Z"), file(2, "2024-09-15T00:00:00Z")],
+        modules=[],
+    )
+    sync_state = CourseSyncState(
+        files_etag='"files"', modules_etag='"modules"', watermark=WATERMARK
+    )
+    session = SyncSession(sync_state, {"file_1", "file_2"})
+
+    stats = await extract_course_content(canvas_client, session, "user-1")
+
+    assert stats["materials_updated"] == 1
+    (deleted,) = [sql for sql in session.statements if sql.startswith("DELETE")]
+    assert "DELETE FROM material_documents" in deleted
+    assert "course_material.canvas_id IN ('file_2')" in deleted
+    # the documents go in the same transaction as the new url
+    assert session.statements[-1] == deleted
+    (job,) = [row for row in session.added if isinstance(row, Job)]
+    assert job.type == JobType.COURSE_MATERIAL_SYNC
+    assert job.payload == {"course_id": 1}
+
+
+class HiddenModulesCanvasClient(FakeCanvasClient):
+    """Two courses; the second hides its modules tab from students."""
+
+    async def list_courses(self, **params):
+        return [{"id": 7}, {"id": 8}]
+
+    async def get_all_if_modified(self, url, etag=None, **params):
+        if url == "/api/v1/courses/8/modules":
+            raise CanvasApiError(403, "user not authorized to perform that action")
+        return await super().get_all_if_modified(url, etag, **params)
+
+
+@pytest.mark.asyncio
+async def test_a_course_with_hidden_modules_does_not_stop_the_sync():
+    canvas_client = HiddenModulesCanvasClient(
+        files=[file(1, "2024-08-01T00:00:00Z")], modules=[]
+    )
+    session = SyncSession(None, set())
+
+    stats = await extract_course_content(canvas_client, session, "user-1")
+
+    assert stats["courses_updated"] == 2
+    inserts = [sql for sql in session.statements if "INTO course_material" in sql]
+    assert len(inserts) == 2
@@ -0,0 +1,54 @@
+import asyncio
+import io
+
+import httpx
+import pytest
+from PyPDF2 import PdfWriter
+
+from src.application.pdf import PdfExtractionError, download_pdf, iter_pdf_pages
+
+
+def pdf_client(body: bytes, headers: dict | None = None) -> httpx.AsyncClient:
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=body, headers=headers)
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.asyncio
+async def test_download_pdf_streams_into_file():
+    file = io.BytesIO()
+    async with pdf_client(b"%PDF-1.4 test") as client:
+        written = await download_pdf(client, "https://files.example.com/a.pdf", file)
+
+    assert written == len(b"%PDF-1.4 test")
+    assert file.getvalue() == b"%PDF-1.4 test"
+
+
+@pytest.mark.asyncio
+async def test_download_pdf_rejects_files_over_the_cap():
+    async with pdf_client(b"x" * 2048) as client:
+        with pytest.raises(PdfExtractionError):
+            await download_pdf(
+                client, "https://files.example.com/a.pdf", io.BytesIO(), max_bytes=1024
+            )
+
+
+@pytest.mark.asyncio
+async def test_a_timed_out_file_does_not_fail_files_parsed_next_to_it(tmp_path):
+    path = tmp_path / "blank.pdf"
+    writer = PdfWriter()
+    for _ in range(3):
+        writer.add_blank_page(width=200, height=200)
+    with open(path, "wb") as file:
+        writer.write(file)
+
+    async def parse(timeout: float):
+        return [page async for page in iter_pdf_pages(str(path), timeout=timeout)]
+
+    stuck, parsed = await asyncio.gather(
+        parse(timeout=0.01), parse(timeout=60), return_exceptions=True
+    )
+
+    assert isinstance(stuck, PdfExtractionError)
+    assert parsed == [(0, ""), (1, ""), (2, "")]
@@ -0,0 +1,52 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.application.query_cache import QueryEmbeddingCache, SemanticResultCache
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.inputs = []
+
+    async def create(self, model, input):
+        self.inputs.append(input)
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[1.0, 0.0])])
+
+
+@pytest.mark.asyncio
+async def test_rephrased_and_concurrent_queries_share_one_request():
+    client = SimpleNamespace(embeddings=FakeEmbeddings())
+    cache = QueryEmbeddingCache(model="test-model", max_size=10, ttl=60)
+
+    await asyncio.gather(
+        cache.embed(client, "When is the midterm?"),
+        cache.embed(client, "when is  the MIDTERM"),
+    )
+    await cache.embed(client, "when is the midterm")
+
+    assert client.embeddings.inputs == ["when is the midterm"]
+    assert cache.stats()["requests"] == 1
+
+
+def test_result_cache_matches_similar_queries_within_a_scope():
+    cache = SemanticResultCache(max_scopes=10, max_per_scope=10, ttl=60, threshold=0.95)
+    cache.set(("course", 7, 6), "when is the midterm", [1.0, 0.0], [(1, 0.9), (2, 0.8)])
+
+    assert cache.get(("course", 7, 6), "midterm date?", [0.99, 0.05]) == [
+        (1, 0.9),
+        (2, 0.8),
+    ]
+    assert cache.get(("course", 7, 6), "office hours", [0.5, 0.5]) is None
+    assert cache.get(("course", 8, 6), "when is the midterm", [1.0, 0.0]) is None
+
+
+def test_result_cache_never_reuses_results_across_numbers():
+    cache = SemanticResultCache(max_scopes=10, max_per_scope=10, ttl=60, threshold=0.95)
+    cache.set(("course", 7, 6), "Problem Set 4", [1.0, 0.0], [(4, 0.9)])
+
+    # embeddings this close are typical for queries differing in one number
+    assert cache.get(("course", 7, 6), "Problem Set 5", [0.999, 0.01]) is None
+    assert cache.get(("course", 7, 6), "problem set 4?", [0.999, 0.01]) == [(4, 0.9)]
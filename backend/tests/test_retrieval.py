@@ -0,0 +1,156 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from src.application import retrieval
+from src.application.retrieval import (
+    RetrievedDocument,
+    compact_documents,
+    format_documents,
+    hybrid_search,
+    search_material_documents,
+)
+
+
+class FakeSession:
+    """Answers the pgvector version lookup, then each search with the next rows."""
+
+    def __init__(self, *results, pgvector="0.8.0"):
+        self.results = list(results)
+        self.pgvector = pgvector
+        self.statements = []
+
+    async def execute(self, stmt):
+        compiled = stmt.compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        )
+        self.statements.append(str(compiled))
+        if "pg_extension" in str(compiled):
+            return SimpleNamespace(scalar_one_or_none=lambda: self.pgvector)
+        if "set_config" in str(compiled):
+            return None
+        return self.results.pop(0)
+
+
+@pytest.fixture(autouse=True)
+def reset_pgvector_version(monkeypatch):
+    monkeypatch.setattr(retrieval, "_iterative_scan", None)
+
+
+@pytest.mark.asyncio
+async def test_search_is_one_course_scoped_indexed_query():
+    row = SimpleNamespace(
+        id=1,
+        content="Midterm covers chapters 1-4",
+        meta_data={"name": "syllabus.pdf"},
+        course_id=7,
+        distance=0.25,
+    )
+    session = FakeSession([row] * 3)
+
+    documents = await search_material_documents(
+        session, [0.1] * 1536, str(uuid.uuid4()), k=3, course_id=7
+    )
+
+    _, set_params, search = session.statements
+    assert "hnsw.ef_search" in set_params and "ivfflat.probes" in set_params
+    assert "'hnsw.iterative_scan', 'relaxed_order'" in set_params
+    assert "<=>" in search and "course_membership" in search
+    assert "nearest AS MATERIALIZED" in search
+    assert "material_documents.course_id = 7" in search
+    assert documents[0].score == 0.75
+    assert (
+        format_documents(documents[:1]) == "[syllabus.pdf]\nMidterm covers chapters 1-4"
+    )
+
+
+@pytest.mark.asyncio
+async def test_hybrid_search_fuses_vector_and_text_ranks_in_one_query():
+    row = SimpleNamespace(
+        id=2,
+        content="Problem Set 4 is due Friday",
+        meta_data={"name": "ps4.pdf"},
+        course_id=7,
+        score=1 / 61 + 1 / 62,
+        vector_hits=40,
+    )
+    session = FakeSession([row])
+
+    documents = await hybrid_search(
+        session, "Problem Set 4", [0.1] * 1536, str(uuid.uuid4()), k=3, course_id=7
+    )
+
+    _, _, fused = session.statements
+    assert "<=>" in fused and "@@ websearch_to_tsquery" in fused
+    assert "FULL OUTER JOIN by_text" in fused
+    assert "(60 + by_vector.rank)" in fused and "(60 + by_text.rank)" in fused
+    assert fused.count("material_documents.course_id = 7") == 2
+    assert documents[0].score == pytest.approx(1 / 61 + 1 / 62)
+
+
+@pytest.mark.asyncio
+async def test_selective_filter_falls_back_to_exact_search_without_iterative_scan():
+    # before pgvector 0.8 the index returns its ef_search nearest rows across
+    # all courses and the course filter leaves few of them
+    row = SimpleNamespace(
+        id=1,
+        content="",
+        meta_data={},
+        course_id=7,
+        distance=0.5,
+        score=1 / 61,
+        vector_hits=1,
+    )
+    session = FakeSession([row], [row] * 3, pgvector="0.7.4")
+
+    documents = await search_material_documents(
+        session, [0.1] * 1536, str(uuid.uuid4()), k=3, course_id=7
+    )
+
+    _, indexed, _, exact, _ = session.statements
+    assert "iterative_scan" not in indexed
+    assert "'enable_indexscan', 'on'" in indexed
+    assert "'enable_indexscan', 'off'" in exact
+    assert len(documents) == 3
+
+    session = FakeSession([row], [row], pgvector="0.7.4")
+    await hybrid_search(
+        session, "limits", [0.1] * 1536, str(uuid.uuid4()), k=3, course_id=7
+    )
+    _, _, exact, _ = session.statements
+    assert "'enable_indexscan', 'off'" in exact
+
+
+def chunk(id, index, content, score, **metadata):
+    return RetrievedDocument(
+        id=id,
+        content=content,
+        metadata={"name": "lecture3.pdf", "course_material_id": 5, "index": index}
+        | metadata,
+        course_id=7,
+        score=score,
+    )
+
+
+def test_compact_merges_adjacent_chunks_and_drops_near_duplicates():
+    documents = [
+        chunk(2, 4, "The chain rule composes. Apply it twice.", 0.9, page_end=5),
+        chunk(1, 3, "Derivatives recap. The chain rule composes.", 0.8, page_start=4),
+        # the same slide in another upload of the deck
+        chunk(
+            9, 0, "the chain rule composes, apply it twice", 0.7, course_material_id=8
+        ),
+        chunk(3, 8, "Integration by parts.", 0.6),
+    ]
+
+    compacted = compact_documents(documents)
+
+    assert [document.id for document in compacted] == [1, 3]
+    merged = compacted[0]
+    assert merged.content == (
+        "Derivatives recap. The chain rule composes. Apply it twice."
+    )
+    assert merged.score == 0.9
+    assert format_documents([merged]).startswith("[lecture3.pdf, pp. 4-5]\n")
@@ -0,0 +1,84 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from zoneinfo import ZoneInfo
+
+from src.application import usecase_v2
+from src.application.scheduling import busy_mask, find_free_slots
+from src.deps import GoogleApiError
+
+UTC = ZoneInfo("UTC")
+# a friday, 06:00 utc
+START = datetime(2024, 11, 1, 6, tzinfo=timezone.utc)
+
+
+def test_busy_mask_merges_overlapping_intervals():
+    busy = [
+        (START + timedelta(minutes=10), START + timedelta(minutes=30)),
+        (START + timedelta(minutes=20), START + timedelta(minutes=40)),
+    ]
+    mask = busy_mask(START, 60, busy)
+    assert mask[10:40].all()
+    assert not mask[:10].any() and not mask[40:].any()
+
+
+def test_find_free_slots_skips_busy_time_and_prefers_study_window():
+    # busy all morning from 07:00 to 12:00
+    busy = [(START + timedelta(hours=1), START + timedelta(hours=6))]
+    slots = find_free_slots(
+        busy, START, days=1, duration_minutes=60, tz=UTC, study_type="night", limit=3
+    )
+    assert [slot.start.hour for slot in slots] == [18, 19, 20]
+    assert all(slot.preferred for slot in slots)
+
+    slots = find_free_slots(
+        busy, START, days=1, duration_minutes=60, tz=UTC, study_type="morning"
+    )
+    assert slots[0].start == START + timedelta(hours=6)
+    assert all(
+        slot.end <= busy[0][0] or slot.start >= busy[0][1] for slot in slots
+    )
+
+
+def test_find_free_slots_respects_due_date():
+    due_at = START + timedelta(hours=3)
+    slots = find_free_slots(
+        [], START, days=7, duration_minutes=90, tz=UTC, due_at=due_at, limit=10
+    )
+    assert slots
+    assert all(slot.end <= due_at for slot in slots)
+
+
+class FakeSession:
+    """Answers the tasks query, then the preference query."""
+
+    def __init__(self, tasks):
+        self.results = [tasks, SimpleNamespace(scalar_one_or_none=lambda: None)]
+        self.rolled_back = False
+
+    async def execute(self, stmt):
+        return self.results.pop(0)
+
+    async def rollback(self):
+        self.rolled_back = True
+
+
+@pytest.mark.asyncio
+async def test_free_slots_plan_around_tasks_when_google_rejects_the_token(
+    monkeypatch,
+):
+    async def revoked(*args, **kwargs):
+        raise GoogleApiError(401, "Invalid Credentials")
+
+    monkeypatch.setattr(usecase_v2.calendar_mirror, "refresh_if_stale", revoked)
+    now = datetime.now(timezone.utc)
+    task = SimpleNamespace(start_at=now, end_at=now + timedelta(days=1))
+    session = FakeSession([task])
+
+    slots = await usecase_v2.find_free_slots(session, str(uuid.uuid4()), days=2)
+
+    assert session.rolled_back
+    assert slots
+    assert all(datetime.fromisoformat(slot["start"]) >= task.end_at for slot in slots)
@@ -0,0 +1,111 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from src.application.token_store import (
+    IntegrationToken,
+    TokenNotFoundError,
+    TokenStore,
+)
+
+
+class FakeSession:
+    def __init__(self, integration):
+        self.integration = integration
+        self.queries = 0
+
+    async def execute(self, query):
+        self.queries += 1
+        return SimpleNamespace(scalar_one_or_none=lambda: self.integration)
+
+
+@pytest.mark.asyncio
+async def test_token_store_caches_until_invalidated():
+    user_id = str(uuid.uuid4())
+    session = FakeSession(
+        SimpleNamespace(token="canvas-token", refresh_token=None, expire_at=None)
+    )
+    store = TokenStore(session_factory=None, max_size=10, ttl=60)
+
+    assert (await store.get(session, user_id, "canvas")).token == "canvas-token"
+    assert (await store.get(session, user_id, "canvas")).token == "canvas-token"
+    assert session.queries == 1
+
+    # what the integration_changed listener does when another worker updates the row
+    store._on_notify(None, 0, "integration_changed", f"{user_id}:canvas")
+    await store.get(session, user_id, "canvas")
+    assert session.queries == 2
+
+
+@pytest.mark.asyncio
+async def test_token_store_does_not_cache_past_expiry():
+    user_id = str(uuid.uuid4())
+    expired = datetime.now(timezone.utc) - timedelta(minutes=1)
+    session = FakeSession(
+        SimpleNamespace(token="google-token", refresh_token=None, expire_at=expired)
+    )
+    store = TokenStore(session_factory=None, max_size=10, ttl=60)
+
+    await store.get(session, user_id, "google")
+    assert (user_id, "google") not in store.tokens
+
+    with pytest.raises(TokenNotFoundError):
+        await store.get(FakeSession(None), user_id, "canvas")
+
+
+class FakeCredentials:
+    refreshes = 0
+
+    def __init__(self):
+        self.token = None
+        self.refresh_token = None
+        self.expiry = None
+
+    def refresh(self, request):
+        FakeCredentials.refreshes += 1
+        time.sleep(0.05)
+        self.token = "refreshed-token"
+        self.expiry = datetime.utcnow() + timedelta(hours=1)
+
+
+class FakeSessionFactory:
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, statement):
+        return None
+
+    async def commit(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_concurrent_refreshes_share_one_and_release_the_lock(monkeypatch):
+    monkeypatch.setattr(
+        "src.application.token_store.google_credentials",
+        lambda token: FakeCredentials(),
+    )
+    user_id = str(uuid.uuid4())
+    expiring = IntegrationToken(
+        "google-token", "refresh-token", datetime.now(timezone.utc)
+    )
+    store = TokenStore(session_factory=FakeSessionFactory(), max_size=10, ttl=60)
+
+    tokens = await asyncio.gather(
+        *(store.refresh_google(user_id, expiring) for _ in range(3))
+    )
+
+    # the first caller refreshed; the others found the fresh token and returned
+    assert FakeCredentials.refreshes == 1
+    assert {token.token for token in tokens} == {"refreshed-token"}
+    assert store.refresh_locks == {} and store.refresh_waiters == {}